@@ -1,9 +1,14 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from django.db.models import Case, When
 from django.utils.html import format_html
-from .models import Cliente, Protocolo, Atualizacao, TipoProblema
+from .arquivo import restaurar
+from .models import Cliente, Protocolo, ProtocoloArquivado, Atualizacao, Tarefa, TipoProblema
+from .tarefas import repetir
+from .transicoes import alterar_status
 
 # Customização do Admin de Usuários
 class CustomUserAdmin(BaseUserAdmin):
@@ -37,6 +42,7 @@ admin.site.register(User, CustomUserAdmin)
 class TipoProblemaAdmin(admin.ModelAdmin):
     list_display = ('nome', 'ativo', 'data_criacao', 'criado_por')
     list_filter = ('ativo', 'data_criacao')
+    list_select_related = ('criado_por',)
     search_fields = ('nome', 'descricao')
     readonly_fields = ('data_criacao', 'criado_por')
     
@@ -81,32 +87,42 @@ class AtualizacaoInline(admin.TabularInline):
         super().save_model(request, obj, form, change)
 
 
+class TransicaoActionForm(ActionForm):
+    # Texto opcional das ações de status: vira uma atualização em cada protocolo
+    descricao = forms.CharField(
+        required=False, label='Atualização',
+        widget=forms.TextInput(attrs={'placeholder': 'Texto da atualização (opcional)', 'size': 40}),
+    )
+
+
 # Customização do Admin de Protocolos
 @admin.register(Protocolo)
 class ProtocoloAdmin(admin.ModelAdmin):
+    action_form = TransicaoActionForm
+    actions = ['marcar_em_andamento', 'finalizar', 'reabrir']
+
     def cliente_principal(self, obj):
-        """Método que pega o nome do primeiro cliente atrelado ao protocolo."""
-        cliente = obj.clientes.first()
-        if cliente:
-            return cliente.nome
+        """Nome do primeiro cliente atrelado ao protocolo (campo derivado)."""
+        if obj.cliente_principal_nome:
+            return obj.cliente_principal_nome
         return "N/A" # "N/A" significa Não Aplicável
 
     cliente_principal.short_description = "Cliente Principal"
 
     def numero_com_tooltip(self, obj):
         """Exibe o número do protocolo com a última atualização em um tooltip."""
-        ultima_atualizacao = obj.atualizacoes.order_by('-data_hora').first()
-        if ultima_atualizacao:
-            tooltip_text = ultima_atualizacao.descricao
+        if obj.ultima_atualizacao_resumo:
+            tooltip_text = obj.ultima_atualizacao_resumo
         else:
             tooltip_text = "Nenhuma atualização ainda."
         return format_html('<span title="{}">#{}</span>', tooltip_text, obj.numero)
     numero_com_tooltip.short_description = "Número"
 
     list_display = (
-        'numero_com_tooltip', 'status', 'buic_dispositivo', 'cliente_principal', 'tipo_problema', 'usuario_criador', 'data_criacao', 'data_finalizacao'
+        'numero_com_tooltip', 'status', 'buic_dispositivo', 'cliente_principal', 'tipo_problema', 'total_atualizacoes', 'usuario_criador', 'data_criacao', 'data_finalizacao'
     )
     list_filter = ('status', 'tipo_problema', 'data_criacao', 'usuario_criador')
+    list_select_related = ('tipo_problema', 'usuario_criador')
     search_fields = ('numero__iexact', 'clientes__nome__icontains', 'descricao_problema__icontains', 'tipo_problema__nome__icontains')
     inlines = [AtualizacaoInline]
     
@@ -151,6 +167,8 @@ class ProtocoloAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
+        # Primeiro cliente e última atualização são campos derivados do
+        # próprio protocolo (protocolos.derivados), sem consulta por linha
         return qs.order_by(
             Case(
                 When(status='aberto', then=0),
@@ -173,6 +191,78 @@ class ProtocoloAdmin(admin.ModelAdmin):
             instance.save()
         formset.save_m2m()
 
+    # Ações em lote: poucos UPDATEs por lote, com as mesmas regras do save
+    def _alterar_status(self, request, queryset, status):
+        resultado = alterar_status(
+            queryset, status, descricao=request.POST.get('descricao', ''), usuario=request.user
+        )
+        rotulo = dict(Protocolo.STATUS_CHOICES)[resultado.status]
+        mensagem = f'{resultado.alterados} de {resultado.selecionados} protocolo(s) alterado(s) para "{rotulo}".'
+        if resultado.atualizacoes:
+            mensagem += f" {resultado.atualizacoes} atualização(ões) criada(s)."
+        self.message_user(request, mensagem, messages.SUCCESS)
+
+    @admin.action(permissions=['change'], description='Marcar selecionados como em andamento')
+    def marcar_em_andamento(self, request, queryset):
+        self._alterar_status(request, queryset, 'em_andamento')
+
+    @admin.action(permissions=['change'], description='Finalizar selecionados')
+    def finalizar(self, request, queryset):
+        self._alterar_status(request, queryset, 'finalizado')
+
+    @admin.action(permissions=['change'], description='Reabrir selecionados')
+    def reabrir(self, request, queryset):
+        self._alterar_status(request, queryset, 'aberto')
+
+
+# Arquivo: somente consulta; a única alteração é devolver às tabelas de uso
+@admin.register(ProtocoloArquivado)
+class ProtocoloArquivadoAdmin(admin.ModelAdmin):
+    actions = ['restaurar']
+    list_display = ('numero', 'buic_dispositivo', 'cliente_principal_nome', 'tipo_problema', 'data_criacao', 'data_finalizacao', 'arquivado_em')
+    list_filter = ('tipo_problema', 'data_finalizacao')
+    list_select_related = ('tipo_problema',)
+    search_fields = ('numero__iexact', 'documento__icontains')
+    exclude = ('documento',)
+    ordering = ('-data_criacao', '-id')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def has_restaurar_permission(self, request):
+        return request.user.has_perm('protocolos.change_protocolo')
+
+    @admin.action(permissions=['restaurar'], description='Restaurar selecionados')
+    def restaurar(self, request, queryset):
+        total = restaurar(queryset)
+        self.message_user(request, f'{total} protocolo(s) restaurado(s).', messages.SUCCESS)
+
+# Fila de tarefas em segundo plano: somente consulta, com repetição das que falharam
+@admin.register(Tarefa)
+class TarefaAdmin(admin.ModelAdmin):
+    actions = ['repetir']
+    list_display = ('id', 'tipo', 'status', 'usuario', 'tentativas', 'criada_em', 'concluida_em', 'trabalhador')
+    list_filter = ('status', 'tipo')
+    list_select_related = ('usuario',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description='Repetir tarefas que falharam')
+    def repetir(self, request, queryset):
+        total = repetir(queryset)
+        self.message_user(request, f'{total} tarefa(s) devolvida(s) à fila.', messages.SUCCESS)
+
+
 # Customização do Admin de Clientes
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
@@ -0,0 +1,123 @@
+"""
+Feed incremental de alterações de protocolos.
+
+Cada alteração de um protocolo (save, inclusão ou edição de atualizações,
+mudança de clientes) grava em ``versao_alteracao`` um valor da sequência
+``alteracoes`` e em ``atualizado_em`` a hora. Exclusões deixam um registro em
+``ProtocoloRemovido`` com a mesma numeração; o arquivamento também, marcado
+com ``arquivado`` (o protocolo continua no arquivo), e a restauração apaga o
+registro e marca o protocolo como alterado.
+
+A versão é reservada com o ``UPDATE`` da linha do contador (``numeracao``), que
+fica bloqueada até o fim da transação: transações que alteram protocolos
+confirmam na ordem das versões, e quem lê ``versao_alteracao > X`` nunca vê
+depois surgir uma versão menor. Uma transação reserva uma única versão, usada
+por todos os protocolos que ela alterar.
+
+O token ``since`` é um cursor opaco com o par (versão, id) do último item
+entregue; o feed lê protocolos e remoções nessa ordem.
+"""
+import heapq
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Protocolo, ProtocoloRemovido
+from .numeracao import proximos_valores
+from .paginacao import codificar_cursor, paginar_por_chave
+
+SEQUENCIA_ALTERACOES = 'alteracoes'
+ORDENACAO = ['versao_alteracao', 'id']
+
+
+class VersaoTransacao:
+    """Callback de ``on_commit`` que guarda a versão reservada pela transação"""
+
+    def __init__(self, valor):
+        self.valor = valor
+        self.executado = False
+
+    def __call__(self):
+        self.executado = True
+
+
+def versao_da_transacao():
+    """Versão de alteração da transação atual, reservada na primeira chamada"""
+    for _, funcao, _ in transaction.get_connection().run_on_commit:
+        if isinstance(funcao, VersaoTransacao) and not funcao.executado:
+            return funcao.valor
+    valor = proximos_valores(SEQUENCIA_ALTERACOES)[0]
+    transaction.on_commit(VersaoTransacao(valor))
+    return valor
+
+
+def registrar_alteracoes(protocolo_ids):
+    """Marca os protocolos como alterados na transação atual"""
+    ids = list(protocolo_ids)
+    if not ids:
+        return
+    with transaction.atomic(savepoint=False):
+        Protocolo.objects.filter(pk__in=ids).update(
+            versao_alteracao=versao_da_transacao(), atualizado_em=timezone.now()
+        )
+
+
+def registrar_remocao(protocolo):
+    with transaction.atomic(savepoint=False):
+        ProtocoloRemovido.objects.update_or_create(
+            id=protocolo.pk,
+            defaults={
+                'numero': protocolo.numero,
+                'versao_alteracao': versao_da_transacao(),
+                'removido_em': timezone.now(),
+                'arquivado': False,
+            },
+        )
+
+
+def registrar_arquivamento(protocolos):
+    """Registra como removidos do feed os protocolos (``id`` e ``numero``) levados ao arquivo"""
+    protocolos = list(protocolos)
+    if not protocolos:
+        return
+    with transaction.atomic(savepoint=False):
+        versao = versao_da_transacao()
+        agora = timezone.now()
+        ids = [protocolo['id'] for protocolo in protocolos]
+        ProtocoloRemovido.objects.filter(pk__in=ids).delete()
+        ProtocoloRemovido.objects.bulk_create([
+            ProtocoloRemovido(
+                id=protocolo['id'], numero=protocolo['numero'], versao_alteracao=versao, removido_em=agora,
+                arquivado=True,
+            )
+            for protocolo in protocolos
+        ])
+
+
+def alteracoes_desde(since=None, limite=1000, colunas=('id',)):
+    """
+    Até ``limite`` alterações após o token ``since``, em ordem de versão.
+
+    Retorna ``(itens, token, mais)``; cada item é ``(removido, linha)``, com
+    ``colunas`` lidas do protocolo ou os dados do registro de remoção. ``token``
+    é o ``since`` da próxima leitura (o mesmo, se nada mudou).
+    """
+    colunas = set(colunas) | set(ORDENACAO)
+    protocolos, mais_protocolos = paginar_por_chave(
+        Protocolo.objects.values(*colunas), ORDENACAO, cursor=since, tamanho=limite
+    )
+    removidos, mais_removidos = paginar_por_chave(
+        ProtocoloRemovido.objects.values('id', 'numero', 'versao_alteracao', 'removido_em', 'arquivado'),
+        ORDENACAO, cursor=since, tamanho=limite,
+    )
+    ordem = lambda item: (item[1]['versao_alteracao'], item[1]['id'])  # noqa: E731
+    itens = list(heapq.merge(
+        ((False, linha) for linha in protocolos), ((True, linha) for linha in removidos), key=ordem
+    ))
+    mais = len(itens) > limite or bool(mais_protocolos or mais_removidos)
+    itens = itens[:limite]
+    if itens:
+        token = codificar_cursor(ordem(itens[-1]))
+    else:
+        token = since or codificar_cursor([0, 0])
+    return itens, token, mais
@@ -0,0 +1,378 @@
+"""
+API JSON somente leitura sobre protocolos, clientes, atualizações e tipos de problema.
+
+Cada recurso é uma lista paginada por cursor (``?cursor=``, ``?limite=``) que
+aceita:
+
+* ``fields=a,b``: só os campos pedidos (lidos com ``values()``, sem instanciar
+  models);
+* ``include=x,y``: dados relacionados embutidos em cada item. Cada relação
+  incluída custa uma consulta por página, qualquer que seja o tamanho dela.
+
+Os protocolos aceitam os mesmos filtros de ``filtrar_protocolos``
+(``tipo_problema``, ``status``, ``data_inicio``, ``data_fim``).
+
+Protocolos e atualizações aceitam ``incluir_arquivo=1``: a página junta as
+linhas de uso diário e as do arquivo (``arquivo``), na mesma ordem e com o
+mesmo cursor, e cada item traz ``arquivado``.
+
+Sem sessão autenticada, as respostas são 401 com ``{"error": ...}`` (não o
+redirecionamento para a página de login).
+
+``/api/protocolos/alteracoes/?since=<token>`` é o feed incremental
+(``alteracoes``): protocolos alterados e removidos depois do token, em ordem.
+Um protocolo arquivado sai do feed como removido, com ``arquivado: true``
+(continua legível com ``incluir_arquivo=1``); se for restaurado, volta como
+alteração.
+"""
+import heapq
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import partial, wraps
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .alteracoes import alteracoes_desde
+from .filtros import aplicar_filtros, ler_filtros, _inteiro_ou_none
+from .models import Atualizacao, AtualizacaoArquivada, Cliente, Protocolo, ProtocoloArquivado, TipoProblema
+from .paginacao import CursorInvalido, codificar_cursor, paginar_por_chave
+
+# Itens por página quando ``limite`` não é informado, e o máximo aceito
+API_POR_PAGINA = 100
+API_LIMITE_MAXIMO = 1000
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+@dataclass
+class Recurso:
+    model: type
+    # Nome na API -> coluna lida com values()
+    campos: dict
+    ordenacao: list
+    # Relação -> (coluna com o id usado na busca em lote, função de carga, se é uma lista)
+    incluiveis: dict = field(default_factory=dict)
+    filtrar: object = None
+    # Campos de data e hora, convertidos para ISO 8601 antes da serialização
+    datas: tuple = ()
+    # Recurso equivalente no arquivo (mesmos campos e ordenação), para ``incluir_arquivo``
+    arquivo: object = None
+
+
+def _iso(valor):
+    # isoformat() direto é bem mais barato que o default() do DjangoJSONEncoder
+    return valor.isoformat() if valor is not None else None
+
+
+def _converter_datas(itens, nomes):
+    for item in itens:
+        for nome in nomes:
+            item[nome] = _iso(item[nome])
+
+
+def _sim_ou_nao(valor):
+    if valor in ('1', 'true', 'sim'):
+        return True
+    if valor in ('0', 'false', 'nao', 'não'):
+        return False
+    return None
+
+
+def _filtrar_protocolos(queryset, params):
+    return aplicar_filtros(queryset, ler_filtros(params))
+
+
+def _filtrar_atualizacoes(queryset, params):
+    protocolo = _inteiro_ou_none(params.get('protocolo'))
+    if protocolo is not None:
+        queryset = queryset.filter(protocolo_id=protocolo)
+    return queryset
+
+
+def _filtrar_ativos(queryset, params):
+    ativo = _sim_ou_nao(params.get('ativo'))
+    if ativo is not None:
+        queryset = queryset.filter(ativo=ativo)
+    return queryset
+
+
+# Cargas em lote: recebem os ids da página e devolvem {id: valor embutido}
+
+def _clientes_dos_protocolos(ids, model=Protocolo):
+    vinculo = model.clientes.through
+    coluna = model.clientes.field.m2m_column_name()
+    vinculos = vinculo.objects.filter(**{f'{coluna}__in': ids}).order_by('id').values_list(
+        coluna, 'cliente_id', 'cliente__nome', 'cliente__email'
+    )
+    clientes = defaultdict(list)
+    for protocolo_id, cliente_id, nome, email in vinculos:
+        clientes[protocolo_id].append({'id': cliente_id, 'nome': nome, 'email': email})
+    return clientes
+
+
+def _atualizacoes_dos_protocolos(ids, model=Atualizacao):
+    linhas = model.objects.filter(protocolo_id__in=ids).order_by('data_hora', 'id').values_list(
+        'protocolo_id', 'id', 'descricao', 'usuario__username', 'data_hora'
+    )
+    atualizacoes = defaultdict(list)
+    for protocolo_id, pk, descricao, usuario, data_hora in linhas:
+        atualizacoes[protocolo_id].append(
+            {'id': pk, 'descricao': descricao, 'usuario': usuario, 'data_hora': _iso(data_hora)}
+        )
+    return atualizacoes
+
+
+def _tipos_problema(ids):
+    return {
+        tipo['id']: tipo
+        for tipo in TipoProblema.objects.filter(pk__in=ids).values('id', 'nome', 'ativo')
+    }
+
+
+def _protocolos(ids, model=Protocolo):
+    return {
+        protocolo['id']: protocolo
+        for protocolo in model.objects.filter(pk__in=ids).values('id', 'numero', 'status')
+    }
+
+
+CAMPOS_PROTOCOLO = {
+    'id': 'id',
+    'numero': 'numero',
+    'status': 'status',
+    'tipo_problema': 'tipo_problema_id',
+    'buic_dispositivo': 'buic_dispositivo',
+    'descricao_problema': 'descricao_problema',
+    'usuario_criador': 'usuario_criador__username',
+    'data_criacao': 'data_criacao',
+    'data_finalizacao': 'data_finalizacao',
+    'total_atualizacoes': 'total_atualizacoes',
+    'ultima_atualizacao_em': 'ultima_atualizacao_em',
+    'ultima_atualizacao_resumo': 'ultima_atualizacao_resumo',
+    'cliente_principal_nome': 'cliente_principal_nome',
+    'versao_alteracao': 'versao_alteracao',
+    'atualizado_em': 'atualizado_em',
+}
+DATAS_PROTOCOLO = ('data_criacao', 'data_finalizacao', 'ultima_atualizacao_em', 'atualizado_em')
+CAMPOS_ATUALIZACAO = {
+    'id': 'id',
+    'protocolo': 'protocolo_id',
+    'descricao': 'descricao',
+    'usuario': 'usuario__username',
+    'data_hora': 'data_hora',
+}
+
+RECURSOS = {
+    'protocolos': Recurso(
+        model=Protocolo,
+        campos=CAMPOS_PROTOCOLO,
+        # A mesma ordem (e índices) da listagem filtrada
+        ordenacao=['-data_criacao', '-id'],
+        incluiveis={
+            'clientes': ('id', _clientes_dos_protocolos, True),
+            'atualizacoes': ('id', _atualizacoes_dos_protocolos, True),
+            'tipo_problema': ('tipo_problema_id', _tipos_problema, False),
+        },
+        filtrar=_filtrar_protocolos,
+        datas=DATAS_PROTOCOLO,
+        arquivo=Recurso(
+            model=ProtocoloArquivado,
+            campos=CAMPOS_PROTOCOLO,
+            ordenacao=['-data_criacao', '-id'],
+            incluiveis={
+                'clientes': ('id', partial(_clientes_dos_protocolos, model=ProtocoloArquivado), True),
+                'atualizacoes': ('id', partial(_atualizacoes_dos_protocolos, model=AtualizacaoArquivada), True),
+                'tipo_problema': ('tipo_problema_id', _tipos_problema, False),
+            },
+            filtrar=_filtrar_protocolos,
+            datas=DATAS_PROTOCOLO,
+        ),
+    ),
+    'clientes': Recurso(
+        model=Cliente,
+        # A senha nunca sai pela API
+        campos={'id': 'id', 'nome': 'nome', 'email': 'email', 'data_cadastro': 'data_cadastro', 'ativo': 'ativo'},
+        ordenacao=['id'],
+        filtrar=_filtrar_ativos,
+        datas=('data_cadastro',),
+    ),
+    'atualizacoes': Recurso(
+        model=Atualizacao,
+        campos=CAMPOS_ATUALIZACAO,
+        ordenacao=['id'],
+        incluiveis={'protocolo': ('protocolo_id', _protocolos, False)},
+        filtrar=_filtrar_atualizacoes,
+        datas=('data_hora',),
+        arquivo=Recurso(
+            model=AtualizacaoArquivada,
+            campos=CAMPOS_ATUALIZACAO,
+            ordenacao=['id'],
+            incluiveis={'protocolo': ('protocolo_id', partial(_protocolos, model=ProtocoloArquivado), False)},
+            filtrar=_filtrar_atualizacoes,
+            datas=('data_hora',),
+        ),
+    ),
+    'tipos_problema': Recurso(
+        model=TipoProblema,
+        campos={'id': 'id', 'nome': 'nome', 'ativo': 'ativo'},
+        ordenacao=['id'],
+        filtrar=_filtrar_ativos,
+    ),
+}
+
+
+def _lista(params, nome, permitidos, padrao):
+    valor = params.get(nome)
+    if not valor:
+        return padrao
+    itens = [item.strip() for item in valor.split(',') if item.strip()]
+    desconhecidos = [item for item in itens if item not in permitidos]
+    if desconhecidos:
+        raise ParametroInvalido(
+            f"{nome} inválido: {', '.join(desconhecidos)} (aceitos: {', '.join(permitidos)})"
+        )
+    return list(dict.fromkeys(itens))
+
+
+def _limite(params):
+    valor = params.get('limite')
+    if not valor:
+        return API_POR_PAGINA
+    limite = _inteiro_ou_none(valor)
+    if limite is None or limite < 1:
+        raise ParametroInvalido('limite inválido')
+    return min(limite, API_LIMITE_MAXIMO)
+
+
+def _pagina(definicao, colunas, params, limite):
+    queryset = definicao.model.objects.all()
+    if definicao.filtrar:
+        queryset = definicao.filtrar(queryset, params)
+    return paginar_por_chave(
+        queryset.values(*colunas), definicao.ordenacao, cursor=params.get('cursor'), tamanho=limite
+    )
+
+
+def _incluir(definicao, incluidos, linhas, itens):
+    for nome in incluidos:
+        coluna, carregar, lista = definicao.incluiveis[nome]
+        chaves = [linha[coluna] for linha in linhas]
+        carregados = carregar({chave for chave in chaves if chave is not None}) if chaves else {}
+        for item, chave in zip(itens, chaves):
+            item[nome] = carregados.get(chave, [] if lista else None)
+
+
+def _mesclar(ordenacao, limite, *paginas):
+    """
+    Junta páginas lidas com o mesmo cursor em fontes diferentes.
+
+    Cada página é ``(fonte, linhas, proximo_cursor)``; retorna ``[(fonte, linha)]``
+    na ordem de ``ordenacao`` (todos os campos no mesmo sentido) e o cursor
+    comum da próxima página.
+    """
+    nomes = [campo.lstrip('-') for campo in ordenacao]
+    chave = lambda item: tuple(item[1][nome] for nome in nomes)  # noqa: E731
+    mescladas = list(heapq.merge(
+        *([(fonte, linha) for linha in linhas] for fonte, linhas, _ in paginas),
+        key=chave, reverse=ordenacao[0].startswith('-'),
+    ))
+    mais = len(mescladas) > limite or any(cursor for _, _, cursor in paginas)
+    mescladas = mescladas[:limite]
+    return mescladas, codificar_cursor(chave(mescladas[-1])) if mais and mescladas else None
+
+
+def listar(recurso, params):
+    """Página de ``recurso`` para os parâmetros da requisição: ``(itens, proximo_cursor)``"""
+    definicao = RECURSOS[recurso]
+    campos = _lista(params, 'fields', list(definicao.campos), list(definicao.campos))
+    incluidos = _lista(params, 'include', list(definicao.incluiveis), [])
+    limite = _limite(params)
+    arquivo = definicao.arquivo if _sim_ou_nao(params.get('incluir_arquivo')) else None
+
+    # Colunas de saída, mais as que a paginação e as inclusões precisam
+    saida = [(nome, definicao.campos[nome]) for nome in campos]
+    colunas = {coluna for _, coluna in saida}
+    colunas.update(campo.lstrip('-') for campo in definicao.ordenacao)
+    colunas.update(definicao.incluiveis[nome][0] for nome in incluidos)
+
+    linhas, proximo_cursor = _pagina(definicao, colunas, params, limite)
+    if arquivo:
+        mescladas, proximo_cursor = _mesclar(
+            definicao.ordenacao, limite,
+            (definicao, linhas, proximo_cursor), (arquivo, *_pagina(arquivo, colunas, params, limite)),
+        )
+    else:
+        mescladas = [(definicao, linha) for linha in linhas]
+
+    itens = [{nome: linha[coluna] for nome, coluna in saida} for _, linha in mescladas]
+    _converter_datas(itens, [nome for nome in campos if nome in definicao.datas])
+
+    # Inclusões carregadas por fonte: uma consulta por relação em cada tabela lida
+    for fonte in ([definicao, arquivo] if arquivo else [definicao]):
+        pares = [(item, linha) for item, (origem, linha) in zip(itens, mescladas) if origem is fonte]
+        _incluir(fonte, incluidos, [linha for _, linha in pares], [item for item, _ in pares])
+        if arquivo:
+            for item, _ in pares:
+                item['arquivado'] = fonte is arquivo
+    return itens, proximo_cursor
+
+
+def listar_alteracoes(params):
+    """Página do feed de alterações: ``(itens, since, mais)``"""
+    protocolos = RECURSOS['protocolos']
+    campos = _lista(params, 'fields', list(protocolos.campos), list(protocolos.campos))
+    limite = _limite(params)
+    saida = [(nome, protocolos.campos[nome]) for nome in campos]
+    datas = [nome for nome in campos if nome in protocolos.datas]
+
+    linhas, since, mais = alteracoes_desde(
+        params.get('since'), limite, colunas=[coluna for _, coluna in saida]
+    )
+    itens = []
+    for removido, linha in linhas:
+        if removido:
+            item = {
+                'id': linha['id'], 'numero': linha['numero'], 'removido_em': _iso(linha['removido_em']),
+                'arquivado': linha['arquivado'],
+            }
+        else:
+            item = {nome: linha[coluna] for nome, coluna in saida}
+            item['id'] = linha['id']
+            _converter_datas([item], datas)
+        item['versao_alteracao'] = linha['versao_alteracao']
+        item['removido'] = removido
+        itens.append(item)
+    return itens, since, mais
+
+
+def _autenticado(view):
+    """Como ``login_required``, mas responde 401 em JSON em vez de redirecionar para o login"""
+    @wraps(view)
+    def verificar(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'autenticação necessária'}, status=401)
+        return view(request, *args, **kwargs)
+    return verificar
+
+
+@_autenticado
+@require_GET
+def api_alteracoes(request):
+    try:
+        itens, since, mais = listar_alteracoes(request.GET)
+    except (CursorInvalido, ParametroInvalido) as erro:
+        return JsonResponse({'error': str(erro)}, status=400)
+    return JsonResponse({'results': itens, 'since': since, 'mais': mais})
+
+
+@_autenticado
+@require_GET
+def api_lista(request, recurso):
+    try:
+        itens, proximo_cursor = listar(recurso, request.GET)
+    except (CursorInvalido, ParametroInvalido) as erro:
+        return JsonResponse({'error': str(erro)}, status=400)
+    return JsonResponse({'results': itens, 'cursor': proximo_cursor})
@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class ProtocolosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'protocolos'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .busca import criar_estruturas_busca
+        from .middleware import instalar_contador_sql
+
+        post_migrate.connect(criar_estruturas_busca, sender=self)
+        connection_created.connect(instalar_contador_sql, dispatch_uid='protocolos_contador_sql')
+
+        if getattr(settings, 'PROTOCOLOS_CONSULTAS_LENTAS_ATIVO', False):
+            from .consultas_lentas import instalar
+
+            instalar()
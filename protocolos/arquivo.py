@@ -0,0 +1,177 @@
+"""
+Arquivo de protocolos finalizados.
+
+Protocolos finalizados há mais de ``PROTOCOLOS_ARQUIVO_DIAS`` dias saem das
+tabelas de uso diário (``Protocolo``, ``Atualizacao``, vínculos com clientes e
+documento de busca) para ``ProtocoloArquivado`` e ``AtualizacaoArquivada``,
+com os mesmos ids e números. A mudança é feita em lotes, um por transação, pelo
+comando ``arquivar_protocolos``; ``restaurar_protocolos`` faz o caminho inverso.
+
+Arquivar não é excluir: as linhas saem com ``DELETE`` direto, sem carregar os
+objetos nem disparar os sinais de exclusão. O feed de alterações recebe o
+protocolo como removido, marcado como ``arquivado``; a restauração apaga esse
+registro e o devolve como alteração. As estatísticas diárias não mudam, e o
+total do dashboard soma o contador de arquivados. A busca e a API só leem o
+arquivo quando pedido.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .alteracoes import registrar_alteracoes, registrar_arquivamento
+from .busca import indexar_protocolos
+from .carga import datas_informadas
+from .estatisticas import agendar_invalidacao_estatisticas
+from .models import (
+    Atualizacao, AtualizacaoArquivada, DocumentoBusca, Protocolo, ProtocoloArquivado, ProtocoloRemovido, Sequencia,
+)
+from .numeracao import criar_sequencia, valor_atual
+from .versao import agendar_avanco_versao
+
+SEQUENCIA_ARQUIVADOS = 'protocolos_arquivados'
+LOTE_ARQUIVO = 500
+
+# Colunas copiadas entre as tabelas (ProtocoloArquivado tem todas as de Protocolo)
+CAMPOS_PROTOCOLO = [campo.attname for campo in Protocolo._meta.concrete_fields]
+CAMPOS_ATUALIZACAO = [campo.attname for campo in Atualizacao._meta.concrete_fields]
+
+Vinculo = Protocolo.clientes.through
+VinculoArquivado = ProtocoloArquivado.clientes.through
+
+
+def dias_padrao():
+    return getattr(settings, 'PROTOCOLOS_ARQUIVO_DIAS', 365)
+
+
+def total_arquivados():
+    """Quantidade de protocolos no arquivo, lida do contador"""
+    return valor_atual(SEQUENCIA_ARQUIVADOS, lambda: ProtocoloArquivado.objects.count())
+
+
+def _somar_arquivados(quantidade):
+    if not Sequencia.objects.filter(nome=SEQUENCIA_ARQUIVADOS).update(valor=F('valor') + quantidade):
+        # Primeiro uso: o arquivo já contém o lote atual
+        criar_sequencia(SEQUENCIA_ARQUIVADOS, ProtocoloArquivado.objects.count())
+
+
+def _excluir(model, coluna, ids):
+    # DELETE direto: sem carregar as linhas nem disparar sinais de exclusão
+    tabela = connection.ops.quote_name(model._meta.db_table)
+    coluna = connection.ops.quote_name(coluna)
+    marcadores = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {tabela} WHERE {coluna} IN ({marcadores})', list(ids))
+
+
+def _apos_mover():
+    agendar_invalidacao_estatisticas()
+    agendar_avanco_versao()
+
+
+def candidatos(dias=None):
+    """Protocolos finalizados há mais de ``dias`` dias"""
+    limite = timezone.now() - timedelta(days=dias_padrao() if dias is None else dias)
+    return Protocolo.objects.filter(status='finalizado', data_finalizacao__lt=limite)
+
+
+def arquivar_lote(ids):
+    """Move os protocolos ``ids`` (só os finalizados) para o arquivo; retorna quantos foram movidos"""
+    with transaction.atomic():
+        linhas = list(
+            Protocolo.objects.select_for_update().filter(pk__in=ids, status='finalizado').values(*CAMPOS_PROTOCOLO)
+        )
+        ids = [linha['id'] for linha in linhas]
+        if not ids:
+            return 0
+        agora = timezone.now()
+        documentos = dict(DocumentoBusca.objects.filter(protocolo_id__in=ids).values_list('protocolo_id', 'conteudo'))
+        ProtocoloArquivado.objects.bulk_create([
+            ProtocoloArquivado(**linha, documento=documentos.get(linha['id'], ''), arquivado_em=agora)
+            for linha in linhas
+        ])
+        VinculoArquivado.objects.bulk_create([
+            VinculoArquivado(protocoloarquivado_id=protocolo_id, cliente_id=cliente_id)
+            for protocolo_id, cliente_id in Vinculo.objects.filter(protocolo_id__in=ids).values_list(
+                'protocolo_id', 'cliente_id'
+            )
+        ])
+        AtualizacaoArquivada.objects.bulk_create(
+            [
+                AtualizacaoArquivada(**linha)
+                for linha in Atualizacao.objects.filter(protocolo_id__in=ids).values(*CAMPOS_ATUALIZACAO)
+            ],
+            batch_size=1000,
+        )
+
+        _excluir(DocumentoBusca, 'protocolo_id', ids)
+        _excluir(Vinculo, 'protocolo_id', ids)
+        _excluir(Atualizacao, 'protocolo_id', ids)
+        _excluir(Protocolo, 'id', ids)
+        registrar_arquivamento(linhas)
+        _somar_arquivados(len(ids))
+        _apos_mover()
+    return len(ids)
+
+
+def restaurar_lote(ids):
+    """Devolve os protocolos ``ids`` do arquivo às tabelas de uso; retorna quantos voltaram"""
+    with transaction.atomic():
+        linhas = list(ProtocoloArquivado.objects.select_for_update().filter(pk__in=ids).values(*CAMPOS_PROTOCOLO))
+        ids = [linha['id'] for linha in linhas]
+        if not ids:
+            return 0
+        with datas_informadas():
+            Protocolo.objects.bulk_create([Protocolo(**linha) for linha in linhas])
+            Atualizacao.objects.bulk_create(
+                [
+                    Atualizacao(**linha)
+                    for linha in AtualizacaoArquivada.objects.filter(protocolo_id__in=ids).values(*CAMPOS_ATUALIZACAO)
+                ],
+                batch_size=1000,
+            )
+        Vinculo.objects.bulk_create([
+            Vinculo(protocolo_id=protocolo_id, cliente_id=cliente_id)
+            for protocolo_id, cliente_id in VinculoArquivado.objects.filter(protocoloarquivado_id__in=ids).values_list(
+                'protocoloarquivado_id', 'cliente_id'
+            )
+        ])
+
+        _excluir(VinculoArquivado, 'protocoloarquivado_id', ids)
+        _excluir(AtualizacaoArquivada, 'protocolo_id', ids)
+        _excluir(ProtocoloArquivado, 'id', ids)
+        _excluir(ProtocoloRemovido, 'id', ids)
+        indexar_protocolos(ids)
+        # Para o feed, o protocolo restaurado é uma alteração
+        registrar_alteracoes(ids)
+        _somar_arquivados(-len(ids))
+        _apos_mover()
+    return len(ids)
+
+
+def _em_lotes(queryset, mover, lote, progresso):
+    total = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:lote])
+        if not ids:
+            return total
+        movidos = mover(ids)
+        total += movidos
+        if progresso:
+            progresso(total)
+        if not movidos:
+            # Nada mudou de tabela (ex.: status alterado em paralelo); evita laço infinito
+            return total
+
+
+def arquivar(dias=None, lote=LOTE_ARQUIVO, progresso=None):
+    """Arquiva todos os finalizados há mais de ``dias`` dias; retorna o total"""
+    return _em_lotes(candidatos(dias), arquivar_lote, lote, progresso)
+
+
+def restaurar(queryset=None, lote=LOTE_ARQUIVO, progresso=None):
+    """Restaura os protocolos arquivados do queryset (todos, se omitido); retorna o total"""
+    return _em_lotes(queryset if queryset is not None else ProtocoloArquivado.objects.all(), restaurar_lote,
+                     lote, progresso)
@@ -0,0 +1,36 @@
+"""
+Apoio às views async.
+
+O ORM async do Django executa cada consulta com ``sync_to_async`` na thread
+da requisição, uma de cada vez; um ``asyncio.gather`` sobre consultas async
+não as sobrepõe. ``em_paralelo`` executa leituras independentes em threads
+separadas, cada uma com a sua conexão, e devolve os resultados na ordem.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connection
+
+
+def _com_conexao_propria(funcao):
+    def executar():
+        try:
+            return funcao()
+        finally:
+            # Mesma regra do fim de uma requisição (respeita CONN_MAX_AGE)
+            close_old_connections()
+    return executar
+
+
+def _em_transacao():
+    return connection.in_atomic_block
+
+
+async def em_paralelo(*funcoes):
+    """Executa as funções (síncronas, só de leitura) ao mesmo tempo"""
+    if await sync_to_async(_em_transacao)():
+        # Outras conexões não enxergariam o que ainda não foi confirmado
+        return [await sync_to_async(funcao)() for funcao in funcoes]
+    return await asyncio.gather(*(
+        sync_to_async(_com_conexao_propria(funcao), thread_sensitive=False)() for funcao in funcoes
+    ))
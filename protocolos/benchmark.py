@@ -0,0 +1,250 @@
+"""
+Benchmark das views.
+
+Cada cenário faz uma requisição pelo cliente de testes do Django e mede tempo
+(mediana e p95 de várias repetições), número de consultas SQL e pico de memória
+alocada (tracemalloc, numa execução separada para não distorcer o tempo). Os
+cenários rodam sobre bases sintéticas de tamanhos crescentes, geradas com
+``gerar_dados_sinteticos``.
+
+Os orçamentos por cenário (``consultas`` e ``ms``) ficam em
+``ORCAMENTOS_PADRAO`` e podem ser sobrescritos pela configuração
+``PROTOCOLOS_BENCHMARK_ORCAMENTOS``. ``None`` significa "sem limite".
+"""
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from .middleware import ContadorSQL
+from .models import Cliente, Protocolo, TipoProblema
+
+ORCAMENTOS_PADRAO = {
+    'dashboard': {'consultas': 5, 'ms': 300},
+    'novo_protocolo_get': {'consultas': 6, 'ms': 300},
+    'novo_protocolo_post': {'consultas': 45, 'ms': 500},
+    'busca_global_texto': {'consultas': 6, 'ms': 500},
+    'busca_global_numero': {'consultas': 6, 'ms': 300},
+    'filtrar_protocolos': {'consultas': 5, 'ms': 300},
+    'filtrar_protocolos_pagina_profunda': {'consultas': 5, 'ms': 300},
+    'exportar_protocolos_csv': {'consultas': None, 'ms': None},
+    'tendencias': {'consultas': 5, 'ms': 300},
+    'sla': {'consultas': 8, 'ms': 1000},
+    'clientes_autocomplete': {'consultas': 3, 'ms': 200},
+    # 1000 protocolos por página: 100 ms equivalem a 10 mil linhas por segundo
+    'api_protocolos': {'consultas': 5, 'ms': 100},
+    'adicionar_cliente': {'consultas': 6, 'ms': 300},
+    'adicionar_tipo_problema': {'consultas': 6, 'ms': 300},
+    'admin_protocolos': {'consultas': 20, 'ms': 1000},
+    'admin_clientes': {'consultas': 10, 'ms': 500},
+    'admin_tipos_problemas': {'consultas': 10, 'ms': 500},
+}
+
+
+@dataclass
+class Cenario:
+    """Uma requisição medida; ``requisicao`` recebe o estado e devolve (método, url, dados)"""
+    nome: str
+    requisicao: object
+    status_esperado: int = 200
+
+
+@dataclass
+class Resultado:
+    cenario: str
+    tamanho: int
+    repeticoes: int
+    ms_mediana: float
+    ms_p95: float
+    consultas: int
+    pico_memoria_kb: float
+    status: int
+    violacoes: list = field(default_factory=list)
+
+
+def _cenarios():
+    def get(nome_url, **params):
+        return lambda estado: ('get', reverse(nome_url), params)
+
+    def novo_protocolo_post(estado):
+        estado['sequencia'] += 1
+        return 'post', reverse('novo_protocolo'), {
+            'clientes': [estado['cliente_id']],
+            'buic_dispositivo': f"BUIC-BENCH-{estado['sequencia']}",
+            'tipo_problema': estado['tipo_id'],
+            'descricao_problema': 'Protocolo criado pelo benchmark',
+            'primeira_atualizacao': 'Primeira atualização do benchmark',
+        }
+
+    def adicionar_cliente(estado):
+        estado['sequencia'] += 1
+        return 'post', reverse('adicionar_cliente'), {
+            'nome': f"Cliente Benchmark {estado['sequencia']}",
+            'email': f"benchmark-{estado['sequencia']}-{time.time_ns()}@example.com",
+            'senha': 'benchmark',
+        }
+
+    def adicionar_tipo_problema(estado):
+        estado['sequencia'] += 1
+        return 'post', reverse('adicionar_tipo_problema'), {
+            'nome': f"Tipo Benchmark {estado['sequencia']}-{time.time_ns()}",
+        }
+
+    def busca_numero(estado):
+        return 'get', reverse('busca_global'), {'q': str(estado['numero'])}
+
+    def pagina_profunda(estado):
+        return 'get', reverse('filtrar_protocolos'), {'cursor': estado['cursor_profundo']}
+
+    return [
+        Cenario('dashboard', get('dashboard')),
+        Cenario('novo_protocolo_get', get('novo_protocolo')),
+        Cenario('novo_protocolo_post', novo_protocolo_post, status_esperado=302),
+        Cenario('busca_global_texto', get('busca_global', q='equipamento')),
+        Cenario('busca_global_numero', busca_numero),
+        Cenario('filtrar_protocolos', get('filtrar_protocolos', status='finalizado')),
+        Cenario('filtrar_protocolos_pagina_profunda', pagina_profunda),
+        Cenario('exportar_protocolos_csv', get('exportar_protocolos_csv')),
+        Cenario('tendencias', get('tendencias', meses=36)),
+        Cenario('sla', get('sla', agrupamento='mes')),
+        Cenario('clientes_autocomplete', get('clientes_autocomplete', q='Mer')),
+        Cenario('api_protocolos', get('api_protocolos', limite=1000, include='clientes,tipo_problema')),
+        Cenario('adicionar_cliente', adicionar_cliente),
+        Cenario('adicionar_tipo_problema', adicionar_tipo_problema),
+        Cenario('admin_protocolos', get('admin:protocolos_protocolo_changelist')),
+        Cenario('admin_clientes', get('admin:protocolos_cliente_changelist')),
+        Cenario('admin_tipos_problemas', get('admin:protocolos_tipoproblema_changelist')),
+    ]
+
+
+def orcamentos():
+    combinados = {nome: dict(valores) for nome, valores in ORCAMENTOS_PADRAO.items()}
+    for nome, valores in getattr(settings, 'PROTOCOLOS_BENCHMARK_ORCAMENTOS', {}).items():
+        combinados.setdefault(nome, {}).update(valores)
+    return combinados
+
+
+def _consumir(response):
+    # Respostas em streaming só executam as consultas quando consumidas
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def _executar(client, cenario, estado):
+    metodo, url, dados = cenario.requisicao(estado)
+    return _consumir(getattr(client, metodo)(url, dados))
+
+
+def _estado(client):
+    """IDs e cursores usados pelos cenários, lidos da base atual"""
+    protocolo = Protocolo.objects.order_by('-pk').only('numero').first()
+    cursor = None
+    for _ in range(5):
+        response = client.get(reverse('filtrar_protocolos'), {'cursor': cursor} if cursor else {})
+        cursor = response.context['proximo_cursor'] or cursor
+    return {
+        'sequencia': 0,
+        'cliente_id': Cliente.objects.filter(ativo=True).values_list('pk', flat=True).first(),
+        'tipo_id': TipoProblema.objects.filter(ativo=True).values_list('pk', flat=True).first(),
+        'numero': protocolo.numero if protocolo else 0,
+        'cursor_profundo': cursor or '',
+    }
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p * (len(ordenados) - 1))))]
+
+
+def medir_cenario(client, cenario, estado, tamanho, repeticoes, orcamento):
+    _executar(client, cenario, estado)  # aquecimento (caches, conexões)
+
+    tempos = []
+    consultas = 0
+    status = None
+    for _ in range(repeticoes):
+        # Conta também as consultas feitas em outras threads pelas views async
+        with ContadorSQL().medindo() as contador:
+            inicio = time.perf_counter()
+            response = _executar(client, cenario, estado)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        consultas = max(consultas, contador.consultas)
+        status = response.status_code
+
+    tracemalloc.start()
+    try:
+        _executar(client, cenario, estado)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    resultado = Resultado(
+        cenario=cenario.nome,
+        tamanho=tamanho,
+        repeticoes=repeticoes,
+        ms_mediana=round(statistics.median(tempos), 2),
+        ms_p95=round(_percentil(tempos, 0.95), 2),
+        consultas=consultas,
+        pico_memoria_kb=round(pico / 1024, 1),
+        status=status,
+    )
+    if status != cenario.status_esperado:
+        resultado.violacoes.append(f'status {status} (esperado {cenario.status_esperado})')
+    if orcamento.get('consultas') is not None and consultas > orcamento['consultas']:
+        resultado.violacoes.append(f"{consultas} consultas (orçamento {orcamento['consultas']})")
+    if orcamento.get('ms') is not None and resultado.ms_mediana > orcamento['ms']:
+        resultado.violacoes.append(f"{resultado.ms_mediana} ms (orçamento {orcamento['ms']} ms)")
+    return resultado
+
+
+def preparar_base(tamanho, seed=42):
+    """Completa a base sintética até ``tamanho`` protocolos"""
+    faltam = tamanho - Protocolo.objects.count()
+    if faltam > 0:
+        call_command(
+            'gerar_dados_sinteticos', protocolos=faltam, seed=seed + Protocolo.objects.count(),
+            stdout=StringIO(),
+        )
+
+
+def executar_benchmark(tamanhos, repeticoes=5, cenarios=None, verificar_latencia=True, progresso=None):
+    """Roda os cenários para cada tamanho de base e devolve a lista de ``Resultado``"""
+    usuario, _ = User.objects.get_or_create(
+        username='benchmark', defaults={'is_staff': True, 'is_superuser': True}
+    )
+    client = Client()
+    client.force_login(usuario)
+    limites = orcamentos()
+    selecionados = [c for c in _cenarios() if not cenarios or c.nome in cenarios]
+
+    resultados = []
+    for tamanho in sorted(tamanhos):
+        preparar_base(tamanho)
+        estado = _estado(client)
+        for cenario in selecionados:
+            orcamento = dict(limites.get(cenario.nome, {}))
+            if not verificar_latencia:
+                orcamento['ms'] = None
+            resultado = medir_cenario(client, cenario, estado, tamanho, repeticoes, orcamento)
+            resultados.append(resultado)
+            if progresso:
+                progresso(resultado)
+    return resultados
+
+
+def como_json(resultados):
+    return {
+        'banco': connection.vendor,
+        'executado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'resultados': [asdict(resultado) for resultado in resultados],
+    }
@@ -0,0 +1,227 @@
+"""
+Vazão das views sob WSGI e sob ASGI.
+
+Sobe o projeto com o gunicorn (WSGI, ``sistema_protocolos.wsgi``) e com o
+uvicorn (ASGI, ``sistema_protocolos.asgi``), com o mesmo número de workers, e
+dispara requisições GET autenticadas contra as mesmas URLs por um tempo fixo,
+com várias conexões simultâneas. Os servidores usam o banco configurado nas
+settings; as URLs medidas são só de leitura.
+
+Nenhum dos dois servidores é dependência do projeto: instale-os
+(``pip install gunicorn uvicorn``) para usar o comando ``benchmark_servidores``.
+"""
+import importlib
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.urls import reverse
+
+# Views medidas por padrão e os parâmetros de cada uma
+URLS_PADRAO = {
+    'busca_global': {'q': 'equipamento'},
+    'clientes_autocomplete': {'q': 'Mer'},
+    'tendencias': {'formato': 'json'},
+    'sla': {'formato': 'json'},
+}
+
+ESPERA_SERVIDOR_S = 30
+
+
+def _comando_wsgi(workers, porta):
+    return [
+        '-m', 'gunicorn', 'sistema_protocolos.wsgi:application',
+        '--workers', str(workers), '--bind', f'127.0.0.1:{porta}', '--log-level', 'warning',
+    ]
+
+
+def _comando_asgi(workers, porta):
+    return [
+        '-m', 'uvicorn', 'sistema_protocolos.asgi:application',
+        '--workers', str(workers), '--host', '127.0.0.1', '--port', str(porta),
+        '--log-level', 'warning', '--no-access-log',
+    ]
+
+
+# Servidor: (módulo necessário, linha de comando)
+SERVIDORES = {
+    'wsgi': ('gunicorn', _comando_wsgi),
+    'asgi': ('uvicorn', _comando_asgi),
+}
+
+
+class ServidorIndisponivel(Exception):
+    pass
+
+
+@dataclass
+class ResultadoCarga:
+    servidor: str
+    url: str
+    duracao_s: float
+    concorrencia: int
+    requisicoes: int = 0
+    erros: int = 0
+    tempos_ms: list = field(default_factory=list, repr=False)
+
+    @property
+    def por_segundo(self):
+        return round(self.requisicoes / self.duracao_s, 1) if self.duracao_s else 0.0
+
+    @property
+    def ms_mediana(self):
+        return round(statistics.median(self.tempos_ms), 2) if self.tempos_ms else None
+
+    @property
+    def ms_p95(self):
+        if not self.tempos_ms:
+            return None
+        ordenados = sorted(self.tempos_ms)
+        return round(ordenados[min(len(ordenados) - 1, int(0.95 * len(ordenados)))], 2)
+
+    def como_dict(self):
+        return {
+            'servidor': self.servidor,
+            'url': self.url,
+            'concorrencia': self.concorrencia,
+            'requisicoes': self.requisicoes,
+            'erros': self.erros,
+            'por_segundo': self.por_segundo,
+            'ms_mediana': self.ms_mediana,
+            'ms_p95': self.ms_p95,
+        }
+
+
+def urls_padrao():
+    return [f'{reverse(nome)}?{urlencode(parametros)}' for nome, parametros in URLS_PADRAO.items()]
+
+
+def criar_sessao(usuario):
+    """Sessão autenticada para ``usuario``, como a do ``Client.force_login``"""
+    sessao = importlib.import_module(settings.SESSION_ENGINE).SessionStore()
+    sessao[SESSION_KEY] = usuario._meta.pk.value_to_string(usuario)
+    sessao[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    sessao[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+    sessao.save()
+    return sessao
+
+
+class _SemRedirecionar(urllib.request.HTTPRedirectHandler):
+    # Um redirecionamento (ex.: para o login) conta como erro
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def gerar_carga(url_base, url, cookie, concorrencia, duracao_s, servidor=''):
+    """Mantém ``concorrencia`` requisições simultâneas contra ``url`` por ``duracao_s``"""
+    abridor = urllib.request.build_opener(_SemRedirecionar)
+    resultado = ResultadoCarga(servidor=servidor, url=url, duracao_s=duracao_s, concorrencia=concorrencia)
+    lock = threading.Lock()
+    fim = time.perf_counter() + duracao_s
+
+    def trabalhar():
+        tempos, erros = [], 0
+        while time.perf_counter() < fim:
+            pedido = urllib.request.Request(url_base + url, headers={'Cookie': cookie})
+            inicio = time.perf_counter()
+            try:
+                with abridor.open(pedido, timeout=60) as resposta:
+                    resposta.read()
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            except OSError:  # inclui HTTPError/URLError
+                erros += 1
+        with lock:
+            resultado.tempos_ms.extend(tempos)
+            resultado.requisicoes += len(tempos)
+            resultado.erros += erros
+
+    threads = [threading.Thread(target=trabalhar) for _ in range(concorrencia)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return resultado
+
+
+def _porta_livre():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Servidor:
+    """Processo do gunicorn/uvicorn, usado como context manager"""
+
+    def __init__(self, tipo, workers):
+        modulo, comando = SERVIDORES[tipo]
+        if importlib.util.find_spec(modulo) is None:
+            raise ServidorIndisponivel(f'{tipo}: instale o {modulo} (pip install {modulo})')
+        self.tipo = tipo
+        self.porta = _porta_livre()
+        self.url_base = f'http://127.0.0.1:{self.porta}'
+        self._comando = [sys.executable, *comando(workers, self.porta)]
+        self._processo = None
+        self._log = None
+
+    def __enter__(self):
+        self._log = tempfile.TemporaryFile()
+        self._processo = subprocess.Popen(
+            self._comando, cwd=settings.BASE_DIR, env=os.environ.copy(),
+            stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        limite = time.monotonic() + ESPERA_SERVIDOR_S
+        while time.monotonic() < limite:
+            if self._processo.poll() is not None:
+                self.__exit__()
+                raise ServidorIndisponivel(f'{self.tipo}: o servidor terminou ao iniciar')
+            try:
+                socket.create_connection(('127.0.0.1', self.porta), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise ServidorIndisponivel(f'{self.tipo}: o servidor não respondeu em {ESPERA_SERVIDOR_S}s')
+
+    def __exit__(self, *exc):
+        if self._processo and self._processo.poll() is None:
+            self._processo.terminate()
+            try:
+                self._processo.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._processo.kill()
+                self._processo.wait()
+        if self._log:
+            self._log.close()
+
+
+def comparar_servidores(usuario, servidores=('wsgi', 'asgi'), workers=2, concorrencia=16, duracao_s=10,
+                        urls=None, progresso=None):
+    """Mede cada URL em cada servidor; devolve a lista de ``ResultadoCarga``"""
+    urls = urls or urls_padrao()
+    sessao = criar_sessao(usuario)
+    cookie = f'{settings.SESSION_COOKIE_NAME}={sessao.session_key}'
+    resultados = []
+    try:
+        for tipo in servidores:
+            with Servidor(tipo, workers) as servidor:
+                for url in urls:
+                    gerar_carga(servidor.url_base, url, cookie, concorrencia=1, duracao_s=0.5)  # aquecimento
+                    resultado = gerar_carga(servidor.url_base, url, cookie, concorrencia, duracao_s, servidor=tipo)
+                    resultados.append(resultado)
+                    if progresso:
+                        progresso(resultado)
+    finally:
+        sessao.delete()
+    return resultados
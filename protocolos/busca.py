@@ -0,0 +1,246 @@
+"""
+Busca textual de protocolos.
+
+Cada protocolo tem um ``DocumentoBusca`` com o texto pesquisável (número, BUIC,
+descrição, tipo de problema, clientes e atualizações), reconstruído pelos
+sinais sempre que uma dessas partes muda. O índice depende do banco:
+
+* PostgreSQL: índice GIN sobre ``to_tsvector`` do documento, ranqueado com
+  ``ts_rank``;
+* SQLite: tabela virtual FTS5 sincronizada por triggers, ranqueada com ``bm25``;
+* outros bancos (ou SQLite sem FTS5): ``icontains`` sobre o documento, sem
+  ranking.
+
+Protocolos arquivados (``arquivo``) guardam o texto do documento e só entram na
+busca quando pedido (``buscar_arquivados``), com ``icontains`` e sem ranking.
+Renomear um tipo de problema ou um cliente reconstrói os documentos (dos dois
+lados) numa tarefa em segundo plano (``tarefas``), fora da requisição.
+
+As estruturas são criadas no ``post_migrate`` (ver ``apps.py``).
+"""
+import re
+from dataclasses import dataclass, field
+
+from django.db import DatabaseError, connection
+from django.db.models import Prefetch
+
+from .models import Atualizacao, AtualizacaoArquivada, Cliente, DocumentoBusca, Protocolo, ProtocoloArquivado
+
+CONFIGURACAO_POSTGRES = 'portuguese'
+TABELA_FTS = 'protocolos_documentobusca_fts'
+LOTE_INDEXACAO = 500
+
+_SQL_POSTGRES = [
+    f"""CREATE INDEX IF NOT EXISTS protocolos_documentobusca_tsv
+        ON protocolos_documentobusca
+        USING GIN (to_tsvector('{CONFIGURACAO_POSTGRES}', conteudo))""",
+]
+
+_SQL_SQLITE = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_FTS} USING fts5(
+        conteudo,
+        content='protocolos_documentobusca',
+        content_rowid='protocolo_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS protocolos_documentobusca_ai
+        AFTER INSERT ON protocolos_documentobusca BEGIN
+            INSERT INTO {TABELA_FTS}(rowid, conteudo) VALUES (new.protocolo_id, new.conteudo);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS protocolos_documentobusca_ad
+        AFTER DELETE ON protocolos_documentobusca BEGIN
+            INSERT INTO {TABELA_FTS}({TABELA_FTS}, rowid, conteudo) VALUES ('delete', old.protocolo_id, old.conteudo);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS protocolos_documentobusca_au
+        AFTER UPDATE ON protocolos_documentobusca BEGIN
+            INSERT INTO {TABELA_FTS}({TABELA_FTS}, rowid, conteudo) VALUES ('delete', old.protocolo_id, old.conteudo);
+            INSERT INTO {TABELA_FTS}(rowid, conteudo) VALUES (new.protocolo_id, new.conteudo);
+        END""",
+]
+
+
+@dataclass
+class ResultadoBusca:
+    itens: list = field(default_factory=list)
+    pagina: int = 1
+    tem_proxima: bool = False
+    numero_exato: bool = False
+
+    @property
+    def tem_anterior(self):
+        return self.pagina > 1
+
+
+def criar_estruturas_busca(using='default', **kwargs):
+    """Cria o índice de texto do banco em uso (handler de ``post_migrate``)"""
+    from django.db import connections
+
+    conexao = connections[using]
+    comandos = {'postgresql': _SQL_POSTGRES, 'sqlite': _SQL_SQLITE}.get(conexao.vendor, [])
+    try:
+        with conexao.cursor() as cursor:
+            for comando in comandos:
+                cursor.execute(comando)
+    except DatabaseError:
+        # SQLite compilado sem FTS5: a busca usa o fallback com icontains
+        pass
+
+
+def _termos(texto):
+    return re.findall(r'\w+', texto.lower())[:10]
+
+
+def _texto_documento(protocolo):
+    partes = [
+        str(protocolo.numero or ''),
+        protocolo.buic_dispositivo,
+        protocolo.tipo_problema.nome,
+        protocolo.descricao_problema,
+    ]
+    partes.extend(f"{cliente.nome} {cliente.email}" for cliente in protocolo.clientes.all())
+    partes.extend(atualizacao.descricao for atualizacao in protocolo.atualizacoes.all())
+    return '\n'.join(partes)
+
+
+def indexar_protocolos(ids):
+    """Reconstrói os documentos de busca dos protocolos informados, em lotes"""
+    ids = list(ids)
+    for inicio in range(0, len(ids), LOTE_INDEXACAO):
+        lote = ids[inicio:inicio + LOTE_INDEXACAO]
+        protocolos = Protocolo.objects.filter(pk__in=lote).select_related('tipo_problema').only(
+            'numero', 'buic_dispositivo', 'descricao_problema', 'tipo_problema__nome'
+        ).prefetch_related(
+            Prefetch('clientes', queryset=Cliente.objects.only('nome', 'email')),
+            Prefetch('atualizacoes', queryset=Atualizacao.objects.only('protocolo_id', 'descricao')),
+        )
+        documentos = [
+            DocumentoBusca(protocolo_id=protocolo.pk, conteudo=_texto_documento(protocolo))
+            for protocolo in protocolos
+        ]
+        DocumentoBusca.objects.bulk_create(
+            documentos,
+            update_conflicts=True,
+            unique_fields=['protocolo'],
+            update_fields=['conteudo'],
+        )
+
+
+def indexar_arquivados(ids):
+    """Reconstrói o texto de busca guardado nos protocolos arquivados informados, em lotes"""
+    ids = list(ids)
+    for inicio in range(0, len(ids), LOTE_INDEXACAO):
+        lote = ids[inicio:inicio + LOTE_INDEXACAO]
+        arquivados = list(ProtocoloArquivado.objects.filter(pk__in=lote).select_related('tipo_problema').only(
+            'numero', 'buic_dispositivo', 'descricao_problema', 'tipo_problema__nome', 'documento'
+        ).prefetch_related(
+            Prefetch('clientes', queryset=Cliente.objects.only('nome', 'email')),
+            Prefetch('atualizacoes', queryset=AtualizacaoArquivada.objects.only('protocolo_id', 'descricao')),
+        ))
+        for arquivado in arquivados:
+            arquivado.documento = _texto_documento(arquivado)
+        ProtocoloArquivado.objects.bulk_update(arquivados, ['documento'])
+
+
+def _buscar_postgres(termos, limite, deslocamento):
+    consulta = ' & '.join(f"{termo}:*" for termo in termos)
+    sql = f"""
+        SELECT protocolo_id FROM protocolos_documentobusca,
+               to_tsquery('{CONFIGURACAO_POSTGRES}', %s) AS consulta
+        WHERE to_tsvector('{CONFIGURACAO_POSTGRES}', conteudo) @@ consulta
+        ORDER BY ts_rank(to_tsvector('{CONFIGURACAO_POSTGRES}', conteudo), consulta) DESC, protocolo_id DESC
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [consulta, limite, deslocamento])
+        return [linha[0] for linha in cursor.fetchall()]
+
+
+def _buscar_sqlite(termos, limite, deslocamento):
+    consulta = ' '.join(f'"{termo}"*' for termo in termos)
+    sql = f"""
+        SELECT rowid FROM {TABELA_FTS}
+        WHERE {TABELA_FTS} MATCH %s
+        ORDER BY rank, rowid DESC
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [consulta, limite, deslocamento])
+        return [linha[0] for linha in cursor.fetchall()]
+
+
+def _buscar_sem_indice(termos, limite, deslocamento):
+    documentos = DocumentoBusca.objects.all()
+    for termo in termos:
+        documentos = documentos.filter(conteudo__icontains=termo)
+    ids = documentos.order_by('-protocolo_id').values_list('protocolo_id', flat=True)
+    return list(ids[deslocamento:deslocamento + limite])
+
+
+def _ids_ranqueados(termos, limite, deslocamento):
+    if connection.vendor == 'postgresql':
+        return _buscar_postgres(termos, limite, deslocamento)
+    if connection.vendor == 'sqlite':
+        try:
+            return _buscar_sqlite(termos, limite, deslocamento)
+        except DatabaseError:
+            pass
+    return _buscar_sem_indice(termos, limite, deslocamento)
+
+
+# Maior valor de ``numero`` (IntegerField)
+NUMERO_MAXIMO = 2 ** 31 - 1
+
+
+def _numero(texto):
+    """O texto como número de protocolo, ou ``None`` (``isdigit`` aceita '²', que ``int`` recusa)"""
+    if texto.isdecimal():
+        numero = int(texto)
+        if numero <= NUMERO_MAXIMO:
+            return numero
+    return None
+
+
+def buscar_protocolos(texto, pagina=1, por_pagina=20):
+    """Busca protocolos por relevância, com atalho para o número exato"""
+    texto = (texto or '').strip()
+    pagina = max(pagina, 1)
+
+    numero = _numero(texto)
+    if numero is not None:
+        protocolo = Protocolo.objects.select_related('tipo_problema').filter(numero=numero).first()
+        if protocolo:
+            return ResultadoBusca(itens=[protocolo], numero_exato=True)
+
+    termos = _termos(texto)
+    if not termos:
+        return ResultadoBusca(pagina=pagina)
+
+    # Um item a mais indica se existe próxima página, sem precisar de COUNT
+    ids = _ids_ranqueados(termos, por_pagina + 1, (pagina - 1) * por_pagina)
+    tem_proxima = len(ids) > por_pagina
+    ids = ids[:por_pagina]
+
+    protocolos = Protocolo.objects.select_related('tipo_problema').in_bulk(ids)
+    return ResultadoBusca(
+        itens=[protocolos[pk] for pk in ids if pk in protocolos],
+        pagina=pagina,
+        tem_proxima=tem_proxima,
+    )
+
+
+def buscar_arquivados(texto, limite=20):
+    """Protocolos arquivados com o número exato ou com todos os termos, mais recentes primeiro"""
+    texto = (texto or '').strip()
+    arquivados = ProtocoloArquivado.objects.select_related('tipo_problema')
+    numero = _numero(texto)
+    if numero is not None:
+        protocolo = arquivados.filter(numero=numero).first()
+        if protocolo:
+            return [protocolo]
+
+    termos = _termos(texto)
+    if not termos:
+        return []
+    for termo in termos:
+        arquivados = arquivados.filter(documento__icontains=termo)
+    return list(arquivados.order_by('-id')[:limite])
@@ -0,0 +1,207 @@
+"""
+Carga de protocolos em lote.
+
+Usado pelos comandos de importação e de geração de dados. Os protocolos são
+acumulados em memória e gravados com ``bulk_create`` (protocolos, vínculos com
+clientes e atualizações), um lote por transação. Como ``bulk_create`` não chama
+``save()`` nem dispara sinais, as regras de ``Protocolo.save``/``Atualizacao.save``
+e a manutenção dos dados derivados (busca, contadores, estatísticas diárias,
+campos derivados do protocolo, versão de alteração) são aplicadas aqui.
+"""
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import DataError, IntegrityError, transaction
+from django.utils import timezone
+
+from .alteracoes import versao_da_transacao
+from .busca import indexar_protocolos
+from .derivados import TAMANHO_NOME_CLIENTE, resumir
+from .estatisticas import agendar_invalidacao_estatisticas, registrar_eventos
+from .models import Atualizacao, Cliente, Protocolo
+from .numeracao import garantir_numero_minimo, reservar_numeros
+from .versao import agendar_avanco_versao
+
+
+@contextmanager
+def datas_informadas():
+    """
+    Desliga ``auto_now_add`` de ``data_criacao``/``data_hora`` durante a carga.
+
+    ``bulk_create`` chama ``pre_save``, que sobrescreveria as datas históricas
+    com o horário atual. O carregador preenche as datas faltantes antes.
+    """
+    campos = [Protocolo._meta.get_field('data_criacao'), Atualizacao._meta.get_field('data_hora')]
+    originais = [campo.auto_now_add for campo in campos]
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, original in zip(campos, originais):
+            campo.auto_now_add = original
+
+
+class LoteRejeitado(Exception):
+    """O banco recusou um lote (ex.: número duplicado, valor fora do tipo da coluna); nada dele foi gravado"""
+
+    def __init__(self, referencias, erro):
+        super().__init__(str(erro))
+        self.referencias = referencias
+        self.erro = erro
+
+
+class CarregadorProtocolos:
+    """Acumula protocolos e grava em lotes de ``tamanho_lote``"""
+
+    def __init__(self, tamanho_lote=1000, indexar=True):
+        self.tamanho_lote = tamanho_lote
+        self.indexar = indexar
+        self.total_protocolos = 0
+        self.total_vinculos = 0
+        self.total_atualizacoes = 0
+        self._pendentes = []
+        self._referencias = []
+        # Faixas (primeiro, último) de números atribuídos pela carga
+        self._faixas_reservadas = []
+
+    def adicionar(self, protocolo, cliente_ids=(), atualizacoes=(), referencia=None):
+        """
+        Enfileira um protocolo não salvo.
+
+        ``atualizacoes`` são instâncias de ``Atualizacao`` ainda sem protocolo.
+        Datas de criação preenchidas em ``protocolo.data_criacao`` e
+        ``atualizacao.data_hora`` são preservadas. ``referencia`` (ex.: a linha
+        do arquivo) volta em ``LoteRejeitado`` se o banco recusar o lote.
+        """
+        self._pendentes.append((protocolo, list(cliente_ids), list(atualizacoes)))
+        self._referencias.append(referencia)
+        if len(self._pendentes) >= self.tamanho_lote:
+            self.descarregar()
+
+    def numero_reservado(self, numero):
+        """Se ``numero`` já foi atribuído pela carga a um protocolo sem número"""
+        return any(primeiro <= numero <= ultimo for primeiro, ultimo in self._faixas_reservadas)
+
+    def _reservar(self, quantidade):
+        numeros = list(reservar_numeros(quantidade))
+        if self._faixas_reservadas and self._faixas_reservadas[-1][1] + 1 == numeros[0]:
+            self._faixas_reservadas[-1] = (self._faixas_reservadas[-1][0], numeros[-1])
+        else:
+            self._faixas_reservadas.append((numeros[0], numeros[-1]))
+        return numeros
+
+    def descarregar(self):
+        """Grava o lote pendente; levanta ``LoteRejeitado`` se o banco o recusar"""
+        if not self._pendentes:
+            return
+        lote, self._pendentes = self._pendentes, []
+        referencias, self._referencias = self._referencias, []
+        protocolos = [protocolo for protocolo, _, _ in lote]
+
+        # Os números próprios avançam o contador antes da reserva, para que os
+        # reservados não coincidam com eles
+        com_numero = [protocolo.numero for protocolo in protocolos if protocolo.numero]
+        if com_numero:
+            garantir_numero_minimo(max(com_numero))
+        # Números reservados de uma vez para o lote inteiro
+        sem_numero = [protocolo for protocolo in protocolos if not protocolo.numero]
+        if sem_numero:
+            for protocolo, numero in zip(sem_numero, self._reservar(len(sem_numero))):
+                protocolo.numero = numero
+
+        try:
+            with transaction.atomic():
+                self._gravar(lote)
+                agendar_invalidacao_estatisticas()
+                agendar_avanco_versao()
+        except (IntegrityError, DataError) as erro:
+            raise LoteRejeitado(referencias, erro) from erro
+
+    def finalizar(self):
+        self.descarregar()
+
+    def _aplicar_regras(self, protocolo, atualizacoes):
+        # Mesmas regras de Protocolo.save e Atualizacao.save
+        if atualizacoes and protocolo.status == 'aberto':
+            protocolo.status = 'em_andamento'
+        if protocolo.status == 'finalizado' and not protocolo.data_finalizacao:
+            protocolo.data_finalizacao = timezone.now()
+
+    def _preencher_derivados(self, lote):
+        # Mesmos valores que protocolos.derivados calcularia depois da gravação
+        principais = {min(cliente_ids) for _, cliente_ids, _ in lote if cliente_ids}
+        nomes = dict(Cliente.objects.filter(pk__in=principais).values_list('pk', 'nome'))
+        for protocolo, cliente_ids, atualizacoes in lote:
+            nome = nomes.get(min(cliente_ids), '') if cliente_ids else ''
+            protocolo.cliente_principal_nome = nome[:TAMANHO_NOME_CLIENTE]
+            protocolo.total_atualizacoes = len(atualizacoes)
+            if atualizacoes:
+                # Em caso de empate vale a última da lista, que recebe o maior id
+                _, ultima = max(enumerate(atualizacoes), key=lambda item: (item[1].data_hora, item[0]))
+                protocolo.ultima_atualizacao_em = ultima.data_hora
+                protocolo.ultima_atualizacao_resumo = resumir(ultima.descricao)
+
+    def _gravar(self, lote):
+        protocolos = [protocolo for protocolo, _, _ in lote]
+        for protocolo, _, atualizacoes in lote:
+            self._aplicar_regras(protocolo, atualizacoes)
+
+        agora = timezone.now()
+        versao = versao_da_transacao()
+        for protocolo, _, atualizacoes in lote:
+            protocolo.data_criacao = protocolo.data_criacao or agora
+            protocolo.versao_alteracao = versao
+            protocolo.atualizado_em = agora
+            for atualizacao in atualizacoes:
+                atualizacao.data_hora = atualizacao.data_hora or agora
+        self._preencher_derivados(lote)
+        with datas_informadas():
+            Protocolo.objects.bulk_create(protocolos)
+        self._garantir_pks(protocolos)
+
+        vinculos = []
+        novas_atualizacoes = []
+        for protocolo, cliente_ids, atualizacoes in lote:
+            vinculos.extend(
+                Protocolo.clientes.through(protocolo_id=protocolo.pk, cliente_id=cliente_id)
+                for cliente_id in dict.fromkeys(cliente_ids)
+            )
+            for atualizacao in atualizacoes:
+                atualizacao.protocolo = protocolo
+                novas_atualizacoes.append(atualizacao)
+
+        Protocolo.clientes.through.objects.bulk_create(vinculos, batch_size=self.tamanho_lote)
+        with datas_informadas():
+            Atualizacao.objects.bulk_create(novas_atualizacoes, batch_size=self.tamanho_lote)
+
+        registrar_eventos(self._eventos(lote))
+        if self.indexar:
+            indexar_protocolos([protocolo.pk for protocolo in protocolos])
+
+        self.total_protocolos += len(protocolos)
+        self.total_vinculos += len(vinculos)
+        self.total_atualizacoes += len(novas_atualizacoes)
+
+    def _eventos(self, lote):
+        # Mesmos critérios de reconstruir_estatisticas
+        eventos = Counter()
+        for protocolo, _, atualizacoes in lote:
+            tipo_id = protocolo.tipo_problema_id
+            eventos[(timezone.localdate(protocolo.data_criacao), tipo_id, 'aberto')] += 1
+            if atualizacoes:
+                primeira = min(atualizacao.data_hora for atualizacao in atualizacoes)
+                eventos[(timezone.localdate(primeira), tipo_id, 'em_andamento')] += 1
+            if protocolo.data_finalizacao:
+                eventos[(timezone.localdate(protocolo.data_finalizacao), tipo_id, 'finalizado')] += 1
+        return eventos
+
+    def _garantir_pks(self, protocolos):
+        # Bancos sem RETURNING no INSERT em lote não preenchem as chaves
+        if all(protocolo.pk for protocolo in protocolos):
+            return
+        pks = dict(
+            Protocolo.objects.filter(numero__in=[p.numero for p in protocolos]).values_list('numero', 'pk')
+        )
+        for protocolo in protocolos:
+            protocolo.pk = pks[protocolo.numero]
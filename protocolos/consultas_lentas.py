@@ -0,0 +1,208 @@
+"""
+Registro de consultas lentas.
+
+Quando ``PROTOCOLOS_CONSULTAS_LENTAS_ATIVO`` está ligado, toda conexão recebe um
+``execute_wrapper`` que mede cada consulta. As que passam de
+``PROTOCOLOS_CONSULTAS_LENTAS_MS`` são registradas com o SQL normalizado, a view
+em execução, o trecho do projeto que disparou a consulta e o plano do banco
+(``EXPLAIN``; ``EXPLAIN ANALYZE`` numa amostra, nos bancos que suportam).
+
+Os registros vão para um buffer circular em memória (``recentes``), para um
+agregado por SQL normalizado (``agregadas``) e, em JSON por linha, para um
+arquivo com rotação, lido pelo comando ``consultas_lentas``.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import nullcontext
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.backends.signals import connection_created
+
+from .middleware import view_atual
+
+logger = logging.getLogger('protocolos.consultas_lentas')
+
+# Arquivos de log mantidos na rotação
+ARQUIVO_BYTES = 5 * 1024 * 1024
+ARQUIVO_BACKUPS = 5
+
+_RAIZ_PROJETO = str(Path(settings.BASE_DIR).resolve())
+_ESTE_ARQUIVO = str(Path(__file__).resolve())
+
+_LITERAL_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_LITERAL_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LISTA_PARAMETROS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ESPACOS = re.compile(r'\s+')
+_CONSULTA_LEITURA = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+
+def normalizar_sql(sql):
+    """Troca literais e parâmetros por ``?`` para agrupar consultas iguais"""
+    sql = _LITERAL_TEXTO.sub('?', sql)
+    sql = _LITERAL_NUMERO.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _LISTA_PARAMETROS.sub('(...)', sql)
+    return _ESPACOS.sub(' ', sql).strip()
+
+
+def _origem():
+    """Último trecho do projeto na pilha (fora do Django e deste módulo)"""
+    for quadro in reversed(traceback.extract_stack()[:-3]):
+        arquivo = str(Path(quadro.filename).resolve())
+        if (
+            arquivo.startswith(_RAIZ_PROJETO)
+            and arquivo != _ESTE_ARQUIVO
+            and 'site-packages' not in arquivo
+        ):
+            return f'{Path(arquivo).relative_to(_RAIZ_PROJETO)}:{quadro.lineno} em {quadro.name}'
+    return None
+
+
+class CapturaConsultasLentas:
+    """``execute_wrapper`` que registra as consultas acima de ``limite_ms``"""
+
+    def __init__(self, limite_ms=200, amostra_analyze=0.0, tamanho_buffer=200):
+        self.limite_ms = limite_ms
+        self.amostra_analyze = amostra_analyze
+        self.tamanho_buffer = tamanho_buffer
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._recentes = deque(maxlen=tamanho_buffer)
+        self._agregadas = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # As consultas do próprio EXPLAIN também passam por aqui
+        if getattr(self._local, 'explicando', False):
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        resultado = execute(sql, params, many, context)
+        ms = (time.perf_counter() - inicio) * 1000
+        if ms >= self.limite_ms:
+            self._registrar(sql, params, many, context['connection'], ms)
+        return resultado
+
+    def _registrar(self, sql, params, many, conexao, ms):
+        analyze = random.random() < self.amostra_analyze
+        plano = None if many else self._explicar(conexao, sql, params, analyze)
+        registro = {
+            'quando': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'ms': round(ms, 2),
+            'banco': conexao.alias,
+            'view': view_atual.get(),
+            'origem': _origem(),
+            'sql': normalizar_sql(sql),
+            'plano': plano,
+            'analyze': analyze and plano is not None,
+        }
+
+        with self._lock:
+            self._recentes.append(registro)
+            agregado = self._agregadas.get(registro['sql'])
+            if agregado is None:
+                if len(self._agregadas) >= self.tamanho_buffer:
+                    # Descarta o SQL que menos pesou para abrir espaço
+                    menor = min(self._agregadas, key=lambda chave: self._agregadas[chave]['ms_total'])
+                    del self._agregadas[menor]
+                agregado = self._agregadas[registro['sql']] = {
+                    'sql': registro['sql'], 'ocorrencias': 0, 'ms_total': 0.0, 'ms_max': 0.0, 'views': [],
+                }
+            agregado['ocorrencias'] += 1
+            agregado['ms_total'] += ms
+            agregado['ms_max'] = max(agregado['ms_max'], ms)
+            agregado['ultimo'] = registro
+            if registro['view'] and registro['view'] not in agregado['views']:
+                agregado['views'].append(registro['view'])
+
+        logger.warning(json.dumps(registro, ensure_ascii=False, default=str))
+
+    def _explicar(self, conexao, sql, params, analyze):
+        if not _CONSULTA_LEITURA.match(sql) or conexao.needs_rollback:
+            return None
+        prefixo = None
+        if analyze:
+            try:
+                prefixo = conexao.ops.explain_query_prefix(analyze=True)
+            except ValueError:
+                pass  # banco sem EXPLAIN ANALYZE (ex.: SQLite)
+        prefixo = prefixo or conexao.ops.explain_query_prefix()
+
+        self._local.explicando = True
+        try:
+            # Savepoint para um EXPLAIN com erro não estragar a transação em curso
+            bloco = transaction.atomic(using=conexao.alias) if conexao.in_atomic_block else nullcontext()
+            with bloco:
+                with conexao.cursor() as cursor:
+                    cursor.execute(f'{prefixo} {sql}', params)
+                    linhas = cursor.fetchall()
+        except DatabaseError:
+            return None
+        finally:
+            self._local.explicando = False
+        return '\n'.join(' '.join(str(coluna) for coluna in linha) for linha in linhas)
+
+    def recentes(self):
+        with self._lock:
+            return list(self._recentes)
+
+    def agregadas(self):
+        """Consultas agrupadas, das que mais somaram tempo para as que menos"""
+        with self._lock:
+            return sorted(
+                (dict(agregado) for agregado in self._agregadas.values()),
+                key=lambda agregado: agregado['ms_total'],
+                reverse=True,
+            )
+
+    def limpar(self):
+        with self._lock:
+            self._recentes.clear()
+            self._agregadas.clear()
+
+
+captura = None
+
+
+def arquivo_log():
+    arquivo = getattr(settings, 'PROTOCOLOS_CONSULTAS_LENTAS_ARQUIVO', None)
+    return Path(arquivo) if arquivo else None
+
+
+def _instalar_na_conexao(sender, connection, **kwargs):
+    if captura not in connection.execute_wrappers:
+        connection.execute_wrappers.append(captura)
+
+
+def instalar():
+    """Liga a captura em todas as conexões (chamado em ``ProtocolosConfig.ready``)"""
+    global captura
+    if captura is not None:
+        return captura
+    captura = CapturaConsultasLentas(
+        limite_ms=getattr(settings, 'PROTOCOLOS_CONSULTAS_LENTAS_MS', 200),
+        amostra_analyze=getattr(settings, 'PROTOCOLOS_CONSULTAS_LENTAS_AMOSTRA_ANALYZE', 0.0),
+        tamanho_buffer=getattr(settings, 'PROTOCOLOS_CONSULTAS_LENTAS_BUFFER', 200),
+    )
+
+    arquivo = arquivo_log()
+    if arquivo and not logger.handlers:
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(
+            arquivo, maxBytes=ARQUIVO_BYTES, backupCount=ARQUIVO_BACKUPS, encoding='utf-8', delay=True
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+        logger.propagate = False
+
+    connection_created.connect(_instalar_na_conexao, dispatch_uid='protocolos_consultas_lentas')
+    return captura
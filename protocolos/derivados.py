@@ -0,0 +1,92 @@
+"""
+Campos derivados de ``Protocolo``.
+
+``ultima_atualizacao_em``, ``ultima_atualizacao_resumo``, ``total_atualizacoes``
+e ``cliente_principal_nome`` são cópias de dados de outras tabelas, para que
+listagens, dashboard e exportação não precisem de subconsultas por linha.
+A inclusão de uma atualização soma de forma incremental (``Atualizacao.save``);
+edições, exclusões e mudanças de clientes recalculam os protocolos afetados
+(``signals``). O comando ``reparar_dados_derivados`` recalcula tudo.
+
+O cliente principal é o cliente vinculado de menor id.
+"""
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Substr
+
+from .models import Atualizacao, Cliente, Protocolo
+
+TAMANHO_RESUMO = Protocolo._meta.get_field('ultima_atualizacao_resumo').max_length
+TAMANHO_NOME_CLIENTE = Protocolo._meta.get_field('cliente_principal_nome').max_length
+
+
+def resumir(texto):
+    return (texto or '')[:TAMANHO_RESUMO]
+
+
+def registrar_nova_atualizacao(atualizacao):
+    """Soma uma atualização recém-criada, sem reler as demais"""
+    mais_recente = Q(ultima_atualizacao_em__isnull=True) | Q(ultima_atualizacao_em__lte=atualizacao.data_hora)
+    Protocolo.objects.filter(pk=atualizacao.protocolo_id).update(
+        total_atualizacoes=F('total_atualizacoes') + 1,
+        ultima_atualizacao_em=Case(
+            When(mais_recente, then=Value(atualizacao.data_hora)), default=F('ultima_atualizacao_em')
+        ),
+        ultima_atualizacao_resumo=Case(
+            When(mais_recente, then=Value(resumir(atualizacao.descricao))), default=F('ultima_atualizacao_resumo')
+        ),
+    )
+
+
+def _expressoes_atualizacoes():
+    ultima = Atualizacao.objects.filter(protocolo=OuterRef('pk')).order_by('-data_hora', '-pk')
+    total = Atualizacao.objects.filter(protocolo=OuterRef('pk')).order_by().values('protocolo').annotate(
+        total=Count('pk')
+    ).values('total')
+    return {
+        'total_atualizacoes': Coalesce(Subquery(total, output_field=IntegerField()), 0),
+        'ultima_atualizacao_em': Subquery(ultima.values('data_hora')[:1]),
+        'ultima_atualizacao_resumo': Coalesce(
+            Subquery(ultima.annotate(resumo=Substr('descricao', 1, TAMANHO_RESUMO)).values('resumo')[:1]),
+            Value(''),
+        ),
+    }
+
+
+def _expressoes_clientes():
+    principal = Cliente.objects.filter(protocolos=OuterRef('pk')).order_by('pk')
+    return {
+        'cliente_principal_nome': Coalesce(
+            Subquery(principal.annotate(nome_curto=Substr('nome', 1, TAMANHO_NOME_CLIENTE)).values('nome_curto')[:1]),
+            Value(''),
+        ),
+    }
+
+
+def recalcular_atualizacoes(protocolo_ids):
+    ids = list(protocolo_ids)
+    if ids:
+        Protocolo.objects.filter(pk__in=ids).update(**_expressoes_atualizacoes())
+
+
+def recalcular_cliente_principal(protocolo_ids):
+    ids = list(protocolo_ids)
+    if ids:
+        Protocolo.objects.filter(pk__in=ids).update(**_expressoes_clientes())
+
+
+def recalcular(queryset):
+    """Recalcula todos os campos derivados dos protocolos do queryset"""
+    return queryset.update(**_expressoes_atualizacoes(), **_expressoes_clientes())
+
+
+def divergentes(queryset):
+    """Ids dos protocolos cujos campos derivados não batem com os dados de origem"""
+    calculados = {f'{campo}_calculado': expressao for campo, expressao in {
+        **_expressoes_atualizacoes(), **_expressoes_clientes()
+    }.items()}
+    campos = list(Protocolo.CAMPOS_DERIVADOS)
+    ids = []
+    for linha in queryset.annotate(**calculados).values('pk', *campos, *calculados):
+        if any(linha[campo] != linha[f'{campo}_calculado'] for campo in campos):
+            ids.append(linha['pk'])
+    return ids
@@ -0,0 +1,329 @@
+"""
+Contadores do dashboard e estatísticas diárias.
+
+Os totais por status são calculados numa única agregação condicional e ficam
+em cache, com a versão dos dados (``versao``) na chave: uma alteração
+confirmada em qualquer processo avança a versão e torna as entradas antigas
+inalcançáveis em todos eles, mesmo com cache de memória local, e os números
+nunca ficam atrás dos fragmentos e ETags chaveados pela mesma versão. O TTL
+``PROTOCOLOS_DASHBOARD_CACHE_TTL`` é só uma garantia caso alguma escrita passe
+por fora dos sinais (``QuerySet.update``, SQL direto).
+
+``EstatisticaDiaria`` acumula quantos protocolos entraram em cada status por
+dia e tipo de problema: "aberto" na criação, "em_andamento" na primeira
+atualização (ou mudança manual de status) e "finalizado" na finalização. É
+incrementada por ``Protocolo.save`` e pela carga em lote; o comando
+``reconstruir_estatisticas`` refaz o histórico a partir dos protocolos e
+atualizações existentes, incluindo os arquivados. Exclusões e trocas de tipo
+não reescrevem o histórico até a próxima reconstrução.
+"""
+from collections import Counter
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Trunc, TruncDate
+from django.utils import timezone
+
+from .models import Atualizacao, AtualizacaoArquivada, EstatisticaDiaria, Protocolo, ProtocoloArquivado
+from .versao import agendar_avanco_versao, versao_dados
+
+CHAVE_CONTADORES = 'protocolos:dashboard:contadores'
+CHAVE_PROBLEMAS = 'protocolos:dashboard:problemas'
+CHAVE_ULTIMOS_DIAS = 'protocolos:dashboard:ultimos_dias'
+
+# Janela do resumo recente exibido no dashboard
+DIAS_RESUMO_RECENTE = 30
+
+
+def _ttl():
+    return getattr(settings, 'PROTOCOLOS_DASHBOARD_CACHE_TTL', 300)
+
+
+def calcular_contadores():
+    """Total de protocolos e total por status, em uma única consulta"""
+    agregados = {'total': Count('id')}
+    for status, _ in Protocolo.STATUS_CHOICES:
+        agregados[status] = Count('id', filter=Q(status=status))
+    return Protocolo.objects.aggregate(**agregados)
+
+
+def calcular_problemas_frequentes(limite=5):
+    """Tipos de problema ativos com mais protocolos abertos (lido das estatísticas diárias)"""
+    return [
+        {
+            'id': linha['tipo_problema'],
+            'nome': linha['tipo_problema__nome'],
+            'descricao': linha['tipo_problema__descricao'],
+            'total_protocolos': linha['total_protocolos'],
+        }
+        for linha in EstatisticaDiaria.objects.filter(evento='aberto', tipo_problema__ativo=True)
+        .values('tipo_problema', 'tipo_problema__nome', 'tipo_problema__descricao')
+        .annotate(total_protocolos=Sum('quantidade'))
+        .filter(total_protocolos__gt=0)
+        .order_by('-total_protocolos', 'tipo_problema__nome')[:limite]
+    ]
+
+
+def _chave(chave, versao):
+    return f'{chave}:{versao_dados() if versao is None else versao}'
+
+
+def contadores_status(versao=None):
+    """Contadores do dashboard na versão ``versao`` dos dados (lida do banco se omitida)"""
+    chave = _chave(CHAVE_CONTADORES, versao)
+    contadores = cache.get(chave)
+    if contadores is None:
+        from .arquivo import total_arquivados
+        contadores = calcular_contadores()
+        # Protocolos arquivados continuam contando como finalizados
+        contadores['arquivados'] = total_arquivados()
+        contadores['total'] += contadores['arquivados']
+        contadores['finalizado'] += contadores['arquivados']
+        cache.set(chave, contadores, _ttl())
+    return contadores
+
+
+def problemas_frequentes(versao=None):
+    chave = _chave(CHAVE_PROBLEMAS, versao)
+    problemas = cache.get(chave)
+    if problemas is None:
+        problemas = calcular_problemas_frequentes()
+        cache.set(chave, problemas, _ttl())
+    return problemas
+
+
+def calcular_resumo_recente(dias=DIAS_RESUMO_RECENTE):
+    """Eventos dos últimos ``dias`` dias, somados das estatísticas diárias"""
+    hoje = timezone.localdate()
+    serie = tendencia(hoje - timedelta(days=dias - 1), hoje, agrupamento='dia')
+    return {evento: sum(ponto[evento] for ponto in serie) for evento, _ in Protocolo.STATUS_CHOICES}
+
+
+def resumo_recente(versao=None):
+    # O dia entra na chave: o resumo é uma janela que anda mesmo sem alterações
+    chave = f'{_chave(CHAVE_ULTIMOS_DIAS, versao)}:{timezone.localdate().isoformat()}'
+    resumo = cache.get(chave)
+    if resumo is None:
+        resumo = calcular_resumo_recente()
+        cache.set(chave, resumo, _ttl())
+    return resumo
+
+
+def invalidar_estatisticas():
+    # Chamada antes do avanço da versão: libera as entradas da versão que está saindo
+    versao = versao_dados()
+    cache.delete_many([
+        _chave(CHAVE_CONTADORES, versao),
+        _chave(CHAVE_PROBLEMAS, versao),
+        f'{_chave(CHAVE_ULTIMOS_DIAS, versao)}:{timezone.localdate().isoformat()}',
+    ])
+
+
+class InvalidacaoEstatisticas:
+    """Callback de ``on_commit`` que sabe se já foi executado"""
+
+    def __init__(self):
+        self.executado = False
+
+    def __call__(self):
+        self.executado = True
+        invalidar_estatisticas()
+
+
+def agendar_invalidacao_estatisticas():
+    """Invalida as estatísticas depois do commit, uma única vez por transação"""
+    pendentes = transaction.get_connection().run_on_commit
+    if any(isinstance(funcao, InvalidacaoEstatisticas) and not funcao.executado for _, funcao, _ in pendentes):
+        return
+    transaction.on_commit(InvalidacaoEstatisticas())
+
+
+# Estatísticas diárias
+
+# Acima desta quantidade de chaves, os incrementos são aplicados em lote
+LIMITE_INCREMENTO_INDIVIDUAL = 10
+
+AGRUPAMENTOS = {'dia': None, 'semana': 'week', 'mes': 'month'}
+
+# Período padrão e máximo (em meses) das tendências
+TENDENCIAS_MESES_PADRAO = 12
+TENDENCIAS_MESES_MAXIMO = 60
+
+
+def eventos_de_transicao(protocolo, adicionando, status_anterior):
+    """Contagens ``{(data, tipo_id, evento): n}`` geradas por um ``save`` do protocolo"""
+    eventos = Counter()
+    tipo_id = protocolo.tipo_problema_id
+    if adicionando:
+        eventos[(timezone.localdate(protocolo.data_criacao), tipo_id, 'aberto')] += 1
+        status_anterior = 'aberto'
+    if status_anterior is None or status_anterior == protocolo.status:
+        return eventos
+    evento = evento_de_status(tipo_id, protocolo.status, protocolo.data_finalizacao)
+    if evento:
+        eventos[evento] += 1
+    return eventos
+
+
+def evento_de_status(tipo_id, status, data_finalizacao=None):
+    """Chave ``(data, tipo_id, evento)`` de um protocolo que acabou de entrar em ``status``"""
+    if status == 'em_andamento':
+        return (timezone.localdate(), tipo_id, 'em_andamento')
+    if status == 'finalizado':
+        return (timezone.localdate(data_finalizacao or timezone.now()), tipo_id, 'finalizado')
+    return None
+
+
+def registrar_transicoes(protocolo, adicionando, status_anterior):
+    registrar_eventos(eventos_de_transicao(protocolo, adicionando, status_anterior))
+
+
+def registrar_eventos(contagens):
+    """Soma ``{(data, tipo_id, evento): n}`` às estatísticas diárias"""
+    contagens = {chave: n for chave, n in contagens.items() if n}
+    if not contagens:
+        return
+    if len(contagens) > LIMITE_INCREMENTO_INDIVIDUAL:
+        _registrar_em_lote(contagens)
+        return
+    for (data, tipo_id, evento), quantidade in contagens.items():
+        linhas = EstatisticaDiaria.objects.filter(data=data, tipo_problema_id=tipo_id, evento=evento)
+        if linhas.update(quantidade=F('quantidade') + quantidade):
+            continue
+        try:
+            with transaction.atomic():
+                EstatisticaDiaria.objects.create(
+                    data=data, tipo_problema_id=tipo_id, evento=evento, quantidade=quantidade
+                )
+        except IntegrityError:
+            # Outra transação criou a linha primeiro
+            linhas.update(quantidade=F('quantidade') + quantidade)
+
+
+def _registrar_em_lote(contagens):
+    datas = [data for data, _, _ in contagens]
+    with transaction.atomic():
+        existentes = {
+            (linha.data, linha.tipo_problema_id, linha.evento): linha
+            for linha in EstatisticaDiaria.objects.select_for_update().filter(
+                data__range=(min(datas), max(datas)),
+                tipo_problema_id__in={tipo_id for _, tipo_id, _ in contagens},
+            )
+        }
+        alteradas, novas = [], []
+        for (data, tipo_id, evento), quantidade in contagens.items():
+            linha = existentes.get((data, tipo_id, evento))
+            if linha:
+                linha.quantidade += quantidade
+                alteradas.append(linha)
+            else:
+                novas.append(EstatisticaDiaria(data=data, tipo_problema_id=tipo_id, evento=evento, quantidade=quantidade))
+        EstatisticaDiaria.objects.bulk_update(alteradas, ['quantidade'], batch_size=1000)
+        EstatisticaDiaria.objects.bulk_create(novas, batch_size=1000)
+
+
+def _contagens_por_dia(queryset, campo_data, desde):
+    linhas = (
+        queryset.annotate(dia=TruncDate(campo_data))
+        .filter(dia__isnull=False, **({'dia__gte': desde} if desde else {}))
+        .values('dia', 'tipo_problema')
+        .annotate(quantidade=Count('pk'))
+        .order_by()
+    )
+    return {(linha['dia'], linha['tipo_problema']): linha['quantidade'] for linha in linhas}
+
+
+def _eventos_por_dia(protocolos, atualizacoes, desde):
+    primeira_atualizacao = atualizacoes.filter(protocolo=OuterRef('pk')).order_by('data_hora').values('data_hora')[:1]
+    return {
+        'aberto': Counter(_contagens_por_dia(protocolos, 'data_criacao', desde)),
+        'em_andamento': Counter(_contagens_por_dia(
+            protocolos.annotate(primeira_atualizacao=Subquery(primeira_atualizacao)),
+            'primeira_atualizacao', desde,
+        )),
+        'finalizado': Counter(_contagens_por_dia(protocolos, 'data_finalizacao', desde)),
+    }
+
+
+def reconstruir_estatisticas(desde=None):
+    """Refaz as estatísticas diárias (a partir de ``desde``, se informado), incluindo o arquivo"""
+    eventos = _eventos_por_dia(Protocolo.objects.all(), Atualizacao.objects.all(), desde)
+    arquivados = _eventos_por_dia(ProtocoloArquivado.objects.all(), AtualizacaoArquivada.objects.all(), desde)
+    for evento, contagens in arquivados.items():
+        eventos[evento].update(contagens)
+    linhas = [
+        EstatisticaDiaria(data=data, tipo_problema_id=tipo_id, evento=evento, quantidade=quantidade)
+        for evento, contagens in eventos.items()
+        for (data, tipo_id), quantidade in contagens.items()
+    ]
+    with transaction.atomic():
+        antigas = EstatisticaDiaria.objects.all()
+        if desde:
+            antigas = antigas.filter(data__gte=desde)
+        antigas.delete()
+        EstatisticaDiaria.objects.bulk_create(linhas, batch_size=1000)
+    agendar_invalidacao_estatisticas()
+    agendar_avanco_versao()
+    return len(linhas)
+
+
+def _inicio_periodo(data, agrupamento):
+    if agrupamento == 'mes':
+        return data.replace(day=1)
+    if agrupamento == 'semana':
+        return data - timedelta(days=data.weekday())
+    return data
+
+
+def _proximo_periodo(data, agrupamento):
+    if agrupamento == 'mes':
+        return date(data.year + data.month // 12, data.month % 12 + 1, 1)
+    return data + timedelta(days=7 if agrupamento == 'semana' else 1)
+
+
+def tendencia(inicio, fim, agrupamento='mes', tipo_problema=None):
+    """
+    Série de ``{'periodo', 'aberto', 'em_andamento', 'finalizado'}`` entre
+    ``inicio`` e ``fim`` (datas), com períodos sem eventos preenchidos com zero.
+    """
+    linhas = EstatisticaDiaria.objects.filter(data__range=(inicio, fim))
+    if tipo_problema:
+        linhas = linhas.filter(tipo_problema_id=tipo_problema)
+    somas = {
+        evento: Sum('quantidade', filter=Q(evento=evento)) for evento, _ in Protocolo.STATUS_CHOICES
+    }
+    truncamento = AGRUPAMENTOS[agrupamento]
+    periodo = Trunc('data', truncamento, output_field=DateField()) if truncamento else F('data')
+    agregados = {
+        linha['periodo']: linha
+        for linha in linhas.annotate(periodo=periodo).values('periodo').annotate(**somas).order_by('periodo')
+    }
+
+    serie = []
+    periodo = _inicio_periodo(inicio, agrupamento)
+    while periodo <= fim:
+        linha = agregados.get(periodo, {})
+        serie.append({'periodo': periodo, **{evento: linha.get(evento) or 0 for evento in somas}})
+        periodo = _proximo_periodo(periodo, agrupamento)
+    return serie
+
+
+def ler_periodo_tendencias(params):
+    """``(agrupamento, meses)`` dos parâmetros, com os padrões para valores inválidos"""
+    agrupamento = params.get('agrupamento')
+    if agrupamento not in AGRUPAMENTOS:
+        agrupamento = 'mes'
+    try:
+        meses = min(max(int(params.get('meses', TENDENCIAS_MESES_PADRAO)), 1), TENDENCIAS_MESES_MAXIMO)
+    except (TypeError, ValueError):
+        meses = TENDENCIAS_MESES_PADRAO
+    return agrupamento, meses
+
+
+def inicio_em_meses(fim, meses):
+    """Primeiro dia do mês ``meses`` meses antes do mês de ``fim``"""
+    indice_mes = fim.year * 12 + fim.month - meses
+    return date(indice_mes // 12, indice_mes % 12 + 1, 1)
@@ -0,0 +1,78 @@
+"""
+Exportação de protocolos em CSV, usada pelo download direto (``views``) e pelas
+tarefas em segundo plano (``tarefas``).
+"""
+import csv
+
+from django.db.models import Prefetch
+
+from .filtros import aplicar_filtros
+from .models import Cliente, Protocolo
+from .paginacao import paginar_por_chave
+
+# Quantidade de protocolos lidos do banco por vez na exportação
+EXPORTACAO_CHUNK_SIZE = 2000
+
+
+class _Eco:
+    """Pseudo-arquivo que devolve o que for escrito, para gerar o CSV linha a linha"""
+    def write(self, value):
+        return value
+
+
+def protocolos_para_exportacao(filtros):
+    """Queryset da exportação, com dados relacionados carregados em lote"""
+    protocolos = aplicar_filtros(Protocolo.objects.all(), filtros)
+    return protocolos.select_related('tipo_problema', 'usuario_criador').only(
+        'numero', 'status', 'buic_dispositivo', 'descricao_problema', 'data_criacao',
+        'data_finalizacao', 'total_atualizacoes', 'ultima_atualizacao_em',
+        'tipo_problema__nome', 'usuario_criador__username',
+    ).prefetch_related(
+        Prefetch('clientes', queryset=Cliente.objects.only('nome').order_by('id'))
+    ).order_by("numero", "id")
+
+
+def _em_blocos(protocolos):
+    """
+    Percorre os protocolos em blocos de ``EXPORTACAO_CHUNK_SIZE``, por chave
+    (numero, id). Cada bloco é uma consulta independente: não depende de cursor
+    no servidor, que fica desligado atrás de um pooler em modo de transação
+    (onde ``iterator()`` traria a tabela inteira de uma vez). Protocolos sem
+    número vêm por último, em ordem de id.
+    """
+    for consulta, ordenacao in (
+        (protocolos.filter(numero__isnull=False), ['numero', 'id']),
+        (protocolos.filter(numero__isnull=True), ['id']),
+    ):
+        cursor = None
+        while True:
+            bloco, cursor = paginar_por_chave(consulta, ordenacao, cursor, EXPORTACAO_CHUNK_SIZE)
+            yield from bloco
+            if cursor is None:
+                break
+
+
+def linhas_csv(protocolos):
+    """Gera as linhas do CSV lendo os protocolos em blocos"""
+    writer = csv.writer(_Eco())
+    yield writer.writerow([
+        "Número", "Status", "Tipo de Problema", "Clientes", "BUIC Dispositivo",
+        "Descrição do Problema", "Usuário Criador", "Data de Criação", "Data de Finalização",
+        "Atualizações", "Última Atualização"
+    ])
+
+    # Só um bloco fica em memória; o prefetch dos clientes é feito uma vez por bloco
+    for protocolo in _em_blocos(protocolos):
+        yield writer.writerow([
+            protocolo.numero,
+            protocolo.get_status_display(),
+            protocolo.tipo_problema.nome,
+            ", ".join(cliente.nome for cliente in protocolo.clientes.all()),
+            protocolo.buic_dispositivo,
+            protocolo.descricao_problema,
+            protocolo.usuario_criador.username,
+            protocolo.data_criacao.strftime("%d/%m/%Y %H:%M"),
+            protocolo.data_finalizacao.strftime("%d/%m/%Y %H:%M") if protocolo.data_finalizacao else "",
+            protocolo.total_atualizacoes,
+            protocolo.ultima_atualizacao_em.strftime("%d/%m/%Y %H:%M") if protocolo.ultima_atualizacao_em else "",
+        ])
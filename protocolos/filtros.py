@@ -0,0 +1,56 @@
+"""Filtros de protocolos compartilhados entre listagem e exportação"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Protocolo
+
+STATUS_VALIDOS = {valor for valor, _ in Protocolo.STATUS_CHOICES}
+
+
+def _inteiro_ou_none(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _data_ou_none(valor):
+    try:
+        return parse_date(valor or '')
+    except ValueError:
+        return None
+
+
+def _inicio_do_dia(data):
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def ler_filtros(params):
+    """Extrai e valida os filtros de ``params`` (normalmente ``request.GET``)"""
+    status = params.get('status') or None
+    return {
+        'tipo_problema': _inteiro_ou_none(params.get('tipo_problema')),
+        'status': status if status in STATUS_VALIDOS else None,
+        'data_inicio': _data_ou_none(params.get('data_inicio')),
+        'data_fim': _data_ou_none(params.get('data_fim')),
+    }
+
+
+def aplicar_filtros(queryset, filtros):
+    """Aplica os filtros retornados por ``ler_filtros`` ao queryset"""
+    if filtros.get('tipo_problema'):
+        queryset = queryset.filter(tipo_problema_id=filtros['tipo_problema'])
+
+    if filtros.get('status'):
+        queryset = queryset.filter(status=filtros['status'])
+
+    # Intervalos comparados direto na coluna (sem __date) para aproveitar índices
+    if filtros.get('data_inicio'):
+        queryset = queryset.filter(data_criacao__gte=_inicio_do_dia(filtros['data_inicio']))
+
+    if filtros.get('data_fim'):
+        queryset = queryset.filter(data_criacao__lt=_inicio_do_dia(filtros['data_fim'] + timedelta(days=1)))
+
+    return queryset
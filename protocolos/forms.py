@@ -1,13 +1,98 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+from django.urls import reverse_lazy
 from .models import Protocolo, Cliente, TipoProblema
+from .referencias import clientes_ativos, id_ou_none, tipos_problema_ativos
+
+
+class ClientesAutocompleteWidget(forms.SelectMultiple):
+    """
+    Select múltiplo que renderiza apenas os clientes já selecionados.
+
+    As demais opções são carregadas sob demanda pelo select2 a partir do
+    endpoint ``clientes_autocomplete``, então o HTML não cresce com a tabela
+    de clientes.
+    """
+
+    def optgroups(self, name, value, attrs=None):
+        selecionados = [pk for pk in dict.fromkeys(map(id_ou_none, value)) if pk is not None]
+        grupos = []
+        if not selecionados:
+            return grupos
+        clientes = clientes_ativos(selecionados)
+        for indice, cliente in enumerate(clientes[pk] for pk in selecionados if pk in clientes):
+            opcao = self.create_option(name, str(cliente.pk), cliente.nome, True, indice, attrs=attrs)
+            grupos.append((None, [opcao], indice))
+        return grupos
+
+
+class _OpcoesEmCache(ModelChoiceIterator):
+    """Opções a partir de ``field.carregar()`` em vez do queryset"""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for objeto in self.field.carregar():
+            yield self.choice(objeto)
+
+    def __len__(self):
+        return len(self.field.carregar()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.carregar())
+
+
+class TipoProblemaField(forms.ModelChoiceField):
+    """Tipos ativos lidos do cache de referências, na renderização e na validação"""
+    iterator = _OpcoesEmCache
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=TipoProblema.objects.filter(ativo=True).order_by('nome'), **kwargs)
+
+    def carregar(self):
+        return tipos_problema_ativos()
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, TipoProblema):
+            value = value.pk
+        for tipo in self.carregar():
+            if str(tipo.pk) == str(value):
+                return tipo
+        raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+
+
+class ClientesField(forms.ModelMultipleChoiceField):
+    """Valida os ids enviados pelo mapa de clientes ativos do cache de referências"""
+
+    def _check_values(self, value):
+        ids = {}
+        for pk in value:
+            ids[pk] = id_ou_none(pk)
+            if ids[pk] is None:
+                raise ValidationError(
+                    self.error_messages['invalid_pk_value'], code='invalid_pk_value', params={'pk': pk}
+                )
+        clientes = clientes_ativos(ids.values())
+        for pk, id_cliente in ids.items():
+            if id_cliente not in clientes:
+                raise ValidationError(
+                    self.error_messages['invalid_choice'], code='invalid_choice', params={'value': pk}
+                )
+        return [clientes[id_cliente] for id_cliente in dict.fromkeys(ids.values())]
+
 
 class ProtocoloForm(forms.ModelForm):
-    clientes = forms.ModelMultipleChoiceField(
-        queryset=Cliente.objects.filter(ativo=True).order_by('nome'),
-        widget=forms.SelectMultiple(attrs={
+    # Clientes e tipos vêm do cache de referências (ver referencias.py)
+    clientes = ClientesField(
+        queryset=Cliente.objects.filter(ativo=True),
+        widget=ClientesAutocompleteWidget(attrs={
             'class': 'form-control select2-clientes',
             'data-placeholder': 'Digite o nome do cliente para buscar...',
             'data-allow-clear': 'true',
+            'data-ajax-url': reverse_lazy('clientes_autocomplete'),
             'multiple': 'multiple'
         }),
         required=True,
@@ -15,8 +100,7 @@ class ProtocoloForm(forms.ModelForm):
         help_text="Digite o nome do cliente para buscar. Você pode selecionar múltiplos clientes."
     )
 
-    tipo_problema = forms.ModelChoiceField(
-        queryset=TipoProblema.objects.filter(ativo=True).order_by('nome'),
+    tipo_problema = TipoProblemaField(
         widget=forms.Select(attrs={
             'class': 'form-control',
             'data-placeholder': 'Selecione o tipo de problema...'
@@ -26,6 +110,10 @@ class ProtocoloForm(forms.ModelForm):
         help_text="Selecione o tipo de problema que melhor descreve a situação."
     )
 
+    def _get_validation_exclusions(self):
+        # O tipo já foi validado contra o cache; a validação do model consultaria o banco de novo
+        return super()._get_validation_exclusions() | {'tipo_problema'}
+
     class Meta:
         model = Protocolo
         fields = ["clientes", "buic_dispositivo", "tipo_problema", "descricao_problema"]
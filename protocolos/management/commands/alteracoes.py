@@ -0,0 +1,53 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from protocolos.api import ParametroInvalido, listar_alteracoes
+from protocolos.paginacao import CursorInvalido
+
+
+class Command(BaseCommand):
+    help = (
+        'Escreve em JSON Lines os protocolos alterados ou removidos depois do token '
+        '--since (todos, sem token), em ordem de alteração, e informa o token da próxima leitura.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Token devolvido pela leitura anterior')
+        parser.add_argument(
+            '--estado',
+            help='Arquivo com o token: lido no início (se existir) e regravado no fim',
+        )
+        parser.add_argument('--fields', help='Campos do protocolo, separados por vírgula (padrão: todos)')
+        parser.add_argument('--lote', type=int, default=1000, help='Alterações lidas por consulta')
+        parser.add_argument('--saida', help='Arquivo de saída (padrão: saída padrão)')
+
+    def handle(self, *args, **options):
+        estado = Path(options['estado']) if options['estado'] else None
+        since = options['since']
+        if since is None and estado and estado.exists():
+            since = estado.read_text(encoding='utf-8').strip() or None
+
+        saida = open(options['saida'], 'w', encoding='utf-8') if options['saida'] else self.stdout
+        total = 0
+        try:
+            while True:
+                params = {'since': since, 'limite': str(options['lote']), 'fields': options['fields']}
+                try:
+                    itens, since, mais = listar_alteracoes(params)
+                except (CursorInvalido, ParametroInvalido) as erro:
+                    raise CommandError(str(erro))
+                for item in itens:
+                    saida.write(json.dumps(item, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+                total += len(itens)
+                if not mais:
+                    break
+        finally:
+            if options['saida']:
+                saida.close()
+
+        if estado:
+            estado.write_text(since, encoding='utf-8')
+        # O token vai para stderr, para não misturar com o JSON Lines
+        self.stderr.write(f'{total} alteração(ões). Próximo --since: {since}', style_func=None)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from protocolos.arquivo import LOTE_ARQUIVO, arquivar, candidatos, dias_padrao
+
+
+class Command(BaseCommand):
+    help = 'Move para o arquivo os protocolos finalizados há mais de --dias dias, em lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=None,
+            help='Idade mínima da finalização, em dias (padrão: PROTOCOLOS_ARQUIVO_DIAS)',
+        )
+        parser.add_argument('--lote', type=int, default=LOTE_ARQUIVO, help='Protocolos movidos por transação')
+        parser.add_argument('--simular', action='store_true', help='Só informa quantos protocolos seriam arquivados')
+
+    def handle(self, *args, **options):
+        dias = dias_padrao() if options['dias'] is None else options['dias']
+        if dias < 0 or options['lote'] < 1:
+            raise CommandError('--dias e --lote devem ser positivos')
+
+        if options['simular']:
+            self.stdout.write(f'{candidatos(dias).count()} protocolo(s) finalizado(s) há mais de {dias} dias')
+            return
+
+        total = arquivar(dias, options['lote'], progresso=lambda n: self.stdout.write(f'{n} protocolos arquivados'))
+        self.stdout.write(self.style.SUCCESS(f'{total} protocolo(s) arquivado(s).'))
@@ -0,0 +1,61 @@
+import json
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from protocolos.benchmark_servidores import SERVIDORES, ServidorIndisponivel, comparar_servidores
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara a vazão das views sob WSGI (gunicorn) e ASGI (uvicorn) com o mesmo '
+        'número de workers, usando o banco configurado. Requer gunicorn e uvicorn instalados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servidores', nargs='+', choices=sorted(SERVIDORES), default=['wsgi', 'asgi'])
+        parser.add_argument('--workers', type=int, default=2, help='Processos de cada servidor')
+        parser.add_argument('--concorrencia', type=int, default=16, help='Requisições simultâneas')
+        parser.add_argument('--duracao', type=float, default=10, help='Segundos de carga por URL')
+        parser.add_argument('--urls', nargs='+', help='Caminhos medidos (padrão: busca, autocomplete, tendências e SLA)')
+        parser.add_argument('--usuario', help='Usuário das requisições (padrão: primeiro superusuário ativo)')
+        parser.add_argument('--saida', help='Arquivo JSON onde gravar os resultados')
+
+    def handle(self, *args, **options):
+        usuarios = User.objects.filter(is_active=True)
+        if options['usuario']:
+            usuario = usuarios.filter(username=options['usuario']).first()
+        else:
+            usuario = usuarios.filter(is_superuser=True).order_by('pk').first()
+        if usuario is None:
+            raise CommandError('Nenhum usuário ativo encontrado; informe --usuario')
+
+        try:
+            resultados = comparar_servidores(
+                usuario,
+                servidores=options['servidores'],
+                workers=options['workers'],
+                concorrencia=options['concorrencia'],
+                duracao_s=options['duracao'],
+                urls=options['urls'],
+                progresso=self._exibir,
+            )
+        except ServidorIndisponivel as erro:
+            raise CommandError(str(erro))
+
+        if options['saida']:
+            dados = {
+                'workers': options['workers'],
+                'concorrencia': options['concorrencia'],
+                'resultados': [resultado.como_dict() for resultado in resultados],
+            }
+            Path(options['saida']).write_text(json.dumps(dados, indent=2, ensure_ascii=False), encoding='utf-8')
+            self.stdout.write(f"Resultados gravados em {options['saida']}")
+
+    def _exibir(self, resultado):
+        estilo = self.style.ERROR if resultado.erros else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f'{resultado.servidor:<5} {resultado.url:<48} {resultado.por_segundo:>8.1f} req/s  '
+            f'mediana {resultado.ms_mediana or 0:>7.1f} ms  p95 {resultado.ms_p95 or 0:>7.1f} ms  '
+            f'{resultado.erros:>4} erros'
+        ))
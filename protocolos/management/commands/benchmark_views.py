@@ -0,0 +1,83 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from protocolos.benchmark import como_json, executar_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede tempo, consultas SQL e memória de cada view sobre bases sintéticas '
+        'de tamanhos crescentes, num banco de testes separado. Falha se algum '
+        'cenário estourar o orçamento configurado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanhos', type=int, nargs='+', default=[1000, 10000], help='Tamanhos das bases (protocolos)')
+        parser.add_argument('--repeticoes', type=int, default=5, help='Requisições medidas por cenário')
+        parser.add_argument('--cenarios', nargs='+', help='Executa apenas os cenários informados')
+        parser.add_argument('--saida', help='Arquivo JSON onde gravar os resultados')
+        parser.add_argument('--comparar', help='Arquivo JSON de uma execução anterior para comparação')
+        parser.add_argument('--sem-latencia', action='store_true', help='Verifica apenas os orçamentos de consultas')
+        parser.add_argument(
+            '--manter-banco',
+            action='store_true',
+            help='Reaproveita o banco de testes entre execuções (evita gerar a base de novo)',
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        nome_original = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['manter_banco']
+        )
+        try:
+            resultados = executar_benchmark(
+                options['tamanhos'],
+                repeticoes=options['repeticoes'],
+                cenarios=options['cenarios'],
+                verificar_latencia=not options['sem_latencia'],
+                progresso=self._exibir,
+            )
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0, keepdb=options['manter_banco'])
+            teardown_test_environment()
+
+        dados = como_json(resultados)
+        if options['saida']:
+            Path(options['saida']).write_text(json.dumps(dados, indent=2, ensure_ascii=False), encoding='utf-8')
+            self.stdout.write(f"Resultados gravados em {options['saida']}")
+        if options['comparar']:
+            self._comparar(dados, json.loads(Path(options['comparar']).read_text(encoding='utf-8')))
+
+        violacoes = [
+            f"{r.cenario} ({r.tamanho}): {', '.join(r.violacoes)}" for r in resultados if r.violacoes
+        ]
+        if violacoes:
+            raise CommandError('Orçamentos estourados:\n' + '\n'.join(violacoes))
+        self.stdout.write(self.style.SUCCESS('Todos os cenários dentro do orçamento.'))
+
+    def _exibir(self, resultado):
+        estilo = self.style.ERROR if resultado.violacoes else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f'{resultado.cenario:<36} {resultado.tamanho:>9} protocolos  '
+            f'{resultado.ms_mediana:>9.1f} ms (p95 {resultado.ms_p95:.1f})  '
+            f'{resultado.consultas:>4} consultas  {resultado.pico_memoria_kb:>9.0f} KB'
+        ))
+
+    def _comparar(self, atual, anterior):
+        anteriores = {(r['cenario'], r['tamanho']): r for r in anterior.get('resultados', [])}
+        self.stdout.write('Comparação com a execução anterior:')
+        for resultado in atual['resultados']:
+            base = anteriores.get((resultado['cenario'], resultado['tamanho']))
+            if not base:
+                continue
+            variacao = (
+                (resultado['ms_mediana'] - base['ms_mediana']) / base['ms_mediana'] * 100
+                if base['ms_mediana'] else 0
+            )
+            self.stdout.write(
+                f"{resultado['cenario']:<36} {resultado['tamanho']:>9}  "
+                f"{variacao:+6.1f}% tempo  {resultado['consultas'] - base['consultas']:+d} consultas"
+            )
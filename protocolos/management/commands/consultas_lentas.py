@@ -0,0 +1,68 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from protocolos.consultas_lentas import ARQUIVO_BACKUPS, arquivo_log
+
+
+class Command(BaseCommand):
+    help = (
+        'Agrupa as consultas lentas registradas (incluindo os arquivos rotacionados) '
+        'por SQL normalizado, das que mais somaram tempo para as que menos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limite', type=int, default=10, help='Quantidade de consultas exibidas')
+        parser.add_argument('--view', help='Considera apenas as consultas desta view')
+        parser.add_argument('--sem-plano', action='store_true', help='Não exibe os planos')
+
+    def handle(self, *args, **options):
+        arquivo = arquivo_log()
+        if arquivo is None:
+            raise CommandError('PROTOCOLOS_CONSULTAS_LENTAS_ARQUIVO não está configurado.')
+
+        agregadas = {}
+        arquivos = [arquivo.with_name(f'{arquivo.name}.{i}') for i in range(ARQUIVO_BACKUPS, 0, -1)] + [arquivo]
+        for caminho in arquivos:
+            if not caminho.exists():
+                continue
+            with caminho.open(encoding='utf-8') as linhas:
+                for linha in linhas:
+                    try:
+                        registro = json.loads(linha)
+                    except ValueError:
+                        continue
+                    if options['view'] and registro.get('view') != options['view']:
+                        continue
+                    agregado = agregadas.setdefault(registro['sql'], {
+                        'ocorrencias': 0, 'ms_total': 0.0, 'ms_max': 0.0, 'views': set(), 'ultimo': None,
+                    })
+                    agregado['ocorrencias'] += 1
+                    agregado['ms_total'] += registro['ms']
+                    agregado['ms_max'] = max(agregado['ms_max'], registro['ms'])
+                    if registro.get('view'):
+                        agregado['views'].add(registro['view'])
+                    # Mantém o plano mais recente, preferindo os com ANALYZE
+                    if registro.get('plano') and (
+                        agregado['ultimo'] is None or registro.get('analyze') or not agregado['ultimo'].get('analyze')
+                    ):
+                        agregado['ultimo'] = registro
+
+        if not agregadas:
+            self.stdout.write('Nenhuma consulta lenta registrada.')
+            return
+
+        ordenadas = sorted(agregadas.items(), key=lambda item: item[1]['ms_total'], reverse=True)
+        for posicao, (sql, agregado) in enumerate(ordenadas[:options['limite']], start=1):
+            self.stdout.write(self.style.WARNING(
+                f"#{posicao} {agregado['ms_total']:.0f} ms no total, {agregado['ocorrencias']} ocorrência(s), "
+                f"máx {agregado['ms_max']:.0f} ms — views: {', '.join(sorted(agregado['views'])) or '-'}"
+            ))
+            self.stdout.write(sql)
+            ultimo = agregado['ultimo']
+            if ultimo and ultimo.get('origem'):
+                self.stdout.write(f"Origem: {ultimo['origem']}")
+            if ultimo and not options['sem_plano']:
+                titulo = 'Plano (EXPLAIN ANALYZE):' if ultimo.get('analyze') else 'Plano:'
+                self.stdout.write(titulo)
+                self.stdout.write(ultimo['plano'])
+            self.stdout.write('')
@@ -0,0 +1,191 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from protocolos.carga import CarregadorProtocolos
+from protocolos.models import Atualizacao, Cliente, Protocolo, TipoProblema
+from protocolos.referencias import invalidar_clientes
+
+TIPOS_PROBLEMAS = [
+    'Equipamento queimado', 'Relé colado', 'Erro de firmware',
+    'Falha de comunicação entre socket e interruptor', 'Perda de produto',
+    'Sensor descalibrado', 'Fonte de alimentação instável', 'Display apagado',
+    'Botão travado', 'Superaquecimento', 'Vazamento', 'Ruído excessivo',
+    'Conector oxidado', 'Bateria viciada', 'Cabo rompido',
+]
+
+PREFIXOS_CLIENTES = ['Mercado', 'Padaria', 'Farmácia', 'Posto', 'Restaurante', 'Loja', 'Distribuidora', 'Hotel']
+NOMES_CLIENTES = ['Central', 'Bom Preço', 'Silva', 'Nova Era', 'Horizonte', 'São José', 'Aurora', 'Primavera', 'Real', 'Estrela']
+
+DESCRICOES = [
+    'Equipamento não liga após queda de energia.',
+    'Cliente relata desligamentos intermitentes durante a madrugada.',
+    'Leitura do sensor fora da faixa esperada.',
+    'Dispositivo não responde aos comandos do painel.',
+    'Após atualização o equipamento reinicia sozinho.',
+    'Produto estragado por falha na refrigeração.',
+]
+
+ATUALIZACOES = [
+    'Contato realizado com o cliente.',
+    'Análise remota dos logs do dispositivo.',
+    'Visita técnica agendada.',
+    'Peça substituída em campo.',
+    'Firmware regravado.',
+    'Aguardando retorno do cliente.',
+    'Teste de funcionamento realizado com sucesso.',
+]
+
+# Distribuição da quantidade de clientes por protocolo
+CLIENTES_POR_PROTOCOLO = [1, 2, 3, 4, 5]
+PESOS_CLIENTES_POR_PROTOCOLO = [70, 20, 7, 2, 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera uma base sintética realista (clientes, protocolos, vínculos e '
+        'histórico de atualizações) para testes de carga e benchmarks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--protocolos', type=int, default=10000, help='Quantidade de protocolos a gerar')
+        parser.add_argument('--clientes', type=int, help='Quantidade de clientes (padrão: 1 para cada 20 protocolos)')
+        parser.add_argument('--usuarios', type=int, default=20, help='Quantidade de agentes criadores')
+        parser.add_argument('--anos', type=float, default=3, help='Período coberto pelas datas de criação')
+        parser.add_argument('--seed', type=int, default=42, help='Semente do gerador (mesma semente, mesma base)')
+        parser.add_argument('--lote', type=int, default=5000, help='Protocolos gravados por transação')
+        parser.add_argument(
+            '--sem-indexacao',
+            action='store_true',
+            help='Não constrói os documentos de busca (rode reindexar_busca depois)',
+        )
+
+    def handle(self, *args, **options):
+        if options['protocolos'] < 1:
+            raise CommandError('--protocolos deve ser positivo')
+
+        self.rng = random.Random(options['seed'])
+        self.prefixo = f"sintetico-{options['seed']}"
+        inicio = time.perf_counter()
+
+        usuarios = self._usuarios(options['usuarios'])
+        tipos, pesos_tipos = self._tipos()
+        total_clientes = options['clientes'] or max(options['protocolos'] // 20, 10)
+        clientes, pesos_clientes = self._clientes(total_clientes)
+        self.stdout.write(
+            f'{len(usuarios)} usuários, {len(tipos)} tipos de problema e {len(clientes)} clientes prontos.'
+        )
+
+        carregador = CarregadorProtocolos(tamanho_lote=options['lote'], indexar=not options['sem_indexacao'])
+        agora = timezone.now()
+        periodo = timedelta(days=365 * options['anos'])
+        # Intervalos exponenciais entre criações: datas crescentes, como na operação real
+        intervalo_medio = periodo.total_seconds() / options['protocolos']
+        data_criacao = agora - periodo
+
+        for indice in range(options['protocolos']):
+            data_criacao += timedelta(seconds=self.rng.expovariate(1 / intervalo_medio))
+            data_criacao = min(data_criacao, agora)
+            protocolo, atualizacoes = self._protocolo(
+                data_criacao, agora, self.rng.choice(usuarios),
+                self.rng.choices(tipos, cum_weights=pesos_tipos)[0], usuarios,
+            )
+            quantidade_clientes = self.rng.choices(CLIENTES_POR_PROTOCOLO, weights=PESOS_CLIENTES_POR_PROTOCOLO)[0]
+            cliente_ids = self.rng.choices(clientes, cum_weights=pesos_clientes, k=quantidade_clientes)
+            carregador.adicionar(protocolo, cliente_ids, atualizacoes)
+
+            if (indice + 1) % (options['lote'] * 10) == 0:
+                self._progresso(indice + 1, options['protocolos'], inicio)
+
+        carregador.finalizar()
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'{carregador.total_protocolos} protocolos, {carregador.total_vinculos} vínculos e '
+            f'{carregador.total_atualizacoes} atualizações gerados em {duracao:.1f}s '
+            f'({carregador.total_protocolos / duracao:.0f} protocolos/s).'
+        ))
+
+    def _progresso(self, feitos, total, inicio):
+        decorrido = time.perf_counter() - inicio
+        self.stdout.write(f'{feitos}/{total} protocolos ({feitos / decorrido:.0f}/s)')
+
+    def _usuarios(self, quantidade):
+        nomes = [f'{self.prefixo}-agente{i:03d}' for i in range(quantidade)]
+        existentes = set(User.objects.filter(username__in=nomes).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(username=nome, email=f'{nome}@example.com', password='!', is_staff=True)
+            for nome in nomes if nome not in existentes
+        ])
+        return list(User.objects.filter(username__in=nomes).order_by('username').values_list('pk', flat=True))
+
+    def _tipos(self):
+        for nome in TIPOS_PROBLEMAS:
+            TipoProblema.objects.get_or_create(nome=nome)
+        tipos = list(TipoProblema.objects.filter(nome__in=TIPOS_PROBLEMAS).order_by('nome').values_list('pk', flat=True))
+        self.rng.shuffle(tipos)
+        # Frequências com cauda longa (Zipf): poucos tipos concentram a maioria
+        pesos = list(accumulate(1 / (posicao ** 1.2) for posicao in range(1, len(tipos) + 1)))
+        return tipos, pesos
+
+    def _clientes(self, quantidade):
+        filtro_email = f'{self.prefixo}-'
+        novos = []
+        for indice in range(quantidade):
+            nome = f'{self.rng.choice(PREFIXOS_CLIENTES)} {self.rng.choice(NOMES_CLIENTES)} {indice}'
+            novos.append(Cliente(nome=nome, email=f'{filtro_email}{indice}@example.com', senha='!'))
+        Cliente.objects.bulk_create(novos, batch_size=5000, ignore_conflicts=True)
+        transaction.on_commit(invalidar_clientes)  # bulk_create não dispara os sinais
+
+        clientes = list(
+            Cliente.objects.filter(email__startswith=filtro_email).order_by('pk').values_list('pk', flat=True)
+        )
+        self.rng.shuffle(clientes)
+        # Alguns clientes abrem muito mais chamados que os demais
+        pesos = list(accumulate(1 / (posicao ** 0.8) for posicao in range(1, len(clientes) + 1)))
+        return clientes, pesos
+
+    def _protocolo(self, data_criacao, agora, criador, tipo_id, usuarios):
+        idade = (agora - data_criacao).days
+        sorteio = self.rng.random()
+        # Protocolos antigos tendem a estar finalizados
+        chance_finalizado = 0.95 if idade > 30 else 0.4
+        if sorteio < chance_finalizado:
+            status = 'finalizado'
+        elif sorteio < chance_finalizado + (1 - chance_finalizado) * 0.6:
+            status = 'em_andamento'
+        else:
+            status = 'aberto'
+
+        quantidade_atualizacoes = 0
+        if status != 'aberto':
+            quantidade_atualizacoes = min(1 + int(self.rng.expovariate(0.6)), 12)
+
+        atualizacoes = []
+        data_hora = data_criacao
+        for _ in range(quantidade_atualizacoes):
+            data_hora = min(data_hora + timedelta(hours=self.rng.expovariate(1 / 18)), agora)
+            atualizacoes.append(Atualizacao(
+                descricao=self.rng.choice(ATUALIZACOES),
+                usuario_id=self.rng.choice(usuarios),
+                data_hora=data_hora,
+            ))
+
+        data_finalizacao = None
+        if status == 'finalizado':
+            data_finalizacao = min(data_hora + timedelta(hours=self.rng.expovariate(1 / 6)), agora)
+
+        protocolo = Protocolo(
+            buic_dispositivo=f'BUIC-{self.rng.randint(1, 999999):06d}',
+            tipo_problema_id=tipo_id,
+            descricao_problema=self.rng.choice(DESCRICOES),
+            status=status,
+            usuario_criador_id=criador,
+            data_criacao=data_criacao,
+            data_finalizacao=data_finalizacao,
+        )
+        return protocolo, atualizacoes
@@ -0,0 +1,226 @@
+import csv
+import json
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from protocolos.busca import NUMERO_MAXIMO
+from protocolos.carga import CarregadorProtocolos, LoteRejeitado
+from protocolos.models import Atualizacao, Cliente, Protocolo, ProtocoloArquivado, TipoProblema
+
+STATUS_VALIDOS = {valor for valor, _ in Protocolo.STATUS_CHOICES}
+
+# Separadores usados nas colunas de múltiplos valores do CSV
+SEPARADOR_CLIENTES = ';'
+SEPARADOR_ATUALIZACOES = '||'
+
+
+class LinhaInvalida(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa protocolos históricos de um arquivo CSV ou JSONL. '
+        'Colunas: numero (opcional), clientes (emails ou nomes), tipo_problema, '
+        'buic_dispositivo, descricao_problema, status, usuario, data_criacao, '
+        'data_finalizacao e atualizacoes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo .csv ou .jsonl')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Formato do arquivo (padrão: pela extensão)')
+        parser.add_argument('--lote', type=int, default=1000, help='Protocolos gravados por transação')
+        parser.add_argument('--usuario', help='Usuário criador para linhas sem a coluna "usuario"')
+        parser.add_argument('--dry-run', action='store_true', help='Valida e simula a importação sem gravar nada')
+        parser.add_argument('--max-erros', type=int, default=20, help='Quantidade de erros exibidos no relatório')
+
+    def handle(self, *args, **options):
+        caminho = Path(options['arquivo'])
+        if not caminho.exists():
+            raise CommandError(f'Arquivo não encontrado: {caminho}')
+        formato = options['formato'] or ('jsonl' if caminho.suffix.lower() in ('.jsonl', '.json') else 'csv')
+
+        self._carregar_mapas()
+        self.usuario_padrao = None
+        if options['usuario']:
+            self.usuario_padrao = self.usuarios.get(options['usuario'])
+            if self.usuario_padrao is None:
+                raise CommandError(f'Usuário não encontrado: {options["usuario"]}')
+
+        self.carregador = carregador = CarregadorProtocolos(tamanho_lote=options['lote'])
+        erros = []
+        total_erros = 0
+        inicio = time.perf_counter()
+
+        def rejeitar(mensagem, quantidade=1):
+            nonlocal total_erros
+            total_erros += quantidade
+            if len(erros) < options['max_erros']:
+                erros.append(mensagem)
+
+        # Cada lote tem a sua transação. No dry-run tudo roda dentro de uma
+        # transação desfeita ao final, então as restrições do banco também são
+        # verificadas
+        with transaction.atomic() if options['dry_run'] else nullcontext():
+            with caminho.open(encoding='utf-8-sig', newline='') as arquivo:
+                for numero_linha, registro in self._registros(arquivo, formato):
+                    try:
+                        carregador.adicionar(*self._converter(registro), referencia=numero_linha)
+                    except LinhaInvalida as exc:
+                        rejeitar(f'Linha {numero_linha}: {exc}')
+                    except LoteRejeitado as exc:
+                        rejeitar(self._lote_rejeitado(exc), len(exc.referencias))
+            try:
+                carregador.finalizar()
+            except LoteRejeitado as exc:
+                rejeitar(self._lote_rejeitado(exc), len(exc.referencias))
+            if options['dry_run']:
+                transaction.set_rollback(True)
+
+        duracao = time.perf_counter() - inicio
+        self._relatorio(carregador, erros, total_erros, duracao, options['dry_run'])
+
+    def _carregar_mapas(self):
+        """Mapas em memória para resolver nomes sem consultar o banco por linha"""
+        self.tipos = {nome.lower(): pk for pk, nome in TipoProblema.objects.values_list('pk', 'nome')}
+        self.clientes_por_email = {}
+        self.clientes_por_nome = {}
+        for pk, nome, email in Cliente.objects.values_list('pk', 'nome', 'email').iterator():
+            self.clientes_por_email[email.lower()] = pk
+            self.clientes_por_nome.setdefault(nome.lower(), pk)
+        self.usuarios = {usuario.username: usuario for usuario in User.objects.all()}
+        # Números já usados (inclusive no arquivo de protocolos) e os vistos no arquivo importado
+        self.numeros_existentes = set()
+        for model in (Protocolo, ProtocoloArquivado):
+            self.numeros_existentes.update(
+                model.objects.exclude(numero=None).values_list('numero', flat=True).iterator()
+            )
+        self.numeros_vistos = set()
+
+    def _lote_rejeitado(self, exc):
+        linhas = [linha for linha in exc.referencias if linha is not None]
+        intervalo = f'Linhas {min(linhas)} a {max(linhas)}' if linhas else 'Lote'
+        return f'{intervalo}: lote não gravado, recusado pelo banco ({exc.erro})'
+
+    def _registros(self, arquivo, formato):
+        if formato == 'csv':
+            # A linha 1 é o cabeçalho
+            for numero_linha, registro in enumerate(csv.DictReader(arquivo), start=2):
+                yield numero_linha, registro
+            return
+
+        for numero_linha, linha in enumerate(arquivo, start=1):
+            if not linha.strip():
+                continue
+            try:
+                yield numero_linha, json.loads(linha)
+            except json.JSONDecodeError as exc:
+                raise CommandError(f'Linha {numero_linha}: JSON inválido ({exc})')
+
+    def _lista(self, valor, separador):
+        if valor is None:
+            return []
+        if isinstance(valor, list):
+            return valor
+        return [parte.strip() for parte in str(valor).split(separador) if parte.strip()]
+
+    def _data(self, valor, campo):
+        if not valor:
+            return None
+        data = parse_datetime(str(valor))
+        if data is None:
+            raise LinhaInvalida(f'data inválida em "{campo}": {valor}')
+        if timezone.is_naive(data):
+            data = timezone.make_aware(data)
+        return data
+
+    def _cliente(self, identificador):
+        chave = identificador.strip().lower()
+        pk = self.clientes_por_email.get(chave) or self.clientes_por_nome.get(chave)
+        if pk is None:
+            raise LinhaInvalida(f'cliente não encontrado: {identificador}')
+        return pk
+
+    def _converter(self, registro):
+        if not isinstance(registro, dict):
+            # JSONL com uma lista, um número ou um texto na linha
+            raise LinhaInvalida('a linha deve ser um objeto JSON')
+
+        tipo_id = self.tipos.get(str(registro.get('tipo_problema') or '').strip().lower())
+        if tipo_id is None:
+            raise LinhaInvalida(f'tipo de problema não encontrado: {registro.get("tipo_problema")}')
+
+        usuario = self.usuarios.get(registro.get('usuario') or '') or self.usuario_padrao
+        if usuario is None:
+            raise LinhaInvalida(f'usuário não encontrado: {registro.get("usuario")}')
+
+        status = registro.get('status') or 'aberto'
+        if status not in STATUS_VALIDOS:
+            raise LinhaInvalida(f'status inválido: {status}')
+
+        if not registro.get('buic_dispositivo') or not registro.get('descricao_problema'):
+            raise LinhaInvalida('buic_dispositivo e descricao_problema são obrigatórios')
+
+        numero = registro.get('numero')
+        try:
+            numero = int(numero) if numero not in (None, '') else None
+        except (TypeError, ValueError):
+            raise LinhaInvalida(f'número inválido: {numero}')
+        if numero is not None and not 1 <= numero <= NUMERO_MAXIMO:
+            raise LinhaInvalida(f'número fora do intervalo (1 a {NUMERO_MAXIMO}): {numero}')
+        if numero is not None:
+            if numero in self.numeros_existentes or self.carregador.numero_reservado(numero):
+                raise LinhaInvalida(f'número já existe: {numero}')
+            if numero in self.numeros_vistos:
+                raise LinhaInvalida(f'número repetido no arquivo: {numero}')
+
+        cliente_ids = [self._cliente(c) for c in self._lista(registro.get('clientes'), SEPARADOR_CLIENTES)]
+        if not cliente_ids:
+            raise LinhaInvalida('o protocolo precisa de ao menos um cliente')
+
+        protocolo = Protocolo(
+            numero=numero,
+            buic_dispositivo=registro['buic_dispositivo'],
+            tipo_problema_id=tipo_id,
+            descricao_problema=registro['descricao_problema'],
+            status=status,
+            usuario_criador=usuario,
+            data_criacao=self._data(registro.get('data_criacao'), 'data_criacao'),
+            data_finalizacao=self._data(registro.get('data_finalizacao'), 'data_finalizacao'),
+        )
+
+        atualizacoes = []
+        for item in self._lista(registro.get('atualizacoes'), SEPARADOR_ATUALIZACOES):
+            if isinstance(item, dict):
+                autor = self.usuarios.get(item.get('usuario') or '') or usuario
+                atualizacoes.append(Atualizacao(
+                    descricao=item.get('descricao', ''),
+                    usuario=autor,
+                    data_hora=self._data(item.get('data_hora'), 'atualizacoes.data_hora'),
+                ))
+            else:
+                atualizacoes.append(Atualizacao(descricao=item, usuario=usuario))
+
+        if numero is not None:
+            self.numeros_vistos.add(numero)
+        return protocolo, cliente_ids, atualizacoes
+
+    def _relatorio(self, carregador, erros, total_erros, duracao, dry_run):
+        for erro in erros:
+            self.stdout.write(self.style.WARNING(erro))
+        if total_erros > len(erros):
+            self.stdout.write(self.style.WARNING(f'... e mais {total_erros - len(erros)} erro(s)'))
+
+        linhas_por_segundo = carregador.total_protocolos / duracao if duracao else 0
+        prefixo = '[dry-run] Nada foi gravado. ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefixo}{carregador.total_protocolos} protocolos, {carregador.total_vinculos} vínculos '
+            f'com clientes e {carregador.total_atualizacoes} atualizações em {duracao:.1f}s '
+            f'({linhas_por_segundo:.0f} linhas/s); {total_erros} linha(s) rejeitada(s).'
+        ))
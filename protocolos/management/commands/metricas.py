@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand
+from protocolos.metricas import diretorio_retratos, formatar_texto, limpar_retratos, metricas_agregadas
+
+
+class Command(BaseCommand):
+    help = (
+        'Mostra as métricas por view (latência, consultas SQL e tamanho das respostas) '
+        'somando os retratos gravados pelos processos do servidor.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--formato', choices=['tabela', 'texto', 'json'], default='tabela',
+            help='tabela (resumo), texto (formato do Prometheus) ou json',
+        )
+        parser.add_argument('--ordenar', choices=['ms', 'consultas', 'requisicoes'], default='ms',
+                            help='Critério de ordenação da tabela (total acumulado)')
+        parser.add_argument('--limpar', action='store_true', help='Apaga os retratos depois de exibir')
+
+    def handle(self, *args, **options):
+        views = metricas_agregadas()
+        if options['formato'] == 'json':
+            self.stdout.write(json.dumps(views, indent=2, ensure_ascii=False))
+        elif options['formato'] == 'texto':
+            self.stdout.write(formatar_texto(views), ending='')
+        elif not views:
+            self.stdout.write(f'Nenhuma métrica registrada em {diretorio_retratos()}.')
+        else:
+            self._tabela(views, options['ordenar'])
+
+        if options['limpar']:
+            limpar_retratos()
+            self.stdout.write(self.style.SUCCESS('Retratos de métricas apagados.'))
+
+    def _tabela(self, views, ordenar):
+        chave = {'ms': 'ms_total', 'consultas': 'consultas_total', 'requisicoes': 'requisicoes'}[ordenar]
+        self.stdout.write(
+            f"{'view':<45} {'req':>8} {'ms médio':>9} {'ms máx':>9} "
+            f"{'SQL/req':>8} {'SQL máx':>8} {'SQL ms/req':>10} {'KB/req':>8} {'5xx':>5}"
+        )
+        for view, agregado in sorted(views.items(), key=lambda item: item[1][chave], reverse=True):
+            requisicoes = agregado['requisicoes'] or 1
+            self.stdout.write(
+                f"{view[:45]:<45} {agregado['requisicoes']:>8} "
+                f"{agregado['ms_total'] / requisicoes:>9.1f} {agregado['ms_max']:>9.1f} "
+                f"{agregado['consultas_total'] / requisicoes:>8.1f} {agregado['consultas_max']:>8} "
+                f"{agregado['sql_ms_total'] / requisicoes:>10.2f} "
+                f"{agregado['bytes_total'] / requisicoes / 1024:>8.1f} {agregado['erros']:>5}"
+            )
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from protocolos.perfis import apagar_perfil, diretorio_perfis, listar_perfis, resumo
+
+
+class Command(BaseCommand):
+    help = (
+        'Lista os perfis cProfile gravados pelo PerfilamentoMiddleware ou mostra '
+        'as funções mais custosas de um perfil.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('nome', nargs='?', help='Perfil a resumir (padrão: lista os perfis)')
+        parser.add_argument('--view', help='Lista apenas os perfis desta view')
+        parser.add_argument('--ultimo', action='store_true', help='Resume o perfil mais recente')
+        parser.add_argument(
+            '--ordenar', choices=['cumulative', 'tottime', 'ncalls'], default='cumulative',
+            help='Critério do resumo (padrão: tempo acumulado)',
+        )
+        parser.add_argument('--top', type=int, default=25, help='Funções exibidas no resumo')
+        parser.add_argument('--limpar', action='store_true', help='Apaga os perfis listados')
+
+    def handle(self, *args, **options):
+        perfis = listar_perfis()
+        if options['view']:
+            perfis = [perfil for perfil in perfis if perfil.get('view') == options['view']]
+
+        nome = options['nome']
+        if options['ultimo']:
+            if not perfis:
+                raise CommandError('Nenhum perfil gravado.')
+            nome = perfis[0]['nome']
+        if nome:
+            if not (diretorio_perfis() / f'{nome}.prof').exists():
+                raise CommandError(f'Perfil não encontrado: {nome}')
+            self.stdout.write(resumo(nome, ordenar=options['ordenar'], limite=options['top']))
+            return
+
+        if not perfis:
+            self.stdout.write(f'Nenhum perfil gravado em {diretorio_perfis()}.')
+            return
+        for perfil in perfis:
+            quando = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(perfil.get('quando', 0)))
+            self.stdout.write(
+                f"{perfil['nome']}  {quando}  {perfil.get('metodo', '')} {perfil.get('caminho', '')}  "
+                f"{perfil.get('status')}  {perfil.get('ms', 0):.1f} ms  {perfil.get('consultas', 0)} consultas  "
+                f"({perfil.get('usuario') or 'anônimo'})"
+            )
+        if options['limpar']:
+            for perfil in perfis:
+                apagar_perfil(perfil['nome'])
+            self.stdout.write(self.style.SUCCESS(f'{len(perfis)} perfil(s) apagado(s).'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from protocolos.estatisticas import reconstruir_estatisticas
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstrói as estatísticas diárias (abertos, em andamento e finalizados por '
+        'dia e tipo de problema) a partir dos protocolos e atualizações existentes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Reconstrói apenas a partir desta data (AAAA-MM-DD)')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            desde = parse_date(options['desde'])
+            if desde is None:
+                raise CommandError(f'Data inválida: {options["desde"]}')
+
+        linhas = reconstruir_estatisticas(desde)
+        self.stdout.write(self.style.SUCCESS(f'Estatísticas diárias reconstruídas ({linhas} linhas).'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from protocolos.busca import LOTE_INDEXACAO, criar_estruturas_busca, indexar_protocolos
+from protocolos.models import DocumentoBusca, Protocolo
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói os documentos de busca de todos os protocolos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--apenas-faltantes',
+            action='store_true',
+            help='Indexa somente protocolos que ainda não têm documento de busca.',
+        )
+
+    def handle(self, *args, **options):
+        criar_estruturas_busca()
+
+        protocolos = Protocolo.objects.order_by('pk')
+        if options['apenas_faltantes']:
+            protocolos = protocolos.exclude(pk__in=DocumentoBusca.objects.values('protocolo_id'))
+
+        ids = list(protocolos.values_list('pk', flat=True))
+        for inicio in range(0, len(ids), LOTE_INDEXACAO):
+            indexar_protocolos(ids[inicio:inicio + LOTE_INDEXACAO])
+            self.stdout.write(f'{min(inicio + LOTE_INDEXACAO, len(ids))}/{len(ids)} protocolos indexados')
+
+        self.stdout.write(self.style.SUCCESS('Documentos de busca reconstruídos com sucesso!'))
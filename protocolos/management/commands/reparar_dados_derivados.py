@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from protocolos.derivados import divergentes, recalcular
+from protocolos.models import Protocolo
+from protocolos.versao import avancar_versao
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula os campos derivados dos protocolos (última atualização, total de '
+        'atualizações e cliente principal) a partir das atualizações e clientes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000, help='Protocolos recalculados por comando UPDATE')
+        parser.add_argument(
+            '--verificar',
+            action='store_true',
+            help='Apenas lista quantos protocolos estão divergentes, sem alterar nada',
+        )
+
+    def handle(self, *args, **options):
+        ids = list(Protocolo.objects.order_by('pk').values_list('pk', flat=True))
+        total_divergentes = 0
+        for inicio in range(0, len(ids), options['lote']):
+            bloco = ids[inicio:inicio + options['lote']]
+            faixa = Protocolo.objects.filter(pk__gte=bloco[0], pk__lte=bloco[-1])
+            if options['verificar']:
+                total_divergentes += len(divergentes(faixa))
+            else:
+                recalcular(faixa)
+                self.stdout.write(f'{inicio + len(bloco)}/{len(ids)} protocolos recalculados')
+
+        if options['verificar']:
+            self.stdout.write(f'{total_divergentes} protocolo(s) com campos derivados divergentes.')
+        else:
+            avancar_versao()
+            self.stdout.write(self.style.SUCCESS('Campos derivados recalculados com sucesso!'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from protocolos.arquivo import LOTE_ARQUIVO, restaurar
+from protocolos.models import ProtocoloArquivado
+
+
+class Command(BaseCommand):
+    help = 'Devolve protocolos do arquivo às tabelas de uso diário.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('numeros', nargs='*', type=int, help='Números dos protocolos arquivados')
+        parser.add_argument('--todos', action='store_true', help='Restaura todo o arquivo')
+        parser.add_argument('--lote', type=int, default=LOTE_ARQUIVO, help='Protocolos movidos por transação')
+
+    def handle(self, *args, **options):
+        if not options['numeros'] and not options['todos']:
+            raise CommandError('Informe os números dos protocolos ou --todos')
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser positivo')
+
+        arquivados = ProtocoloArquivado.objects.all()
+        if not options['todos']:
+            arquivados = arquivados.filter(numero__in=options['numeros'])
+            faltantes = set(options['numeros']) - set(arquivados.values_list('numero', flat=True))
+            if faltantes:
+                self.stderr.write(f"Não arquivados: {', '.join(map(str, sorted(faltantes)))}")
+
+        total = restaurar(arquivados, options['lote'],
+                          progresso=lambda n: self.stdout.write(f'{n} protocolos restaurados'))
+        self.stdout.write(self.style.SUCCESS(f'{total} protocolo(s) restaurado(s).'))
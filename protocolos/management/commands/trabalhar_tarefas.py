@@ -0,0 +1,61 @@
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from protocolos.tarefas import identificador_trabalhador, limpar, trabalhar
+
+
+class Command(BaseCommand):
+    help = (
+        'Executa as tarefas em segundo plano (exportações e relatórios) da fila no banco. '
+        'Vários processos podem rodar ao mesmo tempo; cada um usa --threads trabalhadores.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Trabalhadores neste processo')
+        parser.add_argument(
+            '--intervalo', type=float, default=2.0, help='Segundos entre consultas quando a fila está vazia'
+        )
+        parser.add_argument('--esvaziar', action='store_true', help='Sai quando não houver mais tarefas disponíveis')
+        parser.add_argument(
+            '--sem-limpeza', action='store_true',
+            help='Não apaga as tarefas terminadas há mais de PROTOCOLOS_TAREFAS_RETENCAO_DIAS dias',
+        )
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1:
+            raise CommandError('--threads deve ser positivo')
+        if not options['sem_limpeza']:
+            apagadas = limpar()
+            if apagadas:
+                self.stdout.write(f'{apagadas} tarefa(s) antiga(s) apagada(s)')
+
+        parar = threading.Event()
+        argumentos = {'parar': parar, 'intervalo': options['intervalo'], 'esvaziar': options['esvaziar']}
+        if options['threads'] == 1:
+            # Sem thread extra: a tarefa roda na conexão do próprio comando
+            try:
+                total = trabalhar(identificador_trabalhador(), **argumentos)
+            except KeyboardInterrupt:
+                return
+            self.stdout.write(self.style.SUCCESS(f'{total} tarefa(s) executada(s).'))
+            return
+
+        totais = [0] * options['threads']
+
+        def laco(indice):
+            totais[indice] = trabalhar(identificador_trabalhador(indice), **argumentos)
+
+        threads = [threading.Thread(target=laco, args=(indice,), daemon=True) for indice in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            # As tarefas em andamento terminam; nenhuma nova é reservada
+            self.stdout.write('Encerrando após as tarefas em andamento...')
+            parar.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(self.style.SUCCESS(f'{sum(totais)} tarefa(s) executada(s).'))
@@ -0,0 +1,196 @@
+"""
+Métricas de requisições por view.
+
+O ``MetricasMiddleware`` registra, para cada nome de URL, a latência (em
+histograma), a quantidade e o tempo das consultas SQL e o tamanho da resposta.
+Os agregados ficam em memória no processo; de tempos em tempos cada processo
+grava um retrato em ``PROTOCOLOS_METRICAS_DIR`` (um arquivo JSON por PID), que
+o comando ``metricas`` soma para mostrar a visão de todos os workers. Retratos
+não regravados há mais de ``PROTOCOLOS_METRICAS_MAX_DIAS`` dias (processos que
+já terminaram) são apagados na leitura.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+# Limites superiores (ms) das faixas do histograma de latência
+FAIXAS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+NAO_RESOLVIDA = '<nao_resolvida>'
+
+
+def _novo_agregado():
+    return {
+        'requisicoes': 0,
+        'erros': 0,
+        'ms_total': 0.0,
+        'ms_max': 0.0,
+        'faixas': [0] * (len(FAIXAS_MS) + 1),
+        'consultas_total': 0,
+        'consultas_max': 0,
+        'sql_ms_total': 0.0,
+        'bytes_total': 0,
+    }
+
+
+class RegistroMetricas:
+    """Agregados por view, seguros para uso por várias threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self.iniciado_em = time.time()
+
+    def registrar(self, view, ms, consultas, sql_ms, tamanho, status):
+        faixa = next((i for i, limite in enumerate(FAIXAS_MS) if ms <= limite), len(FAIXAS_MS))
+        with self._lock:
+            agregado = self._views.get(view)
+            if agregado is None:
+                agregado = self._views[view] = _novo_agregado()
+            agregado['requisicoes'] += 1
+            agregado['erros'] += status >= 500
+            agregado['ms_total'] += ms
+            agregado['ms_max'] = max(agregado['ms_max'], ms)
+            agregado['faixas'][faixa] += 1
+            agregado['consultas_total'] += consultas
+            agregado['consultas_max'] = max(agregado['consultas_max'], consultas)
+            agregado['sql_ms_total'] += sql_ms
+            agregado['bytes_total'] += tamanho
+
+    def retrato(self):
+        with self._lock:
+            return {
+                view: dict(agregado, faixas=list(agregado['faixas']))
+                for view, agregado in self._views.items()
+            }
+
+    def limpar(self):
+        with self._lock:
+            self._views.clear()
+
+
+registro = RegistroMetricas()
+
+
+def diretorio_retratos():
+    diretorio = getattr(settings, 'PROTOCOLOS_METRICAS_DIR', None)
+    return Path(diretorio or os.path.join(tempfile.gettempdir(), 'protocolos-metricas'))
+
+
+def intervalo_retrato():
+    return getattr(settings, 'PROTOCOLOS_METRICAS_INTERVALO', 60)
+
+
+def idade_maxima_retrato():
+    """Segundos sem regravação após os quais um retrato é descartado (``None``: nunca)"""
+    max_dias = getattr(settings, 'PROTOCOLOS_METRICAS_MAX_DIAS', 7)
+    return max_dias * 86400 if max_dias else None
+
+
+def gravar_retrato():
+    """Grava os agregados deste processo (substituição atômica do arquivo)"""
+    diretorio = diretorio_retratos()
+    diretorio.mkdir(parents=True, exist_ok=True)
+    destino = diretorio / f'metricas-{os.getpid()}.json'
+    temporario = destino.with_suffix('.tmp')
+    temporario.write_text(json.dumps({
+        'pid': os.getpid(),
+        'iniciado_em': registro.iniciado_em,
+        'gravado_em': time.time(),
+        'views': registro.retrato(),
+    }))
+    os.replace(temporario, destino)
+
+
+def somar(*retratos):
+    """Soma retratos de vários processos numa única visão por view"""
+    total = {}
+    for retrato in retratos:
+        for view, agregado in retrato.items():
+            soma = total.setdefault(view, _novo_agregado())
+            for chave, valor in agregado.items():
+                if chave == 'faixas':
+                    soma['faixas'] = [a + b for a, b in zip(soma['faixas'], valor)]
+                elif chave.endswith('_max'):
+                    soma[chave] = max(soma[chave], valor)
+                else:
+                    soma[chave] += valor
+    return total
+
+
+def ler_retratos():
+    """Retratos gravados pelos outros processos; apaga os vencidos"""
+    retratos = []
+    diretorio = diretorio_retratos()
+    if diretorio.is_dir():
+        proprio = f'metricas-{os.getpid()}.json'
+        idade_maxima = idade_maxima_retrato()
+        limite = time.time() - idade_maxima if idade_maxima else None
+        for arquivo in sorted(diretorio.glob('metricas-*.json')):
+            if arquivo.name == proprio:
+                continue
+            try:
+                if limite is not None and arquivo.stat().st_mtime < limite:
+                    # O processo terminou (ou parou de gravar) há muito tempo
+                    arquivo.unlink(missing_ok=True)
+                    continue
+                retratos.append(json.loads(arquivo.read_text())['views'])
+            except (OSError, ValueError, KeyError):
+                continue
+    return retratos
+
+
+def metricas_agregadas():
+    """Agregados deste processo (ao vivo) somados aos retratos dos demais"""
+    return somar(registro.retrato(), *ler_retratos())
+
+
+def limpar_retratos():
+    registro.limpar()
+    diretorio = diretorio_retratos()
+    if diretorio.is_dir():
+        for arquivo in diretorio.glob('metricas-*.json'):
+            arquivo.unlink(missing_ok=True)
+
+
+def _rotulo(view):
+    return view.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def formatar_texto(views):
+    """Formato de exposição de texto do Prometheus"""
+    linhas = [
+        '# HELP protocolos_requisicao_ms Latência das requisições em milissegundos.',
+        '# TYPE protocolos_requisicao_ms histogram',
+    ]
+    for view in sorted(views):
+        agregado = views[view]
+        rotulo = _rotulo(view)
+        acumulado = 0
+        for limite, quantidade in zip(FAIXAS_MS + ('+Inf',), agregado['faixas']):
+            acumulado += quantidade
+            linhas.append(f'protocolos_requisicao_ms_bucket{{view="{rotulo}",le="{limite}"}} {acumulado}')
+        linhas.append(f'protocolos_requisicao_ms_sum{{view="{rotulo}"}} {agregado["ms_total"]:.3f}')
+        linhas.append(f'protocolos_requisicao_ms_count{{view="{rotulo}"}} {agregado["requisicoes"]}')
+
+    contadores = [
+        ('protocolos_requisicao_erros_total', 'erros', 'counter', 'Respostas com status 5xx.'),
+        ('protocolos_requisicao_ms_max', 'ms_max', 'gauge', 'Maior latência observada.'),
+        ('protocolos_sql_consultas_total', 'consultas_total', 'counter', 'Consultas SQL executadas.'),
+        ('protocolos_sql_consultas_max', 'consultas_max', 'gauge', 'Maior número de consultas numa requisição.'),
+        ('protocolos_sql_ms_total', 'sql_ms_total', 'counter', 'Tempo gasto em SQL em milissegundos.'),
+        ('protocolos_resposta_bytes_total', 'bytes_total', 'counter', 'Bytes enviados nas respostas.'),
+    ]
+    for nome, chave, tipo, ajuda in contadores:
+        linhas.append(f'# HELP {nome} {ajuda}')
+        linhas.append(f'# TYPE {nome} {tipo}')
+        for view in sorted(views):
+            valor = views[view][chave]
+            valor = f'{valor:.3f}' if isinstance(valor, float) else valor
+            linhas.append(f'{nome}{{view="{_rotulo(view)}"}} {valor}')
+    return '\n'.join(linhas) + '\n'
@@ -0,0 +1,250 @@
+import cProfile
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metricas import NAO_RESOLVIDA, gravar_retrato, intervalo_retrato, registro
+from .perfis import gravar_perfil
+
+# Nome da view em execução, usado no registro de consultas lentas
+view_atual = ContextVar('view_atual', default=None)
+
+
+def _nome_view(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    return resolver_match.view_name if resolver_match else NAO_RESOLVIDA
+
+
+# Contadores de SQL ativos no contexto atual. Por ser uma ContextVar, o contexto
+# acompanha a requisição também nas threads do ``sync_to_async`` (views async).
+_contadores_sql = ContextVar('contadores_sql', default=())
+
+
+def _contar_sql(execute, sql, params, many, context):
+    contadores = _contadores_sql.get()
+    if not contadores:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000
+        for contador in contadores:
+            contador.somar(ms)
+
+
+def instalar_contador_sql(sender, connection, **kwargs):
+    """Handler de ``connection_created`` (ver ``apps.py``)"""
+    if _contar_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_contar_sql)
+
+
+class ContadorSQL:
+    """Quantidade de consultas e tempo gasto nelas enquanto ``medindo()`` está ativo"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.ms = 0.0
+        self._lock = threading.Lock()
+
+    def somar(self, ms):
+        with self._lock:
+            self.consultas += 1
+            self.ms += ms
+
+    @contextmanager
+    def medindo(self):
+        token = _contadores_sql.set(_contadores_sql.get() + (self,))
+        try:
+            yield self
+        finally:
+            _contadores_sql.reset(token)
+
+
+class MetricasMiddleware:
+    """
+    Mede latência, consultas SQL e tamanho da resposta de cada requisição,
+    agregando por nome de URL (ver ``protocolos.metricas``).
+
+    Deve ficar no início de ``MIDDLEWARE`` para cobrir os demais middlewares.
+    Em respostas em streaming a medição termina quando o conteúdo é consumido,
+    então as consultas feitas durante a geração (ex.: exportação CSV) entram
+    na conta. Funciona tanto no WSGI quanto no ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._lock_retrato = threading.Lock()
+        self._ultimo_retrato = time.monotonic()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        contador = ContadorSQL()
+        inicio = time.perf_counter()
+        with contador.medindo():
+            try:
+                response = self.get_response(request)
+            finally:
+                view_atual.set(None)
+        return self._concluir(request, response, contador, inicio)
+
+    async def __acall__(self, request):
+        contador = ContadorSQL()
+        inicio = time.perf_counter()
+        with contador.medindo():
+            try:
+                response = await self.get_response(request)
+            finally:
+                view_atual.set(None)
+        return self._concluir(request, response, contador, inicio)
+
+    def _concluir(self, request, response, contador, inicio):
+        view = _nome_view(request)
+        if response.streaming and not response.is_async:
+            response.streaming_content = self._medir_streaming(
+                response.streaming_content, contador, inicio, view, response.status_code
+            )
+        else:
+            tamanho = 0 if response.streaming else len(response.content)
+            self._registrar(view, inicio, contador, tamanho, response.status_code)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_atual.set(_nome_view(request))
+
+    def _medir_streaming(self, conteudo, contador, inicio, view, status):
+        tamanho = 0
+        try:
+            with contador.medindo():
+                view_atual.set(view)
+                for parte in conteudo:
+                    tamanho += len(parte)
+                    yield parte
+        finally:
+            view_atual.set(None)
+            self._registrar(view, inicio, contador, tamanho, status)
+
+    def _registrar(self, view, inicio, contador, tamanho, status):
+        ms = (time.perf_counter() - inicio) * 1000
+        registro.registrar(view, ms, contador.consultas, contador.ms, tamanho, status)
+
+        intervalo = intervalo_retrato()
+        if intervalo is None or time.monotonic() - self._ultimo_retrato < intervalo:
+            return
+        # Só uma thread grava; as outras seguem sem esperar
+        if self._lock_retrato.acquire(blocking=False):
+            try:
+                self._ultimo_retrato = time.monotonic()
+                gravar_retrato()
+            except OSError:
+                pass
+            finally:
+                self._lock_retrato.release()
+
+
+class PerfilamentoMiddleware:
+    """
+    Executa a requisição sob cProfile (ver ``protocolos.perfis``).
+
+    Fica depois do ``AuthenticationMiddleware``, que identifica o staff. Só um
+    perfil roda por vez no processo; pedidos concorrentes seguem sem perfil.
+    O nome do perfil gravado volta no cabeçalho ``X-Perfil``. No ASGI o
+    cProfile só enxerga a thread do event loop; o que as views async executam
+    via ``sync_to_async`` aparece apenas como espera.
+    """
+
+    PARAMETRO = '_perfil'
+    CABECALHO = 'HTTP_X_PERFIL'
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._lock = threading.Lock()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        usuario = getattr(request, 'user', None)
+        if not self._deve_perfilar(request, usuario) or not self._lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            profiler, contador = cProfile.Profile(), ContadorSQL()
+            inicio = time.perf_counter()
+            with contador.medindo():
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+            return self._gravar(request, response, usuario, profiler, contador, inicio)
+        finally:
+            self._lock.release()
+
+    async def __acall__(self, request):
+        usuario = None
+        if self._pedido(request):
+            usuario = await request.auser()
+        if not self._deve_perfilar(request, usuario) or not self._lock.acquire(blocking=False):
+            return await self.get_response(request)
+        try:
+            if usuario is None and hasattr(request, 'auser'):
+                usuario = await request.auser()
+            profiler, contador = cProfile.Profile(), ContadorSQL()
+            inicio = time.perf_counter()
+            with contador.medindo():
+                profiler.enable()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    profiler.disable()
+            return self._gravar(request, response, usuario, profiler, contador, inicio)
+        finally:
+            self._lock.release()
+
+    def _pedido(self, request):
+        return self.PARAMETRO in request.GET or request.META.get(self.CABECALHO) == '1'
+
+    def _deve_perfilar(self, request, usuario):
+        if self._pedido(request):
+            # O parâmetro não chega às views (o changelist do admin o trataria como filtro)
+            if self.PARAMETRO in request.GET:
+                request.GET = request.GET.copy()
+                del request.GET[self.PARAMETRO]
+            return bool(usuario and usuario.is_staff)
+        amostra = getattr(settings, 'PROTOCOLOS_PERFIL_AMOSTRA', 0.0)
+        return bool(amostra) and random.random() < amostra
+
+    def _gravar(self, request, response, usuario, profiler, contador, inicio):
+        ms = (time.perf_counter() - inicio) * 1000
+        try:
+            nome = gravar_perfil(profiler, {
+                'quando': time.time(),
+                'metodo': request.method,
+                'caminho': request.get_full_path(),
+                'view': _nome_view(request),
+                'usuario': usuario.get_username() if usuario and usuario.is_authenticated else None,
+                'status': response.status_code,
+                'ms': round(ms, 2),
+                'consultas': contador.consultas,
+                'sql_ms': round(contador.ms, 2),
+                'streaming': response.streaming,
+            })
+        except OSError:
+            return response
+        response['X-Perfil'] = nome
+        return response
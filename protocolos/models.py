@@ -2,6 +2,19 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+class Sequencia(models.Model):
+    """Contador nomeado usado para gerar números sem varrer as tabelas de dados"""
+    nome = models.CharField(max_length=50, unique=True)
+    valor = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.nome} = {self.valor}"
+
+    class Meta:
+        verbose_name = "Sequência"
+        verbose_name_plural = "Sequências"
+
+
 class TipoProblema(models.Model):
     nome = models.CharField(max_length=100, unique=True)
     descricao = models.TextField(blank=True, null=True)
@@ -30,6 +43,10 @@ class Cliente(models.Model):
     class Meta:
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
+        indexes = [
+            # Ordenação e paginação por chave do autocomplete
+            models.Index(fields=['nome', 'id'], name='cliente_nome_id_idx'),
+        ]
 
 
 class Protocolo(models.Model):
@@ -49,26 +66,64 @@ class Protocolo(models.Model):
     data_criacao = models.DateTimeField(auto_now_add=True)
     data_finalizacao = models.DateTimeField(null=True, blank=True)
 
+    # Cópias mantidas por protocolos.derivados, para as listagens não
+    # consultarem atualizações e clientes linha a linha
+    ultima_atualizacao_em = models.DateTimeField(null=True, blank=True, editable=False)
+    ultima_atualizacao_resumo = models.CharField(max_length=255, blank=True, default='', editable=False)
+    total_atualizacoes = models.PositiveIntegerField(default=0, editable=False)
+    cliente_principal_nome = models.CharField(max_length=255, blank=True, default='', editable=False)
+
+    CAMPOS_DERIVADOS = (
+        'ultima_atualizacao_em', 'ultima_atualizacao_resumo', 'total_atualizacoes', 'cliente_principal_nome',
+    )
+
+    # Marcas de alteração mantidas por protocolos.alteracoes, para o feed incremental
+    versao_alteracao = models.BigIntegerField(default=0, editable=False)
+    atualizado_em = models.DateTimeField(null=True, blank=True, editable=False)
+
+    CAMPOS_ALTERACAO = ('versao_alteracao', 'atualizado_em')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Status lido do banco, para detectar transições em save()
+        instancia._status_original = instancia.__dict__.get('status')
+        return instancia
+
     @classmethod
     def get_proximo_numero(cls):
-        """Retorna o próximo número de protocolo disponível"""
-        ultimo_protocolo = cls.objects.order_by('-numero').first()
-        if ultimo_protocolo and ultimo_protocolo.numero:
-            return ultimo_protocolo.numero + 1
-        else:
-            return 1000
+        """Retorna uma prévia do próximo número de protocolo (não o reserva)"""
+        from .numeracao import previsao_proximo_numero
+        return previsao_proximo_numero()
 
     def save(self, *args, **kwargs):
+        adicionando = self._state.adding
         if not self.numero:
-            # Gerar próximo número automaticamente
-            self.numero = self.get_proximo_numero()
+            # Reservar o próximo número no contador (seguro sob concorrência)
+            from .numeracao import reservar_numeros
+            self.numero = reservar_numeros(1)[0]
         
         # Se o status foi alterado para finalizado, definir data_finalizacao
         if self.status == 'finalizado' and not self.data_finalizacao:
             self.data_finalizacao = timezone.now()
+
+        # Os campos derivados e as marcas de alteração são gravados só por
+        # protocolos.derivados e protocolos.alteracoes; uma instância carregada
+        # antes de uma nova atualização não pode sobrescrevê-los
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CAMPOS_DERIVADOS + self.CAMPOS_ALTERACAO
+            ]
         
         super().save(*args, **kwargs)
 
+        # Contabiliza abertura e mudança de status nas estatísticas diárias
+        from .estatisticas import registrar_transicoes
+        status_anterior = None if adicionando else getattr(self, '_status_original', None)
+        registrar_transicoes(self, adicionando, status_anterior)
+        self._status_original = self.status
+
     def __str__(self):
         return f"Protocolo #{self.numero}"
 
@@ -76,6 +131,70 @@ class Protocolo(models.Model):
         verbose_name = "Protocolo"
         verbose_name_plural = "Protocolos"
         ordering = ['-data_criacao']
+        indexes = [
+            # Listagem paginada por (data_criacao, id) com e sem filtros
+            models.Index(fields=['-data_criacao', '-id'], name='protocolo_criacao_idx'),
+            models.Index(fields=['status', '-data_criacao', '-id'], name='protocolo_status_criacao_idx'),
+            models.Index(fields=['tipo_problema', '-data_criacao', '-id'], name='protocolo_tipo_criacao_idx'),
+            models.Index(fields=['tipo_problema', 'status', '-data_criacao', '-id'], name='protocolo_tipo_status_idx'),
+            # Feed de alterações, lido em ordem de (versao_alteracao, id)
+            models.Index(fields=['versao_alteracao', 'id'], name='protocolo_alteracao_idx'),
+            # Seleção dos finalizados antigos para o arquivo
+            models.Index(fields=['status', 'data_finalizacao'], name='protocolo_finalizados_idx'),
+        ]
+
+
+class ProtocoloRemovido(models.Model):
+    """Registro de um protocolo excluído, para o feed de alterações"""
+    # Mesmo id do protocolo excluído
+    id = models.BigIntegerField(primary_key=True)
+    numero = models.IntegerField(null=True, blank=True)
+    versao_alteracao = models.BigIntegerField(default=0)
+    removido_em = models.DateTimeField()
+    # Saiu para o arquivo (ProtocoloArquivado) em vez de ser excluído
+    arquivado = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"Protocolo #{self.numero} ({'arquivado' if self.arquivado else 'removido'})"
+
+    class Meta:
+        verbose_name = "Protocolo Removido"
+        verbose_name_plural = "Protocolos Removidos"
+        indexes = [
+            models.Index(fields=['versao_alteracao', 'id'], name='protocolo_removido_idx'),
+        ]
+
+
+class DocumentoBusca(models.Model):
+    """Texto pesquisável de um protocolo, mantido por protocolos.busca"""
+    protocolo = models.OneToOneField(Protocolo, on_delete=models.CASCADE, primary_key=True, related_name='documento_busca')
+    conteudo = models.TextField()
+
+    def __str__(self):
+        return f"Documento de busca - {self.protocolo_id}"
+
+    class Meta:
+        verbose_name = "Documento de Busca"
+        verbose_name_plural = "Documentos de Busca"
+
+
+class EstatisticaDiaria(models.Model):
+    """Quantidade de protocolos que entraram em cada status, por dia e tipo de problema"""
+    data = models.DateField()
+    tipo_problema = models.ForeignKey(TipoProblema, on_delete=models.CASCADE, related_name='estatisticas_diarias')
+    evento = models.CharField(max_length=20, choices=Protocolo.STATUS_CHOICES)
+    quantidade = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.data} - {self.tipo_problema_id} - {self.evento}: {self.quantidade}"
+
+    class Meta:
+        verbose_name = "Estatística Diária"
+        verbose_name_plural = "Estatísticas Diárias"
+        ordering = ['data']
+        constraints = [
+            models.UniqueConstraint(fields=['data', 'tipo_problema', 'evento'], name='estatistica_diaria_unica'),
+        ]
 
 
 class Atualizacao(models.Model):
@@ -85,7 +204,13 @@ class Atualizacao(models.Model):
     data_hora = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
+        from .derivados import recalcular_atualizacoes, registrar_nova_atualizacao
+        criada = self._state.adding
         super().save(*args, **kwargs)
+        if criada:
+            registrar_nova_atualizacao(self)
+        else:
+            recalcular_atualizacoes([self.protocolo_id])
         # Atualizar status do protocolo para "em_andamento" se for a primeira atualização
         if self.protocolo.status == 'aberto':
             self.protocolo.status = 'em_andamento'
@@ -97,4 +222,96 @@ class Atualizacao(models.Model):
     class Meta:
         verbose_name = "Atualização"
         verbose_name_plural = "Atualizações"
-        ordering = ['-data_hora']
\ No newline at end of file
+        ordering = ['-data_hora']
+
+
+# Arquivo: protocolos finalizados há muito tempo, fora das tabelas de uso
+# diário (protocolos.arquivo). Os ids e números são os mesmos dos originais.
+
+class ProtocoloArquivado(models.Model):
+    """Protocolo movido para o arquivo, com os mesmos campos de ``Protocolo``"""
+    id = models.BigIntegerField(primary_key=True)
+    numero = models.IntegerField(unique=True, blank=True, null=True)
+    clientes = models.ManyToManyField(Cliente, related_name='protocolos_arquivados')
+    buic_dispositivo = models.CharField(max_length=255)
+    tipo_problema = models.ForeignKey(TipoProblema, on_delete=models.PROTECT, related_name='protocolos_arquivados')
+    descricao_problema = models.TextField()
+    status = models.CharField(max_length=20, choices=Protocolo.STATUS_CHOICES, default='finalizado')
+    usuario_criador = models.ForeignKey(User, on_delete=models.CASCADE, related_name='protocolos_arquivados')
+    data_criacao = models.DateTimeField()
+    data_finalizacao = models.DateTimeField(null=True, blank=True)
+    ultima_atualizacao_em = models.DateTimeField(null=True, blank=True)
+    ultima_atualizacao_resumo = models.CharField(max_length=255, blank=True, default='')
+    total_atualizacoes = models.PositiveIntegerField(default=0)
+    cliente_principal_nome = models.CharField(max_length=255, blank=True, default='')
+    versao_alteracao = models.BigIntegerField(default=0)
+    atualizado_em = models.DateTimeField(null=True, blank=True)
+
+    # Texto do documento de busca no momento do arquivamento
+    documento = models.TextField(blank=True, default='')
+    arquivado_em = models.DateTimeField()
+
+    def __str__(self):
+        return f"Protocolo #{self.numero} (arquivado)"
+
+    class Meta:
+        verbose_name = "Protocolo Arquivado"
+        verbose_name_plural = "Protocolos Arquivados"
+        indexes = [
+            models.Index(fields=['-data_criacao', '-id'], name='arquivado_criacao_idx'),
+        ]
+
+
+class AtualizacaoArquivada(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    protocolo = models.ForeignKey(ProtocoloArquivado, on_delete=models.CASCADE, related_name='atualizacoes')
+    descricao = models.TextField()
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    data_hora = models.DateTimeField()
+
+    def __str__(self):
+        return f"Atualização arquivada - {self.protocolo_id}"
+
+    class Meta:
+        verbose_name = "Atualização Arquivada"
+        verbose_name_plural = "Atualizações Arquivadas"
+        ordering = ['-data_hora']
+
+
+class Tarefa(models.Model):
+    """Trabalho em segundo plano (exportação, relatório), executado pelo comando ``trabalhar_tarefas``"""
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('falhou', 'Falhou'),
+    ]
+
+    tipo = models.CharField(max_length=50)
+    parametros = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='tarefas')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    max_tentativas = models.PositiveSmallIntegerField(default=3)
+    criada_em = models.DateTimeField(auto_now_add=True)
+    # Pendente: quando pode ser reservada (adiada entre tentativas)
+    disponivel_em = models.DateTimeField(default=timezone.now)
+    iniciada_em = models.DateTimeField(null=True, blank=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+    # Executando: depois disso a reserva vence e outro trabalhador pode retomar
+    expira_em = models.DateTimeField(null=True, blank=True)
+    trabalhador = models.CharField(max_length=100, blank=True, default='')
+    # Nome do arquivo gerado, relativo a PROTOCOLOS_TAREFAS_DIR
+    arquivo = models.CharField(max_length=255, blank=True, default='')
+    erro = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"Tarefa #{self.pk} ({self.tipo}) - {self.get_status_display()}"
+
+    class Meta:
+        verbose_name = "Tarefa"
+        verbose_name_plural = "Tarefas"
+        ordering = ['-criada_em', '-id']
+        indexes = [
+            models.Index(fields=['status', 'disponivel_em'], name='tarefa_fila_idx'),
+        ]
@@ -0,0 +1,124 @@
+"""
+Numeração de protocolos.
+
+Os números são emitidos a partir de um contador dedicado (tabela ``Sequencia``),
+incrementado com um único ``UPDATE ... SET valor = valor + n``. O ``UPDATE``
+bloqueia a linha do contador até o fim da transação, então dois processos nunca
+recebem o mesmo número, e nenhuma consulta precisa varrer a tabela de protocolos.
+"""
+import threading
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.db.transaction import TransactionManagementError
+
+from .models import Protocolo, Sequencia
+
+SEQUENCIA_PROTOCOLO = 'protocolo'
+NUMERO_INICIAL = 1000
+
+
+def _valor_inicial_protocolo():
+    """Último número já usado, para inicializar o contador em bases existentes"""
+    maior = Protocolo.objects.aggregate(maior=Max('numero'))['maior']
+    return maior if maior else NUMERO_INICIAL - 1
+
+
+def criar_sequencia(nome, valor_inicial):
+    try:
+        with transaction.atomic():
+            Sequencia.objects.create(nome=nome, valor=valor_inicial)
+    except IntegrityError:
+        # Outro processo criou o contador ao mesmo tempo
+        pass
+
+
+def proximos_valores(nome, quantidade=1, valor_inicial=0):
+    """
+    Reserva ``quantidade`` valores consecutivos da sequência ``nome``.
+
+    Retorna um ``range`` com os valores reservados. Se a sequência ainda não
+    existir, ela é criada com ``valor_inicial`` (um callable também é aceito).
+    """
+    if quantidade < 1:
+        raise ValueError('A quantidade reservada deve ser positiva')
+
+    with transaction.atomic():
+        atualizados = Sequencia.objects.filter(nome=nome).update(valor=F('valor') + quantidade)
+        if not atualizados:
+            criar_sequencia(nome, valor_inicial() if callable(valor_inicial) else valor_inicial)
+            Sequencia.objects.filter(nome=nome).update(valor=F('valor') + quantidade)
+        valor = Sequencia.objects.filter(nome=nome).values_list('valor', flat=True).get()
+
+    return range(valor - quantidade + 1, valor + 1)
+
+
+def valor_atual(nome, valor_inicial=0):
+    """Último valor emitido pela sequência, sem reservar nada"""
+    valor = Sequencia.objects.filter(nome=nome).values_list('valor', flat=True).first()
+    if valor is None:
+        return valor_inicial() if callable(valor_inicial) else valor_inicial
+    return valor
+
+
+def reservar_numeros(quantidade=1):
+    """Reserva ``quantidade`` números de protocolo consecutivos"""
+    return proximos_valores(SEQUENCIA_PROTOCOLO, quantidade, _valor_inicial_protocolo)
+
+
+def garantir_numero_minimo(numero):
+    """
+    Avança o contador para que ele nunca emita números até ``numero``.
+
+    Usado quando protocolos chegam com número próprio (importações).
+    """
+    if not Sequencia.objects.filter(nome=SEQUENCIA_PROTOCOLO).exists():
+        criar_sequencia(SEQUENCIA_PROTOCOLO, _valor_inicial_protocolo())
+    Sequencia.objects.filter(nome=SEQUENCIA_PROTOCOLO, valor__lt=numero).update(valor=numero)
+
+
+def previsao_proximo_numero():
+    """
+    Prévia do próximo número de protocolo, para exibição.
+
+    Lê apenas a linha do contador. Como nada é reservado, o número efetivo pode
+    ser outro se alguém criar um protocolo antes.
+    """
+    return valor_atual(SEQUENCIA_PROTOCOLO, _valor_inicial_protocolo) + 1
+
+
+class BlocoNumeros:
+    """
+    Reserva números de protocolo em blocos, para criação em massa.
+
+    Cada worker mantém o seu bloco em memória e só volta ao contador quando ele
+    acaba, o que reduz a disputa pela linha do contador a uma vez por bloco.
+    Números reservados e não usados ficam como lacunas na numeração.
+    """
+
+    def __init__(self, tamanho=500):
+        self.tamanho = tamanho
+        self._disponiveis = iter(())
+        self._lock = threading.Lock()
+
+    def proximo(self):
+        with self._lock:
+            numero = next(self._disponiveis, None)
+            if numero is None:
+                self._reabastecer(self.tamanho)
+                numero = next(self._disponiveis)
+            return numero
+
+    def reservar(self, quantidade):
+        """Retorna ``quantidade`` números, completando o bloco quando preciso"""
+        return [self.proximo() for _ in range(quantidade)]
+
+    def _reabastecer(self, quantidade):
+        # A reserva precisa ser confirmada antes de os números serem usados: se
+        # ela acontecesse dentro de uma transação desfeita depois, o contador
+        # voltaria atrás e os mesmos números seriam entregues a outro worker.
+        if transaction.get_connection().in_atomic_block:
+            raise TransactionManagementError(
+                'Blocos de números devem ser reservados fora de transações'
+            )
+        self._disponiveis = iter(reservar_numeros(quantidade))
@@ -0,0 +1,92 @@
+"""
+Paginação por chave (keyset/cursor).
+
+Em vez de ``OFFSET``, cada página filtra os itens posteriores ao último item
+da página anterior, segundo a ordenação informada. Com um índice que cubra a
+ordenação, qualquer página custa o mesmo que a primeira.
+
+O cursor é um token opaco (base64 de uma lista JSON) com os valores dos campos
+de ordenação do último item.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _serializar(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def codificar_cursor(valores):
+    dados = json.dumps([_serializar(valor) for valor in valores], separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(token, model, campos):
+    """Converte o token de volta para os tipos dos campos de ``model``"""
+    try:
+        dados = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        valores = json.loads(dados)
+        if not isinstance(valores, list) or len(valores) != len(campos):
+            raise CursorInvalido('Cursor inválido')
+        return [
+            model._meta.get_field(nome).to_python(valor) if valor is not None else None
+            for (nome, _), valor in zip(campos, valores)
+        ]
+    except (binascii.Error, UnicodeDecodeError, ValueError, ValidationError) as exc:
+        raise CursorInvalido('Cursor inválido') from exc
+
+
+def _campos(ordenacao):
+    return [(campo.lstrip('-'), campo.startswith('-')) for campo in ordenacao]
+
+
+def _filtro_apos(campos, valores):
+    """Condição "vem depois de ``valores``" para a ordenação composta"""
+    filtro = Q()
+    anteriores = {}
+    for (nome, decrescente), valor in zip(campos, valores):
+        lookup = 'lt' if decrescente else 'gt'
+        filtro |= Q(**anteriores, **{f'{nome}__{lookup}': valor})
+        anteriores[nome] = valor
+    return filtro
+
+
+def _valor(item, nome):
+    if isinstance(item, dict):
+        return item[nome]
+    return getattr(item, nome)
+
+
+def paginar_por_chave(queryset, ordenacao, cursor=None, tamanho=20):
+    """
+    Retorna ``(itens, proximo_cursor)`` para a página após ``cursor``.
+
+    ``ordenacao`` deve terminar num campo único (normalmente ``id``) para que a
+    ordem seja total. ``proximo_cursor`` é ``None`` na última página.
+    """
+    campos = _campos(ordenacao)
+    if cursor:
+        valores = decodificar_cursor(cursor, queryset.model, campos)
+        queryset = queryset.filter(_filtro_apos(campos, valores))
+
+    # Um item a mais indica se existe próxima página
+    itens = list(queryset.order_by(*ordenacao)[:tamanho + 1])
+    proximo_cursor = None
+    if len(itens) > tamanho:
+        itens = itens[:tamanho]
+        proximo_cursor = codificar_cursor([_valor(itens[-1], nome) for nome, _ in campos])
+    return itens, proximo_cursor
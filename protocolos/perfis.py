@@ -0,0 +1,79 @@
+"""
+Perfis (cProfile) de requisições reais.
+
+O ``PerfilamentoMiddleware`` executa a requisição sob cProfile quando um
+usuário staff pede (parâmetro ``?_perfil=1`` ou cabeçalho ``X-Perfil: 1``) ou
+quando ela cai na amostra ``PROTOCOLOS_PERFIL_AMOSTRA``. Cada perfil gera um
+``.prof`` (legível pelo ``pstats``/snakeviz) e um ``.json`` com os dados da
+requisição em ``PROTOCOLOS_PERFIL_DIR``. Os mais antigos são apagados conforme
+``PROTOCOLOS_PERFIL_MAX_ARQUIVOS`` e ``PROTOCOLOS_PERFIL_MAX_DIAS``.
+"""
+import io
+import json
+import os
+import pstats
+import re
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+
+def diretorio_perfis():
+    diretorio = getattr(settings, 'PROTOCOLOS_PERFIL_DIR', None)
+    return Path(diretorio or os.path.join(tempfile.gettempdir(), 'protocolos-perfis'))
+
+
+def _nome_arquivo(view):
+    view = re.sub(r'[^\w.-]+', '_', view or 'sem_view')[:60]
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{view}-{uuid.uuid4().hex[:8]}"
+
+
+def gravar_perfil(profiler, metadados):
+    """Grava o ``.prof`` e o ``.json`` do perfil e devolve o nome base"""
+    diretorio = diretorio_perfis()
+    diretorio.mkdir(parents=True, exist_ok=True)
+    nome = _nome_arquivo(metadados.get('view'))
+    profiler.dump_stats(diretorio / f'{nome}.prof')
+    (diretorio / f'{nome}.json').write_text(json.dumps(dict(metadados, nome=nome), ensure_ascii=False))
+    aplicar_retencao()
+    return nome
+
+
+def listar_perfis():
+    """Metadados dos perfis gravados, do mais recente para o mais antigo"""
+    diretorio = diretorio_perfis()
+    if not diretorio.is_dir():
+        return []
+    perfis = []
+    for arquivo in diretorio.glob('*.json'):
+        try:
+            perfis.append(json.loads(arquivo.read_text()))
+        except (OSError, ValueError):
+            continue
+    return sorted(perfis, key=lambda perfil: perfil.get('quando', 0), reverse=True)
+
+
+def apagar_perfil(nome):
+    for sufixo in ('.prof', '.json'):
+        (diretorio_perfis() / f'{nome}{sufixo}').unlink(missing_ok=True)
+
+
+def aplicar_retencao():
+    max_arquivos = getattr(settings, 'PROTOCOLOS_PERFIL_MAX_ARQUIVOS', 200)
+    max_dias = getattr(settings, 'PROTOCOLOS_PERFIL_MAX_DIAS', 7)
+    limite_idade = time.time() - max_dias * 86400 if max_dias else None
+    for posicao, perfil in enumerate(listar_perfis()):
+        antigo = limite_idade is not None and perfil.get('quando', 0) < limite_idade
+        if antigo or (max_arquivos and posicao >= max_arquivos):
+            apagar_perfil(perfil['nome'])
+
+
+def resumo(nome, ordenar='cumulative', limite=25):
+    """Texto do ``pstats`` com as funções mais custosas do perfil"""
+    saida = io.StringIO()
+    estatisticas = pstats.Stats(str(diretorio_perfis() / f'{nome}.prof'), stream=saida)
+    estatisticas.strip_dirs().sort_stats(ordenar).print_stats(limite)
+    return saida.getvalue()
@@ -0,0 +1,104 @@
+"""
+Cache dos dados de referência: tipos de problema ativos e clientes ativos.
+
+Cada grupo tem um contador de geração no cache, que entra na chave dos dados.
+Salvar ou excluir um ``TipoProblema`` (ou um ``Cliente``) avança o contador
+depois do commit (``signals``); as entradas da geração anterior deixam de ser
+lidas e expiram sozinhas. Funciona com qualquer backend de cache, inclusive o
+de memória local; nesse caso cada processo tem o seu contador, e o TTL
+``PROTOCOLOS_REFERENCIAS_CACHE_TTL`` limita por quanto tempo os outros
+processos podem ver dados antigos.
+
+Os tipos ficam numa lista única (são poucos). Os clientes ficam num mapa por
+id, lido com ``get_many`` apenas para os ids pedidos.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Cliente, TipoProblema
+
+TIPOS_PROBLEMA = 'tipos_problema'
+CLIENTES = 'clientes'
+
+# Marca, no mapa de clientes, um id inexistente ou inativo
+_AUSENTE = False
+
+
+def _ttl():
+    return getattr(settings, 'PROTOCOLOS_REFERENCIAS_CACHE_TTL', 3600)
+
+
+def _chave_geracao(grupo):
+    return f'protocolos:referencias:{grupo}:geracao'
+
+
+def geracao(grupo):
+    chave = _chave_geracao(grupo)
+    valor = cache.get(chave)
+    if valor is None:
+        # Valor inicial único, para nunca reaproveitar a chave de uma geração antiga
+        cache.add(chave, time.time_ns(), timeout=None)
+        valor = cache.get(chave)
+    return valor
+
+
+def invalidar(grupo):
+    try:
+        cache.incr(_chave_geracao(grupo))
+    except ValueError:
+        cache.add(_chave_geracao(grupo), time.time_ns(), timeout=None)
+
+
+def invalidar_tipos_problema():
+    invalidar(TIPOS_PROBLEMA)
+
+
+def invalidar_clientes():
+    invalidar(CLIENTES)
+
+
+def tipos_problema_ativos():
+    """Tipos de problema ativos, em ordem de nome"""
+    chave = f'protocolos:referencias:{TIPOS_PROBLEMA}:{geracao(TIPOS_PROBLEMA)}'
+    tipos = cache.get(chave)
+    if tipos is None:
+        tipos = list(TipoProblema.objects.filter(ativo=True).order_by('nome'))
+        cache.set(chave, tipos, _ttl())
+    return tipos
+
+
+# Maior id aceito (BigAutoField); acima disso o banco recusaria o parâmetro
+ID_MAXIMO = 2 ** 63 - 1
+
+
+def id_ou_none(valor):
+    """``valor`` como id inteiro positivo, ou ``None`` se não for um (ex.: '²', que passa em ``isdigit``)"""
+    texto = str(valor)
+    if not texto.isdecimal():
+        return None
+    pk = int(texto)
+    return pk if 0 < pk <= ID_MAXIMO else None
+
+
+def clientes_ativos(ids):
+    """Mapa ``{id: Cliente}`` com os clientes ativos entre ``ids`` (só nome e email; ids inválidos são ignorados)"""
+    ids = {pk for pk in map(id_ou_none, ids) if pk is not None}
+    if not ids:
+        return {}
+    atual = geracao(CLIENTES)
+    chaves = {pk: f'protocolos:referencias:{CLIENTES}:{atual}:{pk}' for pk in ids}
+    encontrados = cache.get_many(chaves.values())
+    mapa = {pk: encontrados[chave] for pk, chave in chaves.items() if chave in encontrados}
+
+    faltando = ids - mapa.keys()
+    if faltando:
+        lidos = {
+            cliente.pk: cliente
+            for cliente in Cliente.objects.filter(pk__in=faltando, ativo=True).only('nome', 'email')
+        }
+        novos = {pk: lidos.get(pk, _AUSENTE) for pk in faltando}
+        cache.set_many({chaves[pk]: cliente for pk, cliente in novos.items()}, _ttl())
+        mapa.update(novos)
+    return {pk: cliente for pk, cliente in mapa.items() if cliente is not _AUSENTE}
@@ -0,0 +1,148 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .alteracoes import registrar_alteracoes, registrar_remocao
+from .busca import indexar_protocolos
+from .derivados import recalcular_atualizacoes, recalcular_cliente_principal
+from .estatisticas import agendar_invalidacao_estatisticas
+from .models import Atualizacao, Cliente, Protocolo, TipoProblema
+from .referencias import invalidar_clientes, invalidar_tipos_problema
+from .tarefas import enfileirar
+from .versao import agendar_avanco_versao
+
+
+def _exclusao_de_protocolo(origin):
+    """Indica se a exclusão veio em cascata de um protocolo sendo excluído"""
+    if isinstance(origin, QuerySet):
+        return origin.model is Protocolo
+    return isinstance(origin, Protocolo)
+
+
+@receiver(post_save, sender=Protocolo)
+@receiver(post_delete, sender=Protocolo)
+@receiver(post_save, sender=Atualizacao)
+@receiver(post_delete, sender=Atualizacao)
+@receiver(post_save, sender=TipoProblema)
+@receiver(post_delete, sender=TipoProblema)
+def invalidar_contadores_dashboard(sender, **kwargs):
+    # Só invalida depois do commit, para que nenhuma requisição concorrente
+    # recoloque no cache valores lidos antes da alteração ser confirmada
+    agendar_invalidacao_estatisticas()
+    agendar_avanco_versao()
+
+
+@receiver(post_save, sender=TipoProblema)
+@receiver(post_delete, sender=TipoProblema)
+def invalidar_cache_tipos_problema(sender, **kwargs):
+    transaction.on_commit(invalidar_tipos_problema)
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_cache_clientes(sender, **kwargs):
+    transaction.on_commit(invalidar_clientes)
+    agendar_avanco_versao()  # o nome do cliente principal aparece nas listagens
+
+
+# Manutenção incremental dos documentos de busca e dos campos derivados
+
+@receiver(post_save, sender=Protocolo)
+def indexar_protocolo_salvo(sender, instance, **kwargs):
+    indexar_protocolos([instance.pk])
+    registrar_alteracoes([instance.pk])
+
+
+@receiver(post_delete, sender=Protocolo)
+def registrar_protocolo_removido(sender, instance, **kwargs):
+    registrar_remocao(instance)
+
+
+@receiver(post_save, sender=Atualizacao)
+def indexar_protocolo_da_atualizacao(sender, instance, **kwargs):
+    indexar_protocolos([instance.protocolo_id])
+    registrar_alteracoes([instance.protocolo_id])
+
+
+@receiver(post_delete, sender=Atualizacao)
+def indexar_protocolo_da_atualizacao_excluida(sender, instance, origin=None, **kwargs):
+    # Na exclusão em cascata o protocolo também vai sumir; recriar o documento
+    # aqui violaria a chave estrangeira
+    if not _exclusao_de_protocolo(origin):
+        recalcular_atualizacoes([instance.protocolo_id])
+        indexar_protocolos([instance.protocolo_id])
+        registrar_alteracoes([instance.protocolo_id])
+
+
+def _campos_alterados(sender, instance, campos, update_fields):
+    """Indica se ``save()`` vai mudar algum dos ``campos`` em relação ao que está gravado"""
+    if instance._state.adding or instance.pk is None:
+        return False
+    if update_fields is not None and not set(campos) & set(update_fields):
+        return False
+    gravado = sender._default_manager.filter(pk=instance.pk).values(*campos).first()
+    return gravado is not None and any(gravado[campo] != getattr(instance, campo) for campo in campos)
+
+
+def _clientes_alterados(protocolo_ids):
+    ids = list(protocolo_ids)
+    recalcular_cliente_principal(ids)
+    indexar_protocolos(ids)
+    registrar_alteracoes(ids)
+
+
+@receiver(m2m_changed, sender=Protocolo.clientes.through)
+def protocolos_com_clientes_alterados(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _clientes_alterados([instance.pk])
+        return
+
+    # Alteração feita pelo lado do cliente (cliente.protocolos.add(...))
+    if action == 'pre_clear':
+        instance._protocolos_antes_de_limpar = list(instance.protocolos.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        _clientes_alterados(getattr(instance, '_protocolos_antes_de_limpar', []))
+    elif action in ('post_add', 'post_remove'):
+        _clientes_alterados(pk_set)
+
+
+@receiver(pre_save, sender=Cliente)
+def verificar_dados_do_cliente(sender, instance, update_fields=None, **kwargs):
+    # Nome e e-mail entram no documento de busca, no cliente principal e na API
+    instance._atualizar_protocolos = _campos_alterados(sender, instance, ('nome', 'email'), update_fields)
+
+
+@receiver(post_save, sender=Cliente)
+def protocolos_do_cliente_alterado(sender, instance, created, **kwargs):
+    # Um cliente pode ter milhares de protocolos: a atualização vai para a fila
+    # de tarefas, gravada na mesma transação e executada depois do commit
+    if not created and getattr(instance, '_atualizar_protocolos', False):
+        instance._atualizar_protocolos = False
+        enfileirar('reindexar_busca', {'cliente': instance.pk})
+
+
+@receiver(pre_delete, sender=Cliente)
+def guardar_protocolos_do_cliente_excluido(sender, instance, **kwargs):
+    # Os vínculos somem em cascata sem disparar m2m_changed
+    instance._protocolos_para_indexar = list(instance.protocolos.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Cliente)
+def protocolos_do_cliente_excluido(sender, instance, **kwargs):
+    _clientes_alterados(getattr(instance, '_protocolos_para_indexar', []))
+
+
+@receiver(pre_save, sender=TipoProblema)
+def verificar_nome_do_tipo(sender, instance, update_fields=None, **kwargs):
+    instance._reindexar_protocolos = _campos_alterados(sender, instance, ('nome',), update_fields)
+
+
+@receiver(post_save, sender=TipoProblema)
+def indexar_protocolos_do_tipo(sender, instance, created, **kwargs):
+    # Só o nome do tipo entra nos documentos de busca; a reindexação (em uso e
+    # arquivados) roda na fila de tarefas, fora da requisição
+    if not created and getattr(instance, '_reindexar_protocolos', False):
+        instance._reindexar_protocolos = False
+        enfileirar('reindexar_busca', {'tipo_problema': instance.pk})
@@ -0,0 +1,176 @@
+"""
+Tempos de atendimento (SLA).
+
+Duas medidas, em segundos: da criação à finalização (``resolucao``) e da
+criação à primeira atualização (``primeira_atualizacao``). A resolução só
+conta protocolos finalizados (um reaberto mantém a ``data_finalizacao``
+antiga). As amostras vêm dos protocolos em uso e dos arquivados (``UNION
+ALL``). Para cada grupo (tipo de problema, criador ou mês de criação) são
+calculados quantidade, média, mediana, p90 e p99, tudo no banco:
+
+* PostgreSQL: ``PERCENTILE_CONT(...) WITHIN GROUP``;
+* demais bancos (SQLite): funções de janela numeram as amostras de cada grupo
+  e o percentil é interpolado entre as duas posições vizinhas, com o mesmo
+  resultado de ``PERCENTILE_CONT``.
+
+Os resultados ficam em cache por ``PROTOCOLOS_SLA_CACHE_TTL`` segundos, com a
+versão dos dados na chave (como as estatísticas).
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F, FloatField, Func, OuterRef, Subquery, Value
+from django.db.models.functions import TruncMonth
+
+from .filtros import aplicar_filtros
+from .models import Atualizacao, AtualizacaoArquivada, Protocolo, ProtocoloArquivado
+from .versao import versao_dados
+
+MEDIDAS = ('resolucao', 'primeira_atualizacao')
+AGRUPAMENTOS = {
+    'tipo_problema': F('tipo_problema__nome'),
+    'usuario_criador': F('usuario_criador__username'),
+    'mes': TruncMonth('data_criacao'),
+}
+PERCENTIS = {'mediana': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+
+def _ttl():
+    return getattr(settings, 'PROTOCOLOS_SLA_CACHE_TTL', 600)
+
+
+class Segundos(Func):
+    """Diferença ``fim - inicio`` em segundos"""
+    output_field = FloatField()
+
+    def __init__(self, fim, inicio):
+        super().__init__(fim, inicio)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template='((JULIANDAY(%(expressions)s)) * 86400.0)',
+            arg_joiner=') - JULIANDAY(', **extra_context
+        )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template='EXTRACT(EPOCH FROM (%(expressions)s))',
+            arg_joiner=' - ', **extra_context
+        )
+
+
+def _amostras_de(model, atualizacoes, medida, agrupamento, filtros):
+    protocolos = aplicar_filtros(model.objects.all(), filtros)
+    if medida == 'resolucao':
+        protocolos = protocolos.filter(status='finalizado').annotate(
+            segundos=Segundos(F('data_finalizacao'), F('data_criacao'))
+        )
+    else:
+        primeira = atualizacoes.objects.filter(protocolo=OuterRef('pk')).order_by('data_hora').values('data_hora')[:1]
+        protocolos = protocolos.annotate(
+            primeira_atualizacao=Subquery(primeira),
+            segundos=Segundos(F('primeira_atualizacao'), F('data_criacao')),
+        )
+    grupo = AGRUPAMENTOS[agrupamento] if agrupamento else Value('todos')
+    return protocolos.annotate(grupo=grupo).filter(segundos__isnull=False).values('grupo', 'segundos').order_by()
+
+
+def _amostras(medida, agrupamento, filtros):
+    """Queryset com uma linha (grupo, segundos) por protocolo medido, em uso ou arquivado"""
+    return _amostras_de(Protocolo, Atualizacao, medida, agrupamento, filtros).union(
+        _amostras_de(ProtocoloArquivado, AtualizacaoArquivada, medida, agrupamento, filtros), all=True
+    )
+
+
+def _consultar(amostras, sql, parametros):
+    with connections[amostras.db].cursor() as cursor:
+        cursor.execute(sql, parametros)
+        nomes = [coluna[0] for coluna in cursor.description]
+        return [dict(zip(nomes, linha)) for linha in cursor.fetchall()]
+
+
+def _calcular_postgresql(amostras):
+    percentis = ', '.join(
+        f'PERCENTILE_CONT({fracao}) WITHIN GROUP (ORDER BY segundos) AS {nome}' for nome, fracao in PERCENTIS.items()
+    )
+    sql_amostras, parametros = amostras.query.sql_with_params()
+    sql = f'''
+        SELECT grupo, COUNT(*) AS total, AVG(segundos) AS media, {percentis}
+        FROM ({sql_amostras}) amostras GROUP BY grupo ORDER BY grupo
+    '''
+    return _consultar(amostras, sql, parametros)
+
+
+def _calcular_janelas(amostras):
+    colunas_limites = []
+    colunas_finais = []
+    for nome, fracao in PERCENTIS.items():
+        posicao = f'CAST({fracao} * (n - 1) AS INTEGER)'
+        colunas_limites.append(f'MAX(CASE WHEN pos = {posicao} THEN segundos END) AS {nome}_baixo')
+        colunas_limites.append(
+            f'MAX(CASE WHEN pos = CASE WHEN {posicao} + 1 < n THEN {posicao} + 1 ELSE n - 1 END '
+            f'THEN segundos END) AS {nome}_alto'
+        )
+        colunas_finais.append(
+            f'{nome}_baixo + ({nome}_alto - {nome}_baixo) * ({fracao} * (total - 1) - '
+            f'CAST({fracao} * (total - 1) AS INTEGER)) AS {nome}'
+        )
+
+    sql_amostras, parametros = amostras.query.sql_with_params()
+    sql = f'''
+        WITH amostras AS ({sql_amostras}),
+        ordenadas AS (
+            SELECT grupo, segundos,
+                   ROW_NUMBER() OVER (PARTITION BY grupo ORDER BY segundos) - 1 AS pos,
+                   COUNT(*) OVER (PARTITION BY grupo) AS n
+            FROM amostras
+        ),
+        limites AS (
+            SELECT grupo, MAX(n) AS total, AVG(segundos) AS media, {', '.join(colunas_limites)}
+            FROM ordenadas GROUP BY grupo
+        )
+        SELECT grupo, total, media, {', '.join(colunas_finais)} FROM limites ORDER BY grupo
+    '''
+    return _consultar(amostras, sql, parametros)
+
+
+def _rotulo(grupo, agrupamento):
+    if agrupamento == 'mes' and grupo is not None:
+        # datetime no PostgreSQL, texto 'AAAA-MM-DD HH:MM:SS' no SQLite
+        return grupo.strftime('%Y-%m') if hasattr(grupo, 'strftime') else str(grupo)[:7]
+    return grupo
+
+
+def calcular_sla(medida, agrupamento=None, filtros=None):
+    """Lista de ``{grupo, total, media, mediana, p90, p99}`` (tempos em segundos)"""
+    if medida not in MEDIDAS:
+        raise ValueError(f'Medida desconhecida: {medida}')
+    amostras = _amostras(medida, agrupamento, filtros or {})
+    if connections[amostras.db].vendor == 'postgresql':
+        linhas = _calcular_postgresql(amostras)
+    else:
+        linhas = _calcular_janelas(amostras)
+    return [
+        {
+            'grupo': _rotulo(linha['grupo'], agrupamento),
+            'total': linha['total'],
+            **{chave: round(linha[chave], 1) for chave in ('media', *PERCENTIS)},
+        }
+        for linha in linhas
+    ]
+
+
+def sla(medida, agrupamento=None, filtros=None, versao=None):
+    """``calcular_sla`` com cache, na versão ``versao`` dos dados (lida do banco se omitida)"""
+    filtros = filtros or {}
+    assinatura = json.dumps([medida, agrupamento, filtros], sort_keys=True, default=str)
+    versao = versao_dados() if versao is None else versao
+    chave = f'protocolos:sla:{hashlib.md5(assinatura.encode()).hexdigest()}:{versao}'
+    resultado = cache.get(chave)
+    if resultado is None:
+        resultado = calcular_sla(medida, agrupamento, filtros)
+        cache.set(chave, resultado, _ttl())
+    return resultado
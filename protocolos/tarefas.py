@@ -0,0 +1,290 @@
+"""
+Fila de tarefas em segundo plano, guardada no próprio banco.
+
+Exportações e relatórios pesados não cabem no tempo de uma requisição: a view
+grava uma ``Tarefa`` pendente e responde na hora; o comando
+``trabalhar_tarefas`` (um ou mais processos, cada um com um pool de threads)
+executa a tarefa, grava o resultado em ``PROTOCOLOS_TAREFAS_DIR`` e o arquivo
+fica disponível para download. Os sinais também enfileiram aqui a
+reindexação da busca quando um tipo de problema ou cliente é renomeado.
+
+Não há broker: a reserva é um ``UPDATE`` condicional (``status='pendente'``),
+que só um trabalhador consegue aplicar, em qualquer banco. A reserva vale por
+``PROTOCOLOS_TAREFAS_TEMPO_LIMITE`` segundos; vencida (trabalhador
+interrompido), a tarefa pode ser retomada por outro. Uma falha devolve a tarefa
+à fila com espera crescente (``PROTOCOLOS_TAREFAS_ESPERA``, dobrando a cada
+tentativa) até ``max_tentativas``; depois disso ela fica como "falhou" e pode
+ser repetida manualmente. Um erro do próprio trabalhador (ex.: a conexão
+com o banco caiu durante a reserva) é registrado no log
+``protocolos.tarefas`` e o laço continua, com espera crescente.
+"""
+import csv
+import logging
+import os
+import socket
+import threading
+import traceback
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import sla as sla_analise
+from .alteracoes import registrar_alteracoes
+from .busca import LOTE_INDEXACAO, indexar_arquivados, indexar_protocolos
+from .derivados import recalcular_cliente_principal
+from .estatisticas import inicio_em_meses, ler_periodo_tendencias, tendencia
+from .exportacao import linhas_csv, protocolos_para_exportacao
+from .filtros import ler_filtros
+from .models import Protocolo, ProtocoloArquivado, Tarefa
+from .versao import agendar_avanco_versao
+
+# Tarefas lidas por tentativa de reserva (as demais ficam para a próxima)
+CANDIDATAS_POR_RESERVA = 10
+
+# Maior espera (s) entre tentativas depois de erros seguidos do trabalhador
+ESPERA_MAXIMA_ERRO = 60
+
+logger = logging.getLogger('protocolos.tarefas')
+
+PARAMETROS_FILTROS = ('tipo_problema', 'status', 'data_inicio', 'data_fim')
+
+
+class TarefaInvalida(ValueError):
+    pass
+
+
+@dataclass
+class TipoTarefa:
+    rotulo: str
+    # Recebe os parâmetros e o arquivo de saída (texto) e escreve o resultado
+    executar: object
+    parametros: tuple
+    extensao: str = 'csv'
+    content_type: str = 'text/csv'
+
+
+def diretorio_tarefas():
+    return Path(getattr(settings, 'PROTOCOLOS_TAREFAS_DIR', None) or settings.BASE_DIR / 'var' / 'tarefas')
+
+
+def _tempo_limite():
+    return getattr(settings, 'PROTOCOLOS_TAREFAS_TEMPO_LIMITE', 3600)
+
+
+def _espera():
+    return getattr(settings, 'PROTOCOLOS_TAREFAS_ESPERA', 30)
+
+
+def _exportar_csv(parametros, saida):
+    for linha in linhas_csv(protocolos_para_exportacao(ler_filtros(parametros))):
+        saida.write(linha)
+
+
+def _relatorio_sla(parametros, saida):
+    agrupamento = parametros.get('agrupamento')
+    if agrupamento not in sla_analise.AGRUPAMENTOS:
+        agrupamento = 'tipo_problema'
+    filtros = ler_filtros(parametros)
+    filtros['status'] = None  # como na view: a resolução só considera finalizados
+    colunas = ('total', 'media', *sla_analise.PERCENTIS)
+
+    writer = csv.writer(saida)
+    writer.writerow(['Medida', 'Grupo', 'Quantidade', 'Média (s)', 'Mediana (s)', 'P90 (s)', 'P99 (s)'])
+    for medida in sla_analise.MEDIDAS:
+        for linha in sla_analise.calcular_sla(medida, None, filtros):
+            writer.writerow([medida, 'Geral', *(linha[chave] for chave in colunas)])
+        for linha in sla_analise.calcular_sla(medida, agrupamento, filtros):
+            writer.writerow([medida, linha['grupo'], *(linha[chave] for chave in colunas)])
+
+
+def _relatorio_tendencias(parametros, saida):
+    agrupamento, meses = ler_periodo_tendencias(parametros)
+    fim = timezone.localdate()
+    serie = tendencia(
+        inicio_em_meses(fim, meses), fim, agrupamento=agrupamento,
+        tipo_problema=ler_filtros(parametros)['tipo_problema'],
+    )
+    writer = csv.writer(saida)
+    writer.writerow(['Período', *(rotulo for _, rotulo in Protocolo.STATUS_CHOICES)])
+    for ponto in serie:
+        writer.writerow([ponto['periodo'].isoformat(), *(ponto[evento] for evento, _ in Protocolo.STATUS_CHOICES)])
+
+
+def _reindexar_busca(parametros, saida):
+    # Protocolos de um cliente (nome ou e-mail alterado) ou de um tipo de problema (nome alterado)
+    cliente = parametros.get('cliente')
+    filtro = {'clientes': int(cliente)} if cliente else {'tipo_problema_id': int(parametros['tipo_problema'])}
+    ids = list(Protocolo.objects.filter(**filtro).order_by('pk').values_list('pk', flat=True))
+    for inicio in range(0, len(ids), LOTE_INDEXACAO):
+        lote = ids[inicio:inicio + LOTE_INDEXACAO]
+        # Uma transação curta por lote
+        with transaction.atomic():
+            if cliente:
+                recalcular_cliente_principal(lote)
+                registrar_alteracoes(lote)
+                agendar_avanco_versao()
+            indexar_protocolos(lote)
+    arquivados = list(ProtocoloArquivado.objects.filter(**filtro).order_by('pk').values_list('pk', flat=True))
+    indexar_arquivados(arquivados)
+    saida.write(f'{len(ids)} protocolo(s) e {len(arquivados)} arquivado(s) reindexado(s)\n')
+
+
+TIPOS = {
+    'exportar_csv': TipoTarefa('Exportação de protocolos (CSV)', _exportar_csv, PARAMETROS_FILTROS),
+    'relatorio_sla': TipoTarefa(
+        'Relatório de SLA (CSV)', _relatorio_sla, ('agrupamento', 'tipo_problema', 'data_inicio', 'data_fim')
+    ),
+    'relatorio_tendencias': TipoTarefa(
+        'Relatório de tendências (CSV)', _relatorio_tendencias, ('agrupamento', 'meses', 'tipo_problema')
+    ),
+    'reindexar_busca': TipoTarefa(
+        'Reindexação da busca', _reindexar_busca, ('tipo_problema', 'cliente'), 'txt', 'text/plain'
+    ),
+}
+
+
+def enfileirar(tipo, params=None, usuario=None):
+    """Cria uma tarefa pendente com os parâmetros aceitos pelo tipo (os demais são ignorados)"""
+    if tipo not in TIPOS:
+        raise TarefaInvalida(f"Tipo de tarefa desconhecido: {tipo!r} (aceitos: {', '.join(TIPOS)})")
+    params = params or {}
+    parametros = {nome: str(params.get(nome)) for nome in TIPOS[tipo].parametros if params.get(nome)}
+    return Tarefa.objects.create(
+        tipo=tipo,
+        parametros=parametros,
+        usuario=usuario,
+        max_tentativas=getattr(settings, 'PROTOCOLOS_TAREFAS_TENTATIVAS', 3),
+    )
+
+
+def repetir(tarefas):
+    """Devolve à fila tarefas que falharam, com as tentativas zeradas; retorna quantas"""
+    return tarefas.filter(status='falhou').update(
+        status='pendente', tentativas=0, disponivel_em=timezone.now(), erro='', trabalhador='', expira_em=None
+    )
+
+
+def _disponiveis(agora):
+    return Q(status='pendente', disponivel_em__lte=agora) | Q(status='executando', expira_em__lt=agora)
+
+
+def reservar(trabalhador):
+    """Reserva a próxima tarefa disponível para ``trabalhador``; ``None`` se a fila está vazia"""
+    agora = timezone.now()
+    candidatas = Tarefa.objects.filter(_disponiveis(agora)).order_by('disponivel_em', 'id')
+    for pk in candidatas.values_list('pk', flat=True)[:CANDIDATAS_POR_RESERVA]:
+        # Só um trabalhador consegue aplicar este UPDATE; os outros tentam a próxima
+        reservada = Tarefa.objects.filter(_disponiveis(agora), pk=pk).update(
+            status='executando',
+            trabalhador=trabalhador,
+            tentativas=F('tentativas') + 1,
+            iniciada_em=agora,
+            expira_em=agora + timedelta(seconds=_tempo_limite()),
+        )
+        if reservada:
+            return Tarefa.objects.get(pk=pk)
+    return None
+
+
+def caminho_arquivo(tarefa):
+    return diretorio_tarefas() / tarefa.arquivo if tarefa.arquivo else None
+
+
+def executar(tarefa):
+    """Executa uma tarefa reservada e grava o resultado (ou a falha) se a reserva ainda for dela"""
+    reserva = Tarefa.objects.filter(pk=tarefa.pk, status='executando', trabalhador=tarefa.trabalhador)
+    tipo = TIPOS.get(tarefa.tipo)
+    if tipo is None or tarefa.tentativas > tarefa.max_tentativas:
+        # Tipo removido do código, ou reservas vencidas em todas as tentativas
+        erro = f'Tipo de tarefa desconhecido: {tarefa.tipo!r}' if tipo is None else 'Tempo limite excedido'
+        reserva.update(status='falhou', erro=erro, expira_em=None, concluida_em=timezone.now())
+        return False
+
+    diretorio = diretorio_tarefas()
+    diretorio.mkdir(parents=True, exist_ok=True)
+    nome = f'tarefa-{tarefa.pk}-{tarefa.tipo}.{tipo.extensao}'
+    temporario = diretorio / f'{nome}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        with open(temporario, 'w', encoding='utf-8', newline='') as saida:
+            tipo.executar(tarefa.parametros, saida)
+        # O arquivo só aparece completo
+        os.replace(temporario, diretorio / nome)
+    except Exception:
+        temporario.unlink(missing_ok=True)
+        erro = traceback.format_exc()
+        if tarefa.tentativas < tarefa.max_tentativas:
+            espera = _espera() * 2 ** (tarefa.tentativas - 1)
+            reserva.update(
+                status='pendente', erro=erro, expira_em=None,
+                disponivel_em=timezone.now() + timedelta(seconds=espera),
+            )
+        else:
+            reserva.update(status='falhou', erro=erro, expira_em=None, concluida_em=timezone.now())
+        return False
+    reserva.update(status='concluida', arquivo=nome, erro='', expira_em=None, concluida_em=timezone.now())
+    return True
+
+
+def identificador_trabalhador(indice=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{indice}'
+
+
+def trabalhar(trabalhador, parar=None, intervalo=2.0, esvaziar=False):
+    """
+    Laço de um trabalhador: reserva e executa tarefas até ``parar`` ser
+    sinalizado (ou, com ``esvaziar``, até a fila ficar vazia). Retorna quantas
+    tarefas executou.
+    """
+    parar = parar or threading.Event()
+    executadas = 0
+    erros_seguidos = 0
+    try:
+        while not parar.is_set():
+            if not connection.in_atomic_block:
+                # Descarta conexões quebradas ou vencidas (CONN_MAX_AGE), como no ciclo de uma requisição
+                close_old_connections()
+            try:
+                tarefa = reservar(trabalhador)
+                if tarefa is not None:
+                    executar(tarefa)
+            except Exception:
+                # Erro fora da tarefa (banco fora do ar, lock): a thread continua viva
+                erros_seguidos += 1
+                logger.exception('Erro no trabalhador %s (%d seguido(s))', trabalhador, erros_seguidos)
+                if not connection.in_atomic_block:
+                    close_old_connections()
+                parar.wait(min(max(intervalo, 1) * 2 ** (erros_seguidos - 1), ESPERA_MAXIMA_ERRO))
+                continue
+            erros_seguidos = 0
+            if tarefa is None:
+                if esvaziar:
+                    break
+                parar.wait(intervalo)
+                continue
+            executadas += 1
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+    return executadas
+
+
+def limpar(dias=None):
+    """Apaga tarefas terminadas há mais de ``dias`` dias e seus arquivos; retorna quantas"""
+    dias = getattr(settings, 'PROTOCOLOS_TAREFAS_RETENCAO_DIAS', 7) if dias is None else dias
+    antigas = Tarefa.objects.filter(
+        status__in=('concluida', 'falhou'), concluida_em__lt=timezone.now() - timedelta(days=dias)
+    )
+    total = 0
+    for tarefa in antigas.only('pk', 'arquivo'):
+        caminho = caminho_arquivo(tarefa)
+        if caminho:
+            caminho.unlink(missing_ok=True)
+        tarefa.delete()
+        total += 1
+    return total
@@ -0,0 +1,105 @@
+"""
+Mudança de status em lote.
+
+Aplica a muitos protocolos, com poucos comandos por lote, as mesmas regras de
+``Protocolo.save`` e ``Atualizacao.save``: a finalização grava
+``data_finalizacao`` (se ainda vazia) e uma atualização nova tira o protocolo de
+"aberto". Como ``QuerySet.update`` e ``bulk_create`` não disparam sinais, a
+manutenção feita por ``signals`` também é feita aqui, por lote: estatísticas
+diárias, campos derivados, documentos de busca, versão de alteração (feed),
+cache do dashboard e versão dos dados.
+"""
+from collections import Counter
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .alteracoes import registrar_alteracoes
+from .busca import indexar_protocolos
+from .derivados import recalcular_atualizacoes
+from .estatisticas import agendar_invalidacao_estatisticas, evento_de_status, registrar_eventos
+from .filtros import STATUS_VALIDOS
+from .models import Atualizacao, Protocolo
+from .versao import agendar_avanco_versao
+
+# Protocolos tratados por vez (tamanho das listas em ``IN``)
+LOTE_TRANSICAO = 2000
+
+
+@dataclass
+class ResultadoTransicao:
+    status: str
+    selecionados: int = 0
+    alterados: int = 0
+    atualizacoes: int = 0
+
+
+def alterar_status(protocolos, status, descricao='', usuario=None, lote=LOTE_TRANSICAO):
+    """
+    Leva ``protocolos`` (queryset ou ids) para ``status``.
+
+    Com ``descricao``, cria uma atualização (de ``usuario``) em cada protocolo
+    selecionado, e "aberto" vira "em_andamento", como em ``Atualizacao.save``.
+    Tudo numa transação.
+    """
+    if status not in STATUS_VALIDOS:
+        raise ValueError(f'Status inválido: {status!r}')
+    descricao = (descricao or '').strip()
+    if descricao and usuario is None:
+        raise ValueError('Informe o usuário das atualizações')
+    if descricao and status == 'aberto':
+        status = 'em_andamento'
+
+    if hasattr(protocolos, 'values_list'):
+        ids = list(protocolos.order_by().values_list('pk', flat=True))
+    else:
+        ids = list(dict.fromkeys(int(pk) for pk in protocolos))
+    resultado = ResultadoTransicao(status=status, selecionados=len(ids))
+
+    with transaction.atomic():
+        for inicio in range(0, len(ids), lote):
+            _alterar_lote(ids[inicio:inicio + lote], status, descricao, usuario, resultado)
+        if resultado.alterados or resultado.atualizacoes:
+            agendar_invalidacao_estatisticas()
+            agendar_avanco_versao()
+    return resultado
+
+
+def _alterar_lote(ids, status, descricao, usuario, resultado):
+    agora = timezone.now()
+    # Trava as linhas: um save concorrente não pode contar a mesma transição
+    atuais = list(
+        Protocolo.objects.select_for_update().filter(pk__in=ids)
+        .values_list('pk', 'status', 'tipo_problema_id', 'data_finalizacao')
+    )
+    mudancas = [linha for linha in atuais if linha[1] != status]
+    alterados = [pk for pk, _, _, _ in mudancas]
+    if alterados:
+        campos = {'status': status}
+        if status == 'finalizado':
+            campos['data_finalizacao'] = Case(
+                When(data_finalizacao__isnull=True, then=Value(agora)), default=F('data_finalizacao')
+            )
+        Protocolo.objects.filter(pk__in=alterados).update(**campos)
+        eventos = Counter(
+            evento_de_status(tipo_id, status, data_finalizacao or agora)
+            for _, _, tipo_id, data_finalizacao in mudancas
+        )
+        eventos.pop(None, None)
+        registrar_eventos(eventos)
+        resultado.alterados += len(alterados)
+
+    if descricao:
+        existentes = [pk for pk, _, _, _ in atuais]
+        Atualizacao.objects.bulk_create([
+            Atualizacao(protocolo_id=pk, descricao=descricao, usuario=usuario) for pk in existentes
+        ])
+        recalcular_atualizacoes(existentes)
+        # O texto das atualizações entra no documento de busca
+        indexar_protocolos(existentes)
+        registrar_alteracoes(existentes)
+        resultado.atualizacoes += len(existentes)
+    else:
+        registrar_alteracoes(alterados)
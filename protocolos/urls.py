@@ -1,12 +1,26 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("dashboard/", views.dashboard, name="dashboard"),
     path("novo_protocolo/", views.novo_protocolo, name="novo_protocolo"),
     path("adicionar_cliente/", views.adicionar_cliente, name="adicionar_cliente"),
+    path("clientes/autocomplete/", views.clientes_autocomplete, name="clientes_autocomplete"),
     path("adicionar_tipo_problema/", views.adicionar_tipo_problema, name="adicionar_tipo_problema"),
     path("filtrar_protocolos/", views.filtrar_protocolos, name="filtrar_protocolos"),
+    path("protocolos/status/", views.alterar_status_em_lote, name="alterar_status_em_lote"),
     path("busca/", views.busca_global, name="busca_global"),
+    path("tendencias/", views.tendencias, name="tendencias"),
+    path("sla/", views.sla, name="sla"),
     path("exportar_csv/", views.exportar_protocolos_csv, name="exportar_protocolos_csv"),
+    path("metricas/", views.metricas, name="metricas"),
+    path("tarefas/", views.tarefas, name="tarefas"),
+    path("tarefas/<int:pk>/", views.tarefa, name="tarefa"),
+    path("tarefas/<int:pk>/download/", views.baixar_tarefa, name="baixar_tarefa"),
+    path("tarefas/<int:pk>/repetir/", views.repetir_tarefa, name="repetir_tarefa"),
+    path("api/protocolos/", api.api_lista, {"recurso": "protocolos"}, name="api_protocolos"),
+    path("api/protocolos/alteracoes/", api.api_alteracoes, name="api_alteracoes"),
+    path("api/clientes/", api.api_lista, {"recurso": "clientes"}, name="api_clientes"),
+    path("api/atualizacoes/", api.api_lista, {"recurso": "atualizacoes"}, name="api_atualizacoes"),
+    path("api/tipos_problema/", api.api_lista, {"recurso": "tipos_problema"}, name="api_tipos_problema"),
 ]
\ No newline at end of file
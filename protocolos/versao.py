@@ -0,0 +1,81 @@
+"""
+Versão dos dados exibidos no dashboard e nas listagens.
+
+A sequência ``versao_dados`` avança depois do commit de qualquer alteração em
+protocolos, atualizações, clientes ou tipos de problema (uma vez por
+transação). O valor é um carimbo em milissegundos, sempre crescente, e serve
+ao mesmo tempo de ETag e de Last-Modified. Ler a versão custa uma consulta a
+uma única linha; com ela as páginas respondem 304 sem executar a view, e os
+fragmentos de template em cache são chaveados por ela.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Sequencia
+from .numeracao import criar_sequencia, valor_atual
+
+SEQUENCIA_VERSAO = 'versao_dados'
+
+
+def avancar_versao():
+    agora_ms = int(time.time() * 1000)
+    atualizados = Sequencia.objects.filter(nome=SEQUENCIA_VERSAO).update(
+        valor=Greatest(F('valor') + 1, Value(agora_ms))
+    )
+    if not atualizados:
+        criar_sequencia(SEQUENCIA_VERSAO, agora_ms)
+
+
+class AvancoVersao:
+    """Callback de ``on_commit`` que sabe se já foi executado"""
+
+    def __init__(self):
+        self.executado = False
+
+    def __call__(self):
+        self.executado = True
+        avancar_versao()
+
+
+def agendar_avanco_versao():
+    """Avança a versão depois do commit, uma única vez por transação"""
+    pendentes = transaction.get_connection().run_on_commit
+    if any(isinstance(funcao, AvancoVersao) and not funcao.executado for _, funcao, _ in pendentes):
+        return
+    transaction.on_commit(AvancoVersao())
+
+
+def versao_dados(request=None):
+    """Versão atual (0 se nada mudou desde a instalação), memorizada na requisição"""
+    if request is not None and hasattr(request, '_versao_dados'):
+        return request._versao_dados
+    versao = valor_atual(SEQUENCIA_VERSAO)
+    if request is not None:
+        request._versao_dados = versao
+    return versao
+
+
+def etag_pagina(request, *args, **kwargs):
+    """ETag de páginas que só dependem da versão dos dados, do usuário e do dia"""
+    partes = [
+        versao_dados(request),
+        request.user.pk,
+        # O token CSRF embutido na página muda quando o cookie muda (ex.: novo login)
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        timezone.localdate().isoformat(),
+    ]
+    return hashlib.md5(':'.join(map(str, partes)).encode()).hexdigest()
+
+
+def ultima_modificacao(request, *args, **kwargs):
+    """Última alteração dos dados, nunca antes do início do dia (há resumos por dia)"""
+    alterado = datetime.fromtimestamp(versao_dados(request) / 1000, tz=dt_timezone.utc)
+    inicio_do_dia = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+    return max(alterado, inicio_do_dia)
@@ -1,57 +1,109 @@
-from django.shortcuts import render, redirect
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
+from django.db import transaction
+from django.db.models import Q
 from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods, require_POST
 from django.contrib.admin.views.decorators import staff_member_required
-from .models import Protocolo, Cliente, Atualizacao, TipoProblema
+from .models import Protocolo, Cliente, Atualizacao, Tarefa, TipoProblema
 from .forms import ProtocoloForm, TipoProblemaForm
-import csv
-from django.http import HttpResponse
+from .filtros import aplicar_filtros, ler_filtros
+from .busca import buscar_arquivados, buscar_protocolos
+from .exportacao import linhas_csv, protocolos_para_exportacao
+from .estatisticas import (
+    contadores_status, inicio_em_meses, ler_periodo_tendencias, problemas_frequentes, resumo_recente, tendencia,
+)
+from .metricas import formatar_texto, metricas_agregadas
+from .paginacao import CursorInvalido, paginar_por_chave
+from . import sla as sla_analise
+from .assincrono import em_paralelo
+from .referencias import tipos_problema_ativos
+from .tarefas import TIPOS as TIPOS_TAREFA, TarefaInvalida, caminho_arquivo, enfileirar, repetir
+from .transicoes import alterar_status
+from .versao import etag_pagina, ultima_modificacao, versao_dados
+from django.utils import timezone
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 import json
 
+# Resultados exibidos por página/seção na busca global
+BUSCA_POR_PAGINA = 20
+
+# Clientes retornados por página no autocomplete
+AUTOCOMPLETE_POR_PAGINA = 20
+
+# Protocolos por página na listagem filtrada
+LISTAGEM_POR_PAGINA = 50
+
+# Tarefas mais recentes exibidas na lista de tarefas
+TAREFAS_POR_PAGINA = 50
+
+# Tempo (em segundos) dos fragmentos de template chaveados pela versão dos dados
+FRAGMENTOS_CACHE_TTL = 600
+
+
+def _contexto_fragmentos(request):
+    """Chave dos fragmentos em cache do template (ver versao.py)"""
+    return {
+        'versao_dados': versao_dados(request),
+        'hoje': timezone.localdate(),
+        'fragmentos_ttl': FRAGMENTOS_CACHE_TTL,
+    }
+
+
+# Sem mudança nos dados, o navegador recebe 304 e a view nem executa
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_pagina, last_modified_func=ultima_modificacao)
 def dashboard(request):
-    total_protocolos = Protocolo.objects.count()
-    protocolos_abertos = Protocolo.objects.filter(status="aberto").count()
-    protocolos_em_andamento = Protocolo.objects.filter(status="em_andamento").count()
-    protocolos_finalizados = Protocolo.objects.filter(status="finalizado").count()
-
-    ultimos_protocolos = Protocolo.objects.order_by("-data_criacao")[:5]
+    # Contadores por status, ranking de tipos de problema e resumo recente vêm do cache;
+    # os blocos que os exibem e os últimos protocolos são fragmentos em cache no template
+    # Mesma versão dos fragmentos e do ETag: os números nunca ficam atrás deles
+    versao = versao_dados(request)
+    contadores = contadores_status(versao)
 
-    # Estatísticas por tipo de problema (para o dashboard)
-    problemas_stats = TipoProblema.objects.annotate(
-        total_protocolos=Count('protocolos')
-    ).filter(ativo=True, total_protocolos__gt=0).order_by('-total_protocolos')[:5]
+    ultimos_protocolos = Protocolo.objects.select_related(
+        "tipo_problema", "usuario_criador"
+    ).order_by("-data_criacao")[:5]
 
     context = {
-        "total_protocolos": total_protocolos,
-        "protocolos_abertos": protocolos_abertos,
-        "protocolos_em_andamento": protocolos_em_andamento,
-        "protocolos_finalizados": protocolos_finalizados,
+        "total_protocolos": contadores["total"],
+        "protocolos_abertos": contadores["aberto"],
+        "protocolos_em_andamento": contadores["em_andamento"],
+        "protocolos_finalizados": contadores["finalizado"],
         "ultimos_protocolos": ultimos_protocolos,
-        "problemas_stats": problemas_stats,
+        "problemas_stats": problemas_frequentes(versao),
+        "ultimos_30_dias": resumo_recente(versao),
+        **_contexto_fragmentos(request),
     }
     return render(request, "protocolos/dashboard.html", context)
 
+
 @login_required
 def novo_protocolo(request):
     if request.method == "POST":
         form = ProtocoloForm(request.POST)
         if form.is_valid():
-            protocolo = form.save(commit=False)
-            protocolo.usuario_criador = request.user
-            protocolo.save()
-            form.save_m2m()  # Salva o relacionamento ManyToMany para clientes
-
-            # Adiciona a primeira atualização se houver
-            descricao_primeira_atualizacao = request.POST.get("primeira_atualizacao")
-            if descricao_primeira_atualizacao:
-                Atualizacao.objects.create(
-                    protocolo=protocolo,
-                    descricao=descricao_primeira_atualizacao,
-                    usuario=request.user
-                )
+            # Uma transação só: o protocolo aparece completo (clientes e primeira
+            # atualização) e com uma única versão no feed de alterações
+            with transaction.atomic():
+                protocolo = form.save(commit=False)
+                protocolo.usuario_criador = request.user
+                protocolo.save()
+                form.save_m2m()  # Salva o relacionamento ManyToMany para clientes
+
+                # Adiciona a primeira atualização se houver
+                descricao_primeira_atualizacao = request.POST.get("primeira_atualizacao")
+                if descricao_primeira_atualizacao:
+                    Atualizacao.objects.create(
+                        protocolo=protocolo,
+                        descricao=descricao_primeira_atualizacao,
+                        usuario=request.user
+                    )
             return redirect("dashboard")
     else:
         form = ProtocoloForm()
@@ -70,7 +122,7 @@ def novo_protocolo(request):
 
 @login_required
 @require_POST
-def adicionar_cliente(request):
+async def adicionar_cliente(request):
     """Endpoint AJAX para adicionar novo cliente"""
     try:
         nome = request.POST.get('nome', '').strip()
@@ -84,14 +136,14 @@ def adicionar_cliente(request):
             })
         
         # Verificar se o email já existe
-        if Cliente.objects.filter(email=email).exists():
+        if await Cliente.objects.filter(email=email).aexists():
             return JsonResponse({
                 'success': False,
                 'error': 'Já existe um cliente com este email'
             })
         
         # Criar o cliente
-        cliente = Cliente.objects.create(
+        cliente = await Cliente.objects.acreate(
             nome=nome,
             email=email,
             senha=senha  # Em produção, usar hash da senha
@@ -112,11 +164,44 @@ def adicionar_cliente(request):
             'error': f'Erro interno: {str(e)}'
         })
 
+@login_required
+async def clientes_autocomplete(request):
+    """Endpoint AJAX (formato select2) para buscar clientes ativos por prefixo"""
+    termo = request.GET.get('q', '').strip()
+    clientes = Cliente.objects.filter(ativo=True)
+    if termo:
+        # Prefixo do nome, de qualquer palavra do nome ou do email
+        clientes = clientes.filter(
+            Q(nome__istartswith=termo) |
+            Q(nome__icontains=f' {termo}') |
+            Q(email__istartswith=termo)
+        )
+
+    try:
+        itens, proximo_cursor = await sync_to_async(paginar_por_chave)(
+            clientes.values('id', 'nome', 'email'),
+            ['nome', 'id'],
+            cursor=request.GET.get('cursor'),
+            tamanho=AUTOCOMPLETE_POR_PAGINA,
+        )
+    except CursorInvalido:
+        return JsonResponse({'error': 'Cursor inválido'}, status=400)
+
+    return JsonResponse({
+        'results': [
+            {'id': cliente['id'], 'text': cliente['nome'], 'email': cliente['email']}
+            for cliente in itens
+        ],
+        'pagination': {'more': proximo_cursor is not None},
+        'cursor': proximo_cursor,
+    })
+
 @login_required
 @require_POST
-def adicionar_tipo_problema(request):
+async def adicionar_tipo_problema(request):
     """Endpoint AJAX para superusuários adicionarem novos tipos de problemas"""
-    if not request.user.is_superuser:
+    usuario = await request.auser()
+    if not usuario.is_superuser:
         return JsonResponse({
             'success': False,
             'error': 'Apenas superusuários podem adicionar tipos de problemas'
@@ -133,17 +218,17 @@ def adicionar_tipo_problema(request):
             })
         
         # Verificar se o nome já existe
-        if TipoProblema.objects.filter(nome=nome).exists():
+        if await TipoProblema.objects.filter(nome=nome).aexists():
             return JsonResponse({
                 'success': False,
                 'error': 'Já existe um tipo de problema com este nome'
             })
         
         # Criar o tipo de problema
-        tipo_problema = TipoProblema.objects.create(
+        tipo_problema = await TipoProblema.objects.acreate(
             nome=nome,
             descricao=descricao,
-            criado_por=request.user
+            criado_por=usuario
         )
         
         return JsonResponse({
@@ -162,101 +247,343 @@ def adicionar_tipo_problema(request):
         })
 
 @login_required
-def busca_global(request):
+async def busca_global(request):
     query = request.GET.get("q")
+    # ?arquivo=1 também procura nos protocolos arquivados
+    incluir_arquivo = request.GET.get("arquivo") == "1"
     resultados = []
+    busca_protocolos = None
     if query:
-        # Busca em Protocolos
-        protocolos_resultados = Protocolo.objects.filter(
-            Q(numero__icontains=query) |
-            Q(buic_dispositivo__icontains=query) |
-            Q(descricao_problema__icontains=query) |
-            Q(tipo_problema__nome__icontains=query) |
-            Q(clientes__nome__icontains=query) |
-            Q(clientes__email__icontains=query)
-        ).distinct()
-        resultados.append({
-            "tipo": "Protocolos",
-            "itens": protocolos_resultados
-        })
+        try:
+            pagina = int(request.GET.get("pagina", 1))
+        except ValueError:
+            pagina = 1
 
-        # Busca em Clientes
-        clientes_resultados = Cliente.objects.filter(
+        # Protocolos (índice de texto ranqueado e paginado), clientes e tipos de
+        # problemas são independentes: as três buscas rodam ao mesmo tempo
+        clientes = Cliente.objects.filter(
             Q(nome__icontains=query) |
             Q(email__icontains=query)
-        ).distinct()
+        ).order_by("nome")[:BUSCA_POR_PAGINA]
+        tipos_problemas = TipoProblema.objects.filter(
+            Q(nome__icontains=query) |
+            Q(descricao__icontains=query)
+        ).filter(ativo=True)[:BUSCA_POR_PAGINA]
+        buscas = [
+            partial(buscar_protocolos, query, pagina=pagina, por_pagina=BUSCA_POR_PAGINA),
+            partial(list, clientes),
+            partial(list, tipos_problemas),
+        ]
+        if incluir_arquivo:
+            buscas.append(partial(buscar_arquivados, query, limite=BUSCA_POR_PAGINA))
+        busca_protocolos, clientes_resultados, tipos_problemas_resultados, *arquivados = await em_paralelo(*buscas)
+
+        resultados.append({
+            "tipo": "Protocolos",
+            "itens": busca_protocolos.itens
+        })
         resultados.append({
             "tipo": "Clientes",
             "itens": clientes_resultados
         })
-
-        # Busca em Tipos de Problemas
-        tipos_problemas_resultados = TipoProblema.objects.filter(
-            Q(nome__icontains=query) |
-            Q(descricao__icontains=query)
-        ).filter(ativo=True).distinct()
         if tipos_problemas_resultados:
             resultados.append({
                 "tipo": "Tipos de Problemas",
                 "itens": tipos_problemas_resultados
             })
+        if incluir_arquivo:
+            resultados.append({
+                "tipo": "Protocolos Arquivados",
+                "itens": arquivados[0]
+            })
 
     context = {
         "query": query,
-        "resultados": resultados
+        "resultados": resultados,
+        "busca_protocolos": busca_protocolos,
+        "incluir_arquivo": incluir_arquivo,
     }
-    return render(request, "protocolos/busca_global.html", context)
+    return await sync_to_async(render)(request, "protocolos/busca_global.html", context)
 
 @login_required
 def exportar_protocolos_csv(request):
-    response = HttpResponse(content_type="text/csv")
+    """Exporta os protocolos em CSV via streaming, aceitando os mesmos filtros da listagem"""
+    protocolos = protocolos_para_exportacao(ler_filtros(request.GET))
+    response = StreamingHttpResponse(linhas_csv(protocolos), content_type="text/csv")
     response["Content-Disposition"] = "attachment; filename=\"protocolos.csv\""
-
-    writer = csv.writer(response)
-    writer.writerow([
-        "Número", "Status", "Tipo de Problema", "BUIC Dispositivo", 
-        "Descrição do Problema", "Usuário Criador", "Data de Criação", "Data de Finalização"
-    ])
-
-    protocolos = Protocolo.objects.all().order_by("numero")
-    for protocolo in protocolos:
-        writer.writerow([
-            protocolo.numero,
-            protocolo.get_status_display(),
-            protocolo.tipo_problema.nome,
-            protocolo.buic_dispositivo,
-            protocolo.descricao_problema,
-            protocolo.usuario_criador.username,
-            protocolo.data_criacao.strftime("%d/%m/%Y %H:%M"),
-            protocolo.data_finalizacao.strftime("%d/%m/%Y %H:%M") if protocolo.data_finalizacao else "",
-        ])
-
     return response
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_pagina, last_modified_func=ultima_modificacao)
 def filtrar_protocolos(request):
-    """View para filtrar protocolos por tipo de problema"""
-    tipo_problema_id = request.GET.get('tipo_problema')
-    status = request.GET.get('status')
+    """View para filtrar protocolos por tipo de problema, status e data, paginada por cursor"""
+    filtros = ler_filtros(request.GET)
     
-    protocolos = Protocolo.objects.all()
+    protocolos = aplicar_filtros(Protocolo.objects.all(), filtros).select_related(
+        'tipo_problema', 'usuario_criador'
+    )
     
-    if tipo_problema_id:
-        protocolos = protocolos.filter(tipo_problema_id=tipo_problema_id)
-    
-    if status:
-        protocolos = protocolos.filter(status=status)
-    
-    protocolos = protocolos.order_by('-data_criacao')
+    try:
+        protocolos, proximo_cursor = paginar_por_chave(
+            protocolos,
+            ['-data_criacao', '-id'],
+            cursor=request.GET.get('cursor'),
+            tamanho=LISTAGEM_POR_PAGINA,
+        )
+    except CursorInvalido:
+        return HttpResponseBadRequest('Cursor inválido')
     
     # Obter todos os tipos de problemas para o filtro
-    tipos_problemas = TipoProblema.objects.filter(ativo=True).order_by('nome')
+    tipos_problemas = tipos_problema_ativos()
+    
+    # Filtros atuais (sem o cursor), para montar os links de paginação e exportação
+    parametros = request.GET.copy()
+    parametros.pop('cursor', None)
     
     context = {
         'protocolos': protocolos,
+        'proximo_cursor': proximo_cursor,
+        'pagina_inicial': not request.GET.get('cursor'),
+        'parametros_filtro': parametros.urlencode(),
         'tipos_problemas': tipos_problemas,
-        'tipo_problema_selecionado': int(tipo_problema_id) if tipo_problema_id else None,
-        'status_selecionado': status,
+        'status_choices': Protocolo.STATUS_CHOICES,
+        'tipo_problema_selecionado': filtros['tipo_problema'],
+        'status_selecionado': filtros['status'],
+        'data_inicio': filtros['data_inicio'],
+        'data_fim': filtros['data_fim'],
     }
     
-    return render(request, 'protocolos/filtrar_protocolos.html', context)
\ No newline at end of file
+    return render(request, 'protocolos/filtrar_protocolos.html', context)
+
+
+@login_required
+@require_POST
+def alterar_status_em_lote(request):
+    """
+    Endpoint AJAX para mudar o status de vários protocolos de uma vez.
+
+    Aceita JSON (``{"ids": [...], "status": "...", "descricao": "..."}``), que
+    não tem o limite de campos de um formulário, ou os mesmos campos como
+    formulário (``ids`` repetido).
+    """
+    if not request.user.has_perm('protocolos.change_protocolo'):
+        return JsonResponse({'success': False, 'error': 'Sem permissão para alterar protocolos'}, status=403)
+
+    try:
+        if request.content_type == 'application/json':
+            dados = json.loads(request.body or b'{}')
+            ids = [int(pk) for pk in dados.get('ids', [])]
+        else:
+            dados = request.POST
+            ids = [int(pk) for pk in request.POST.getlist('ids')]
+        resultado = alterar_status(
+            ids, dados.get('status'), descricao=dados.get('descricao', ''), usuario=request.user
+        )
+    except (ValueError, TypeError, AttributeError) as erro:
+        return JsonResponse({'success': False, 'error': str(erro)}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'status': resultado.status,
+        'selecionados': resultado.selecionados,
+        'alterados': resultado.alterados,
+        'atualizacoes': resultado.atualizacoes,
+    })
+
+
+@staff_member_required
+def metricas(request):
+    # Formato de texto do Prometheus; ?formato=json devolve os agregados crus
+    views = metricas_agregadas()
+    if request.GET.get('formato') == 'json':
+        return JsonResponse(views)
+    return HttpResponse(formatar_texto(views), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@login_required
+async def tendencias(request):
+    """Abertos, em andamento e finalizados por período, lidos das estatísticas diárias"""
+    agrupamento, meses = ler_periodo_tendencias(request.GET)
+    tipo_problema = ler_filtros(request.GET)['tipo_problema']
+
+    fim = timezone.localdate()
+    inicio = inicio_em_meses(fim, meses)
+    serie = await sync_to_async(tendencia)(inicio, fim, agrupamento=agrupamento, tipo_problema=tipo_problema)
+
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({
+            'agrupamento': agrupamento,
+            'inicio': inicio.isoformat(),
+            'fim': fim.isoformat(),
+            'tipo_problema': tipo_problema,
+            'serie': [dict(ponto, periodo=ponto['periodo'].isoformat()) for ponto in serie],
+        })
+
+    context = {
+        'serie': serie,
+        'agrupamento': agrupamento,
+        'agrupamentos': [('dia', 'Dia'), ('semana', 'Semana'), ('mes', 'Mês')],
+        'meses': meses,
+        'tipos_problemas': await sync_to_async(tipos_problema_ativos)(),
+        'tipo_problema_selecionado': tipo_problema,
+        'totais': {evento: sum(ponto[evento] for ponto in serie) for evento, _ in Protocolo.STATUS_CHOICES},
+    }
+    return await sync_to_async(render)(request, 'protocolos/tendencias.html', context)
+
+
+@login_required
+async def sla(request):
+    """Tempos de resolução e de primeira atualização por tipo, criador ou mês"""
+    agrupamento = request.GET.get('agrupamento')
+    if agrupamento not in sla_analise.AGRUPAMENTOS:
+        agrupamento = 'tipo_problema'
+    filtros = ler_filtros(request.GET)
+    filtros['status'] = None  # a resolução só considera finalizados; o status não se aplica
+
+    combinacoes = [(medida, chave) for medida in sla_analise.MEDIDAS for chave in (None, agrupamento)]
+    versao = await sync_to_async(versao_dados)(request)
+    calculados = await em_paralelo(*(
+        partial(sla_analise.sla, medida, chave, filtros, versao) for medida, chave in combinacoes
+    ))
+    resultados = {medida: {} for medida in sla_analise.MEDIDAS}
+    for (medida, chave), linhas in zip(combinacoes, calculados):
+        resultados[medida]['grupos' if chave else 'geral'] = linhas
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({
+            'agrupamento': agrupamento,
+            'unidade': 'segundos',
+            'filtros': {chave: str(valor) if valor else None for chave, valor in filtros.items()},
+            'resultados': resultados,
+        })
+
+    # Na página os tempos aparecem em horas
+    def em_horas(linhas):
+        return [
+            dict(linha, **{chave: linha[chave] / 3600 for chave in ('media', *sla_analise.PERCENTIS)})
+            for linha in linhas
+        ]
+
+    context = {
+        'agrupamento': agrupamento,
+        'agrupamentos': [('tipo_problema', 'Tipo de Problema'), ('usuario_criador', 'Criador'), ('mes', 'Mês de Criação')],
+        'tipos_problemas': await sync_to_async(tipos_problema_ativos)(),
+        'tipo_problema_selecionado': filtros['tipo_problema'],
+        'data_inicio': filtros['data_inicio'],
+        'data_fim': filtros['data_fim'],
+        'medidas': [
+            ('Tempo até a finalização', em_horas(resultados['resolucao']['geral']), em_horas(resultados['resolucao']['grupos'])),
+            ('Tempo até a primeira atualização', em_horas(resultados['primeira_atualizacao']['geral']), em_horas(resultados['primeira_atualizacao']['grupos'])),
+        ],
+    }
+    return await sync_to_async(render)(request, 'protocolos/sla.html', context)
+
+
+def _tarefas_visiveis(usuario):
+    # Cada usuário vê as próprias tarefas; staff vê todas
+    tarefas = Tarefa.objects.select_related('usuario')
+    return tarefas if usuario.is_staff else tarefas.filter(usuario=usuario)
+
+
+def _tarefa_json(tarefa):
+    return {
+        'id': tarefa.pk,
+        'tipo': tarefa.tipo,
+        'status': tarefa.status,
+        'parametros': tarefa.parametros,
+        'tentativas': tarefa.tentativas,
+        'criada_em': tarefa.criada_em.isoformat(),
+        'concluida_em': tarefa.concluida_em.isoformat() if tarefa.concluida_em else None,
+        'erro': _resumo_erro(tarefa.erro),
+        'url': reverse('tarefa', args=[tarefa.pk]),
+        'download': reverse('baixar_tarefa', args=[tarefa.pk]) if tarefa.status == 'concluida' else None,
+    }
+
+
+def _rotulo_tarefa(tarefa):
+    tipo = TIPOS_TAREFA.get(tarefa.tipo)
+    return tipo.rotulo if tipo else tarefa.tipo
+
+
+def _resumo_erro(erro):
+    # O traceback completo fica no admin; aqui só a última linha
+    linhas = (erro or '').strip().splitlines()
+    return linhas[-1] if linhas else ''
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def tarefas(request):
+    """
+    GET lista as tarefas em segundo plano; POST enfileira uma nova.
+
+    O POST aceita JSON (``{"tipo": "exportar_csv", "status": ...}``), que
+    responde 202 com a tarefa, ou formulário, que redireciona para a página da
+    tarefa. Os demais campos são os filtros do tipo (ver ``tarefas.TIPOS``).
+    """
+    if request.method == 'POST':
+        como_json = request.content_type == 'application/json'
+        try:
+            if como_json:
+                try:
+                    dados = json.loads(request.body or b'{}')
+                except ValueError:
+                    raise TarefaInvalida('JSON inválido')
+                if not isinstance(dados, dict):
+                    raise TarefaInvalida('O corpo deve ser um objeto JSON')
+            else:
+                dados = request.POST
+            tarefa = enfileirar(dados.get('tipo'), dados, usuario=request.user)
+        except TarefaInvalida as erro:
+            if como_json:
+                return JsonResponse({'success': False, 'error': str(erro)}, status=400)
+            return HttpResponseBadRequest(str(erro))
+        if como_json:
+            return JsonResponse({'success': True, **_tarefa_json(tarefa)}, status=202)
+        return redirect('tarefa', pk=tarefa.pk)
+
+    lista = list(_tarefas_visiveis(request.user)[:TAREFAS_POR_PAGINA])
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({'results': [_tarefa_json(tarefa) for tarefa in lista]})
+    for tarefa in lista:
+        tarefa.rotulo = _rotulo_tarefa(tarefa)
+    return render(request, 'protocolos/tarefas.html', {
+        'tarefas': lista,
+        'em_andamento': any(tarefa.status in ('pendente', 'executando') for tarefa in lista),
+    })
+
+
+@login_required
+def tarefa(request, pk):
+    """Situação de uma tarefa (``?formato=json`` para acompanhar por polling)"""
+    tarefa = get_object_or_404(_tarefas_visiveis(request.user), pk=pk)
+    if request.GET.get('formato') == 'json':
+        return JsonResponse(_tarefa_json(tarefa))
+    return render(request, 'protocolos/tarefa.html', {
+        'tarefa': tarefa,
+        'rotulo': _rotulo_tarefa(tarefa),
+        'erro': _resumo_erro(tarefa.erro),
+    })
+
+
+@login_required
+def baixar_tarefa(request, pk):
+    tarefa = get_object_or_404(_tarefas_visiveis(request.user), pk=pk, status='concluida')
+    caminho = caminho_arquivo(tarefa)
+    if caminho is None or not caminho.is_file():
+        raise Http404('Arquivo da tarefa não encontrado')
+    tipo = TIPOS_TAREFA.get(tarefa.tipo)
+    return FileResponse(
+        open(caminho, 'rb'),
+        as_attachment=True,
+        filename=caminho.name,
+        content_type=tipo.content_type if tipo else 'application/octet-stream',
+    )
+
+
+@login_required
+@require_POST
+def repetir_tarefa(request, pk):
+    tarefa = get_object_or_404(_tarefas_visiveis(request.user), pk=pk)
+    repetir(Tarefa.objects.filter(pk=tarefa.pk))
+    return redirect('tarefa', pk=tarefa.pk)